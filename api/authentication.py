@@ -0,0 +1,110 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from .services import metrics
+
+
+class TokenCache:
+    """
+    Bounded, thread-safe LRU of token key -> (user, token) with a TTL.
+    Each process has its own cache, so TOKEN_CACHE_TTL bounds how long another
+    worker may keep honouring a token after it is revoked.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] < time.monotonic():
+                if entry is not None:
+                    self._pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            user, token, _ = entry
+        # Hand out copies so one request can't mutate another's user.
+        return copy.copy(user), token
+
+    def set(self, key, user, token):
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (user, token, time.monotonic() + self.ttl)
+            self._keys_by_user.setdefault(user.pk, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+    def _pop(self, key):
+        user, _, _ = self._entries.pop(key)
+        keys = self._keys_by_user.get(user.pk)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[user.pk]
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_MAXSIZE, settings.TOKEN_CACHE_TTL)
+
+
+@metrics.register_collector
+def token_cache_metrics():
+    stats = token_cache.stats()
+    return [
+        ('token_cache_size', 'gauge', 'Entries in the token cache.', stats['size']),
+        ('token_cache_hits_total', 'counter', 'Token cache hits.', stats['hits']),
+        ('token_cache_misses_total', 'counter', 'Token cache misses.', stats['misses']),
+        ('token_cache_evictions_total', 'counter', 'Token cache LRU evictions.', stats['evictions']),
+        ('token_cache_hit_ratio', 'gauge', 'Token cache hits over lookups.', stats['hit_ratio']),
+    ]
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that skips the Token -> User query for known keys."""
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user, token)
+        return user, token
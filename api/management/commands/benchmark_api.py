@@ -0,0 +1,184 @@
+import json
+import platform
+import statistics
+import time
+from io import StringIO
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.authentication import token_cache
+from api.middleware import QueryRecorder
+from api.models import Subtask
+from api.services import leaderboard, response_cache
+
+User = get_user_model()
+
+# generate_data arguments per scale; "current" benchmarks the data already
+# in the database without seeding anything.
+SCALES = {
+    'small': {'users': 20, 'communities': 2, 'members': 10},
+    'medium': {'users': 200, 'communities': 20, 'members': 30},
+    'large': {'users': 2000, 'communities': 100, 'members': 50},
+    'current': None,
+}
+
+# Latency may grow by this fraction of the baseline plus this many ms before
+# --baseline reports a regression; query counts may not grow at all.
+DEFAULT_TOLERANCE = 0.25
+NOISE_FLOOR_MS = 2.0
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the hot API endpoints at one or more data scales and prints "
+        "latency percentiles, throughput and query counts as JSON. Seeded data "
+        "is rolled back afterwards. With --baseline, exits non-zero if an "
+        "endpoint got slower or issues more queries than in the baseline run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', action='append', dest='scales', choices=sorted(SCALES),
+                            help="Scale(s) to run (repeatable, default: small).")
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+        parser.add_argument('--baseline', help="JSON report of a previous run to compare against.")
+        parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                            help="Allowed relative p95 latency growth in --baseline mode.")
+
+    def handle(self, *args, **options):
+        report = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'seed': options['seed'],
+                'iterations': options['iterations'],
+                'database': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+            },
+            'results': {},
+        }
+        for scale in options['scales'] or ['small']:
+            report['results'][scale] = self._run_scale(scale, options)
+
+        payload = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(payload + '\n')
+        else:
+            self.stdout.write(payload)
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            regressions = self._compare(baseline, report, options['tolerance'])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n" + '\n'.join(regressions))
+            self.stderr.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    def _run_scale(self, scale, options):
+        with transaction.atomic():
+            if SCALES[scale] is not None:
+                call_command(
+                    'generate_data', prefix=f'bench_{scale}', seed=options['seed'], stdout=StringIO(),
+                    **SCALES[scale],
+                )
+                users = User.objects.filter(username__startswith=f'bench_{scale}_')
+            else:
+                users = User.objects.all()
+            user = users.annotate(n=Count('communities')).order_by('-n', 'pk').first()
+            if user is None:
+                raise CommandError("No users to benchmark with.")
+            token, _ = Token.objects.get_or_create(user=user)
+            try:
+                results = self._run_endpoints(user, token, options)
+            finally:
+                transaction.set_rollback(True)
+        # The rolled-back rows may have reached the caches.
+        token_cache.invalidate(token.key)
+        leaderboard.invalidate()
+        response_cache.invalidate_all()
+        return results
+
+    def _run_endpoints(self, user, token, options):
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}', HTTP_HOST='localhost')
+        subtask = Subtask.objects.filter(task__project__user=user).order_by('pk').first()
+        toggles = iter(range(10 ** 9))
+
+        def toggle_subtask():
+            return client.patch(
+                f'/api/subtasks/{subtask.pk}/', {'completed': next(toggles) % 2 == 0},
+                content_type='application/json',
+            )
+
+        endpoints = {
+            'projects': lambda: client.get('/api/projects/'),
+            'leaderboard': lambda: client.get('/api/projects/community/'),
+            'focus_reports': lambda: client.get('/api/focus-sessions/reports/'),
+            'communities': lambda: client.get('/api/communities/'),
+            'unread_count': lambda: client.get('/api/notifications/unread_count/'),
+        }
+        if subtask is not None:
+            endpoints['subtask_toggle'] = toggle_subtask
+        return {name: self._measure(request, options) for name, request in endpoints.items()}
+
+    def _measure(self, request, options):
+        for _ in range(options['warmup']):
+            request()
+        latencies, queries = [], []
+        started = time.perf_counter()
+        for _ in range(options['iterations']):
+            recorder = QueryRecorder(keep=0)
+            start = time.perf_counter()
+            with connection.execute_wrapper(recorder):
+                response = request()
+            latencies.append((time.perf_counter() - start) * 1000)
+            queries.append(recorder.count)
+            if response.status_code >= 400:
+                raise CommandError(f"{response.request['PATH_INFO']} answered {response.status_code}.")
+        elapsed = time.perf_counter() - started
+        return {
+            'p50_ms': round(_percentile(latencies, 50), 3),
+            'p90_ms': round(_percentile(latencies, 90), 3),
+            'p95_ms': round(_percentile(latencies, 95), 3),
+            'p99_ms': round(_percentile(latencies, 99), 3),
+            'mean_ms': round(statistics.fmean(latencies), 3),
+            'max_ms': round(max(latencies), 3),
+            'throughput_rps': round(options['iterations'] / elapsed, 1),
+            'queries_mean': round(statistics.fmean(queries), 2),
+            'queries_max': max(queries),
+        }
+
+    def _compare(self, baseline, report, tolerance):
+        regressions = []
+        for scale, endpoints in report['results'].items():
+            for name, current in endpoints.items():
+                previous = baseline.get('results', {}).get(scale, {}).get(name)
+                if previous is None:
+                    continue
+                allowed_ms = previous['p95_ms'] * (1 + tolerance) + NOISE_FLOOR_MS
+                if current['p95_ms'] > allowed_ms:
+                    regressions.append(
+                        f"{scale}/{name}: p95 {current['p95_ms']} ms > {allowed_ms:.3f} ms "
+                        f"(baseline {previous['p95_ms']} ms)"
+                    )
+                if current['queries_max'] > previous['queries_max']:
+                    regressions.append(
+                        f"{scale}/{name}: {current['queries_max']} queries > {previous['queries_max']} (baseline)"
+                    )
+        return regressions
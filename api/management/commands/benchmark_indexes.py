@@ -0,0 +1,105 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+
+from api.models import (
+    Project, Task, Subtask, FocusSession, Note, SharedProject, SharedTask, SharedNote, Notification,
+)
+
+User = get_user_model()
+
+# Models whose Meta.indexes / partial constraints are measured.
+INDEXED_MODELS = (Project, Task, Subtask, FocusSession, Note, SharedProject, SharedTask, SharedNote, Notification)
+
+
+def access_paths(user, page_size):
+    """The list queries the viewsets run, keyed by a short label."""
+    shared_project = SharedProject.objects.filter(community__members=user).order_by('pk').first()
+    paths = {
+        'projects': Project.objects.filter(user=user).order_by('-updated_at', '-id'),
+        'tasks': Task.objects.filter(project__user=user).order_by('created_at', 'id'),
+        'subtasks': Subtask.objects.filter(task__project__user=user).order_by('created_at', 'id'),
+        'focus_sessions': FocusSession.objects.filter(user=user).order_by('-start_time', '-id'),
+        'notes': Note.objects.filter(user=user).order_by('-updated_at', '-id'),
+        'notifications': Notification.objects.filter(recipient=user).order_by('-created_at', '-id'),
+        'pending_notifications': Notification.objects.filter(recipient=user, status='pending').order_by('-created_at'),
+        'shared_projects': SharedProject.objects.filter(community__members=user).order_by('-updated_at', '-id'),
+    }
+    if shared_project is not None:
+        paths['shared_tasks'] = SharedTask.objects.filter(project=shared_project).order_by('created_at', 'id')
+        paths['shared_notes'] = SharedNote.objects.filter(project=shared_project).order_by('-updated_at', '-id')
+    return {label: queryset[:page_size] for label, queryset in paths.items()}
+
+
+class Command(BaseCommand):
+    help = (
+        "Shows the query plan and latency of every viewset list query with and "
+        "without the composite/partial indexes. The indexes are dropped inside "
+        "a transaction that is rolled back, so the schema is left untouched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="User to query as (default: the one with most projects).")
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--no-plans', action='store_true', help="Only print timings.")
+
+    def handle(self, *args, **options):
+        user = self._user(options['user'])
+        paths = access_paths(user, options['page_size'])
+        self.stdout.write(f"Benchmarking as user #{user.pk} ({options['repeat']} runs per query)")
+
+        with_indexes = self._measure(paths, 'with indexes', options)
+        # A fresh connection, so no statement compiled against the indexes
+        # (sqlite3 caches them per connection) is reused after the drop.
+        if not connection.in_atomic_block:
+            connection.close()
+        with transaction.atomic():
+            self._drop_indexes()
+            without_indexes = self._measure(paths, 'without indexes', options)
+            transaction.set_rollback(True)
+
+        self.stdout.write('')
+        self.stdout.write(f"{'query':<24}{'indexed ms':>12}{'unindexed ms':>14}{'speedup':>10}")
+        for label in paths:
+            fast, slow = with_indexes[label], without_indexes[label]
+            speedup = slow / fast if fast else float('inf')
+            self.stdout.write(f"{label:<24}{fast:>12.3f}{slow:>14.3f}{speedup:>9.1f}x")
+
+    def _user(self, user_id):
+        if user_id is not None:
+            try:
+                return User.objects.get(pk=user_id)
+            except User.DoesNotExist:
+                raise CommandError(f"User {user_id} does not exist.")
+        user = User.objects.annotate(n=Count('projects')).order_by('-n', 'pk').first()
+        if user is None:
+            raise CommandError("No users to benchmark with; seed the database first.")
+        return user
+
+    def _drop_indexes(self):
+        # Plain DROP INDEX rather than the schema editor, which SQLite won't
+        # run inside a transaction. Partial unique constraints are indexes too.
+        names = []
+        for model in INDEXED_MODELS:
+            names += [index.name for index in model._meta.indexes]
+            names += [c.name for c in model._meta.constraints if getattr(c, 'condition', None) is not None]
+        with connection.cursor() as cursor:
+            for name in names:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+
+    def _measure(self, paths, state, options):
+        timings = {}
+        for label, queryset in paths.items():
+            if not options['no_plans']:
+                self.stdout.write(self.style.MIGRATE_HEADING(f"\n{label} ({state})"))
+                self.stdout.write(queryset.explain())
+            list(queryset)  # warm up
+            start = time.perf_counter()
+            for _ in range(options['repeat']):
+                list(queryset.all())
+            timings[label] = (time.perf_counter() - start) * 1000 / options['repeat']
+        return timings
@@ -0,0 +1,274 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import (
+    Profile, Project, Task, Subtask, FocusSession, Note, Community, SharedProject, SharedTask, SharedNote,
+    Notification, UnreadCounter,
+)
+from api.services import focus, leaderboard, search, unread
+from api.services.chunks import chunked
+from api.services.progress import mark_counters_dirty
+
+User = get_user_model()
+
+WORDS = (
+    "diseño web api móvil backend datos informe revisión sprint cliente pruebas despliegue "
+    "tesis examen lectura resumen capítulo práctica volcán energía foco hábito rutina meta "
+    "reunión idea borrador presupuesto marketing contenido video podcast estudio inglés "
+    "matemáticas historia química física ejercicio lista compras viaje plan semana"
+).split()
+FOCUS_TAGS = ('study', 'work', 'reading', 'coding', 'exercise', 'writing')
+NOTE_TYPES = ('Personal', 'Estudio', 'Trabajo', 'Ideas')
+
+
+@contextmanager
+def _historical_timestamps(*models):
+    """
+    Lets bulk_create keep the created_at/updated_at/start_time values we set
+    instead of stamping every row with now().
+    """
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a deterministic synthetic dataset (users, projects, tasks, "
+        "focus sessions, notes, communities, shared items, notifications) with "
+        "batched bulk_create, then rebuilds the derived data: subtask counters, "
+        "progress, focus rollups, unread counters and the search index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--projects', type=int, default=5, help="Projects per user.")
+        parser.add_argument('--tasks', type=int, default=5, help="Tasks per project.")
+        parser.add_argument('--subtasks', type=int, default=3, help="Subtasks per task (on average).")
+        parser.add_argument('--sessions', type=int, default=50, help="Focus sessions per user.")
+        parser.add_argument('--notes', type=int, default=10, help="Notes per user.")
+        parser.add_argument('--communities', type=int, default=10)
+        parser.add_argument('--members', type=int, default=20, help="Members per community.")
+        parser.add_argument('--shared-projects', type=int, default=3, help="Shared projects per community.")
+        parser.add_argument('--shared-tasks', type=int, default=5, help="Tasks per shared project.")
+        parser.add_argument('--shared-notes', type=int, default=3, help="Notes per shared project.")
+        parser.add_argument('--notifications', type=int, default=5, help="Notifications per community member.")
+        parser.add_argument('--days', type=int, default=90, help="Spread timestamps over this many past days.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='synthetic', help="Username prefix for the generated users.")
+        parser.add_argument('--password', default='password', help="Password shared by all generated users.")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Rows per bulk_create.")
+        parser.add_argument('--users-per-chunk', type=int, default=100,
+                            help="Users whose rows are written per transaction.")
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=f"{options['prefix']}_").exists():
+            raise CommandError(f"Users prefixed '{options['prefix']}_' already exist; pick another --prefix.")
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        self.batch_size = options['batch_size']
+        self.totals = {}
+
+        # One hash for everyone: hashing per user would dominate the run.
+        password = make_password(options['password'])
+        user_ids = []
+        with _historical_timestamps(Project, Task, Subtask, FocusSession, Note):
+            for start in range(0, options['users'], options['users_per_chunk']):
+                count = min(options['users_per_chunk'], options['users'] - start)
+                with transaction.atomic():
+                    user_ids += self._users_chunk(start, count, password)
+                self.stdout.write(f"  {len(user_ids)}/{options['users']} users")
+
+        with _historical_timestamps(Community, SharedProject, SharedTask, SharedNote, Notification):
+            for start in range(0, options['communities'], 10):
+                with transaction.atomic():
+                    self._communities_chunk(start, min(10, options['communities'] - start), user_ids)
+
+        for chunk in chunked(user_ids):
+            unread.reconcile(chunk)
+        leaderboard.invalidate()
+
+        summary = ', '.join(f"{count} {label}" for label, count in self.totals.items())
+        self.stdout.write(self.style.SUCCESS(f"Generated {summary}."))
+
+    # Helpers
+
+    def _bulk(self, model, objs, label=None):
+        created = model.objects.bulk_create(objs, batch_size=self.batch_size)
+        label = label or model._meta.verbose_name_plural
+        self.totals[label] = self.totals.get(label, 0) + len(created)
+        return created
+
+    def _when(self, after=None):
+        """A random moment in the last --days days (and after `after`)."""
+        earliest = after or self.now - timedelta(days=self.options['days'])
+        span = (self.now - earliest).total_seconds()
+        return earliest + timedelta(seconds=self.rng.random() * span)
+
+    def _title(self, words=3):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(words)).capitalize()
+
+    def _text(self, sentences=3):
+        return ' '.join(f"{self._title(self.rng.randint(6, 14))}." for _ in range(sentences))
+
+    # Per-user data
+
+    def _users_chunk(self, start, count, password):
+        prefix, rng = self.options['prefix'], self.rng
+        users = self._bulk(User, [
+            User(username=f"{prefix}_{i:07d}", email=f"{prefix}_{i:07d}@example.com", password=password)
+            for i in range(start, start + count)
+        ], 'users')
+        # bulk_create skips the User signals that create these.
+        self._bulk(Profile, [
+            Profile(user=user, display_name=f"{self._title(1)} {user.username[-4:]}", avatar_index=rng.randint(0, 11))
+            for user in users
+        ])
+        UnreadCounter.objects.bulk_create([UnreadCounter(user=user) for user in users], batch_size=self.batch_size)
+
+        projects = []
+        for user in users:
+            for _ in range(self.options['projects']):
+                created = self._when()
+                projects.append(Project(
+                    user=user, name=self._title(), description=self._text(1),
+                    created_at=created, updated_at=self._when(created),
+                ))
+        projects = self._bulk(Project, projects)
+
+        tasks = []
+        for project in projects:
+            for _ in range(self.options['tasks']):
+                created = self._when(project.created_at)
+                tasks.append(Task(
+                    project=project, title=self._title(), completed=rng.random() < 0.3,
+                    created_at=created, updated_at=self._when(created),
+                ))
+        tasks = self._bulk(Task, tasks)
+
+        subtasks = []
+        for task in tasks:
+            for _ in range(rng.randint(0, 2 * self.options['subtasks'])):
+                created = self._when(task.created_at)
+                subtasks.append(Subtask(
+                    task=task, title=self._title(), completed=rng.random() < 0.5,
+                    created_at=created, updated_at=self._when(created),
+                ))
+        self._bulk(Subtask, subtasks)
+
+        projects_by_user = {}
+        for project in projects:
+            projects_by_user.setdefault(project.user_id, []).append(project)
+        sessions = []
+        for user in users:
+            user_projects = projects_by_user.get(user.pk, [])
+            for _ in range(self.options['sessions']):
+                started = self._when()
+                duration = round(rng.uniform(5, 120), 1)
+                sessions.append(FocusSession(
+                    user=user, project=rng.choice(user_projects + [None]) if user_projects else None,
+                    tag=rng.choice(FOCUS_TAGS), start_time=started, updated_at=started,
+                    end_time=started + timedelta(minutes=duration), duration_minutes=duration, is_completed=True,
+                ))
+        self._bulk(FocusSession, sessions)
+
+        notes = []
+        for user in users:
+            for _ in range(self.options['notes']):
+                created = self._when()
+                notes.append(Note(
+                    user=user, title=self._title(), content=self._text(), note_type=rng.choice(NOTE_TYPES),
+                    created_at=created, updated_at=self._when(created),
+                ))
+        search.index_notes(self._bulk(Note, notes))
+
+        # Derived data, computed by the same code that maintains it live.
+        for chunk in chunked([task.pk for task in tasks]):
+            mark_counters_dirty(chunk)
+        user_ids = [user.pk for user in users]
+        focus.rebuild_rollups(user_ids, batch_size=self.batch_size)
+        return user_ids
+
+    # Communities and everything shared in them
+
+    def _communities_chunk(self, start, count, user_ids):
+        if not user_ids:
+            return
+        rng = self.rng
+        members_by_index = []
+        communities = []
+        for i in range(start, start + count):
+            members = rng.sample(user_ids, min(self.options['members'], len(user_ids)))
+            members_by_index.append(members)
+            created = self._when()
+            communities.append(Community(
+                owner_id=members[0], name=f"Comunidad {self._title(2)} {i}", description=self._text(1),
+                created_at=created, updated_at=created,
+            ))
+        communities = self._bulk(Community, communities, 'communities')
+        Membership = Community.members.through
+        Membership.objects.bulk_create([
+            Membership(community_id=community.pk, user_id=user_id)
+            for community, members in zip(communities, members_by_index) for user_id in members
+        ], batch_size=self.batch_size)
+
+        shared_projects, owners = [], []
+        for community, members in zip(communities, members_by_index):
+            for _ in range(self.options['shared_projects']):
+                created = self._when(community.created_at)
+                shared_projects.append(SharedProject(
+                    community=community, created_by_id=rng.choice(members), name=self._title(),
+                    description=self._text(1), created_at=created, updated_at=self._when(created),
+                ))
+                owners.append(members)
+        shared_projects = self._bulk(SharedProject, shared_projects)
+
+        shared_tasks, shared_notes = [], []
+        for project, members in zip(shared_projects, owners):
+            for _ in range(self.options['shared_tasks']):
+                created = self._when(project.created_at)
+                shared_tasks.append(SharedTask(
+                    project=project, created_by_id=rng.choice(members), title=self._title(),
+                    completed=rng.random() < 0.4, created_at=created, updated_at=self._when(created),
+                ))
+            for _ in range(self.options['shared_notes']):
+                created = self._when(project.created_at)
+                shared_notes.append(SharedNote(
+                    project=project, created_by_id=rng.choice(members), title=self._title(),
+                    content=self._text(), created_at=created, updated_at=self._when(created),
+                ))
+        self._bulk(SharedTask, shared_tasks)
+        search.index_shared_notes(self._bulk(SharedNote, shared_notes))
+
+        notifications = []
+        for community, members in zip(communities, members_by_index):
+            for recipient_id in members:
+                for _ in range(self.options['notifications']):
+                    actor_id = rng.choice(members)
+                    notification_type = rng.choice(('new_project', 'new_note'))
+                    created = self._when(community.created_at)
+                    notifications.append(Notification(
+                        recipient_id=recipient_id, actor_id=actor_id, community=community,
+                        notification_type=notification_type,
+                        status='pending' if rng.random() < 0.3 else 'read',
+                        message=f"{self._title(2)} en {community.name}",
+                        created_at=created, updated_at=created,
+                    ))
+        self._bulk(Notification, notifications)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.services.focus import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuilds FocusDailyRollup rows from the raw focus sessions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help="Only rebuild this user's rollups (repeatable).")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = rebuild_rollups(options['user_ids'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} focus rollup row(s)."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Task
+from api.services.progress import sync_subtask_counters
+
+
+class Command(BaseCommand):
+    help = "Backfills and repairs the denormalized subtask counters on Task."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        task_ids = Task.objects.order_by('pk').values_list('pk', flat=True)
+        repaired = 0
+        last_pk = 0
+        while True:
+            chunk = list(task_ids.filter(pk__gt=last_pk)[:batch_size])
+            if not chunk:
+                break
+            repaired += len(sync_subtask_counters(chunk))
+            last_pk = chunk[-1]
+        self.stdout.write(self.style.SUCCESS(f"Repaired subtask counters on {repaired} task(s)."))
@@ -0,0 +1,24 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from api.services.unread import reconcile
+
+
+class Command(BaseCommand):
+    help = "Backfills and repairs the denormalized unread notification counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        user_ids = get_user_model().objects.order_by('pk').values_list('pk', flat=True)
+        repaired = 0
+        last_pk = 0
+        while True:
+            chunk = list(user_ids.filter(pk__gt=last_pk)[:batch_size])
+            if not chunk:
+                break
+            repaired += len(reconcile(chunk))
+            last_pk = chunk[-1]
+        self.stdout.write(self.style.SUCCESS(f"Repaired unread counters for {repaired} user(s)."))
@@ -0,0 +1,112 @@
+import heapq
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from .nplusone import NPlusOneError, QueryShapeTracker
+from .services import metrics
+
+slow_request_logger = logging.getLogger('api.slow_requests')
+nplusone_logger = logging.getLogger('api.nplusone')
+
+
+class QueryRecorder:
+    """
+    connection.execute_wrapper() hook that counts one request's queries and
+    their time, keeping the SQL of only the slowest few for the slow log.
+    """
+
+    def __init__(self, keep):
+        self.keep = keep
+        self.count = 0
+        self.duration = 0.0
+        self._slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            entry = (elapsed, self.count, sql)
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, entry)
+            elif self.keep:
+                heapq.heappushpop(self._slowest, entry)
+
+    def slowest(self):
+        """(seconds, sql) of the slowest queries, slowest first."""
+        return [(elapsed, sql) for elapsed, _, sql in sorted(self._slowest, reverse=True)]
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    # view_name ("project-list", "notification-stream") keeps label
+    # cardinality bounded, unlike the raw path.
+    return match.view_name if match is not None else 'unmatched'
+
+
+class MetricsMiddleware:
+    """
+    Records wall time, query count, DB time and response size per route into
+    the in-process histograms served at /metrics, and logs requests slower
+    than METRICS_SLOW_REQUEST_MS together with their slowest SQL.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        recorder = QueryRecorder(settings.METRICS_SLOW_SQL_LIMIT)
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        route = _route(request)
+        size = None if response.streaming else len(response.content)
+        metrics.observe_request(
+            route, request.method, response.status_code, duration, recorder.count, recorder.duration, size,
+        )
+        if duration * 1000 >= settings.METRICS_SLOW_REQUEST_MS:
+            queries = '\n'.join(f'  {elapsed * 1000:.1f} ms  {sql}' for elapsed, sql in recorder.slowest())
+            slow_request_logger.warning(
+                "Slow request: %s %s (%s) took %.0f ms, %d queries in %.0f ms\n%s",
+                request.method, request.get_full_path(), route, duration * 1000,
+                recorder.count, recorder.duration * 1000, queries,
+            )
+        return response
+
+
+class NPlusOneMiddleware:
+    """
+    Flags requests that repeat the same SELECT NPLUSONE_THRESHOLD times or
+    more, naming the serializer field responsible. NPLUSONE_DETECTION is
+    "log" (warning on api.nplusone), "raise" (NPlusOneError, for tests) or
+    "off".
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = settings.NPLUSONE_DETECTION
+        if mode == 'off':
+            return self.get_response(request)
+
+        tracker = QueryShapeTracker(settings.NPLUSONE_THRESHOLD)
+        with connection.execute_wrapper(tracker):
+            response = self.get_response(request)
+        if tracker.problems():
+            report = tracker.report(f'{request.method} {request.get_full_path()}')
+            if mode == 'raise':
+                raise NPlusOneError(report)
+            nplusone_logger.warning(report)
+        return response
@@ -0,0 +1,40 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_subtask_counters(apps, schema_editor):
+    Task = apps.get_model('api', 'Task')
+    Subtask = apps.get_model('api', 'Subtask')
+
+    def count(**filters):
+        counts = (
+            Subtask.objects.filter(task=OuterRef('pk'), **filters)
+            .order_by().values('task').annotate(c=Count('pk')).values('c')
+        )
+        return Coalesce(Subquery(counts), 0)
+
+    Task.objects.update(subtask_total=count(), subtask_completed=count(completed=True))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='subtask_completed',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='subtask_total',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_subtask_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_task_subtask_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['status', '-progress'], name='project_status_progress_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 6.0.1 on 2026-10-17 04:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def build_rollups(apps, schema_editor):
+    FocusSession = apps.get_model('api', 'FocusSession')
+    FocusDailyRollup = apps.get_model('api', 'FocusDailyRollup')
+    rows = (
+        FocusSession.objects.annotate(date=TruncDate('start_time'))
+        .values('user_id', 'date', 'tag', 'project_id')
+        .annotate(total_minutes=Sum('duration_minutes'), session_count=Count('id'))
+        .order_by()
+    )
+    FocusDailyRollup.objects.bulk_create((FocusDailyRollup(**row) for row in rows), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_project_status_progress_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FocusDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('tag', models.CharField(max_length=100)),
+                ('total_minutes', models.FloatField(default=0.0)),
+                ('session_count', models.IntegerField(default=0)),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='focus_rollups', to='api.project')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='focus_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'date', 'tag', 'project'), name='focus_rollup_unique_key')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
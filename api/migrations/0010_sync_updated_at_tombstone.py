@@ -0,0 +1,45 @@
+# Generated by Django 6.0.1 on 2026-10-17 05:02
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    # Existing rows last changed no later than they were created.
+    apps.get_model('api', 'FocusSession').objects.update(updated_at=F('start_time'))
+    apps.get_model('api', 'Notification').objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_focusdailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='focussession',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('project', 'Project'), ('task', 'Task'), ('subtask', 'Subtask'), ('note', 'Note'), ('focus_session', 'Focus Session'), ('notification', 'Notification')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('owner_id', models.BigIntegerField(blank=True, null=True)),
+                ('parent_id', models.BigIntegerField(blank=True, null=True)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner_id', 'deleted_at'], name='tombstone_owner_idx'), models.Index(fields=['model', 'parent_id', 'deleted_at'], name='tombstone_parent_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 6.0.1 on 2026-10-17 05:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread_counters(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Notification = apps.get_model('api', 'Notification')
+    UnreadCounter = apps.get_model('api', 'UnreadCounter')
+
+    pending = (
+        Notification.objects.filter(recipient=OuterRef('pk'), status='pending')
+        .order_by().values('recipient').annotate(c=Count('pk')).values('c')
+    )
+    counts = User.objects.annotate(unread=Coalesce(Subquery(pending), 0)).values_list('pk', 'unread')
+    UnreadCounter.objects.bulk_create(
+        (UnreadCounter(user_id=user_id, count=count) for user_id, count in counts.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_sync_updated_at_tombstone'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='unread_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_unread_counters, migrations.RunPython.noop),
+    ]
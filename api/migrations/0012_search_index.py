@@ -0,0 +1,94 @@
+# Generated by Django 6.0.1 on 2026-10-17 06:05
+
+from django.conf import settings
+from django.db import migrations
+
+# The search index lives outside the ORM (see api.services.search): an FTS5
+# virtual table on SQLite, a tsvector table with a GIN index on Postgres.
+
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE api_search_index USING fts5(
+        title, content,
+        kind UNINDEXED, object_id UNINDEXED, user_id UNINDEXED,
+        community_id UNINDEXED, project_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO api_search_index (rowid, title, content, kind, object_id, user_id, community_id, project_id)
+    SELECT id * 2, title, COALESCE(content, ''), 'note', id, user_id, NULL, NULL FROM api_note
+    """,
+    """
+    INSERT INTO api_search_index (rowid, title, content, kind, object_id, user_id, community_id, project_id)
+    SELECT sn.id * 2 + 1, sn.title, COALESCE(sn.content, ''), 'shared_note', sn.id, NULL, sp.community_id, sn.project_id
+    FROM api_sharednote sn JOIN api_sharedproject sp ON sp.id = sn.project_id
+    """,
+]
+
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('{config}', {title}), 'A') || "
+    "setweight(to_tsvector('{config}', {content}), 'B')"
+)
+
+POSTGRES_CREATE = [
+    """
+    CREATE TABLE api_search_index (
+        kind varchar(20) NOT NULL,
+        object_id bigint NOT NULL,
+        title text NOT NULL,
+        content text NOT NULL,
+        user_id bigint NULL,
+        community_id bigint NULL,
+        project_id bigint NULL,
+        document tsvector NOT NULL,
+        PRIMARY KEY (kind, object_id)
+    )
+    """,
+    "CREATE INDEX api_search_index_document_idx ON api_search_index USING GIN (document)",
+    """
+    INSERT INTO api_search_index (kind, object_id, title, content, user_id, community_id, project_id, document)
+    SELECT 'note', id, title, COALESCE(content, ''), user_id, NULL, NULL, {note_document} FROM api_note
+    """,
+    """
+    INSERT INTO api_search_index (kind, object_id, title, content, user_id, community_id, project_id, document)
+    SELECT 'shared_note', sn.id, sn.title, COALESCE(sn.content, ''), NULL, sp.community_id, sn.project_id,
+           {shared_note_document}
+    FROM api_sharednote sn JOIN api_sharedproject sp ON sp.id = sn.project_id
+    """,
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        statements = SQLITE_CREATE
+    elif vendor == 'postgresql':
+        config = settings.SEARCH_TEXT_CONFIG
+        documents = {
+            'note_document': POSTGRES_DOCUMENT.format(config=config, title='title', content="COALESCE(content, '')"),
+            'shared_note_document': POSTGRES_DOCUMENT.format(
+                config=config, title='sn.title', content="COALESCE(sn.content, '')",
+            ),
+        }
+        statements = [statement.format(**documents) for statement in POSTGRES_CREATE]
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP TABLE IF EXISTS api_search_index')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_unreadcounter'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
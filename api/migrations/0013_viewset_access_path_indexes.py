@@ -0,0 +1,88 @@
+# Generated by Django 6.0.1 on 2026-10-17 06:31
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def dedupe_pending_invites(apps, schema_editor):
+    """Keeps the oldest pending invite per (recipient, community) so the
+    partial unique constraint can be created."""
+    Notification = apps.get_model('api', 'Notification')
+    UnreadCounter = apps.get_model('api', 'UnreadCounter')
+    Tombstone = apps.get_model('api', 'Tombstone')
+
+    pending = Notification.objects.filter(notification_type='community_invite', status='pending')
+    duplicates = (
+        pending.values('recipient_id', 'community_id')
+        .annotate(n=Count('pk'), keep=Min('pk'))
+        .filter(n__gt=1)
+        .order_by()
+    )
+    for group in duplicates:
+        extra = pending.filter(
+            recipient_id=group['recipient_id'], community_id=group['community_id'],
+        ).exclude(pk=group['keep'])
+        ids = list(extra.values_list('pk', flat=True))
+        # Historical models send no signals: do the bookkeeping by hand.
+        Tombstone.objects.bulk_create([
+            Tombstone(model='notification', object_id=pk, owner_id=group['recipient_id']) for pk in ids
+        ])
+        UnreadCounter.objects.filter(user_id=group['recipient_id']).update(count=F('count') - len(ids))
+        Notification.objects.filter(pk__in=ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='focussession',
+            index=models.Index(fields=['user', '-start_time', '-id'], name='focus_user_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['user', '-updated_at', '-id'], name='note_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', '-created_at', '-id'], name='notification_recipient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['recipient', '-created_at'], name='notification_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['user', '-updated_at', '-id'], name='project_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sharednote',
+            index=models.Index(fields=['project', '-updated_at', '-id'], name='sharednote_project_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sharedproject',
+            index=models.Index(fields=['community', '-updated_at', '-id'], name='sharedproject_community_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sharedtask',
+            index=models.Index(fields=['project', 'created_at', 'id'], name='sharedtask_project_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subtask',
+            index=models.Index(fields=['task', 'created_at', 'id'], name='subtask_task_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['project', 'created_at', 'id'], name='task_project_created_idx'),
+        ),
+        migrations.RunPython(dedupe_pending_invites, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('notification_type', 'community_invite'), ('status', 'pending')), fields=('recipient', 'community'), name='notification_unique_pending_invite'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 6.0.1 on 2026-10-17 09:40
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_project_less_rollups(apps, schema_editor):
+    # Rows left behind by deleted projects: sum each (user, date, tag) group
+    # into its first row.
+    FocusDailyRollup = apps.get_model('api', 'FocusDailyRollup')
+    rollups = FocusDailyRollup.objects.filter(project__isnull=True)
+    groups = (
+        rollups.values('user_id', 'date', 'tag')
+        .annotate(rows=Count('id'), keep=Min('id'), minutes=Sum('total_minutes'), sessions=Sum('session_count'))
+        .filter(rows__gt=1).order_by()
+    )
+    for group in groups:
+        rollups.filter(pk=group['keep']).update(total_minutes=group['minutes'], session_count=group['sessions'])
+        rollups.filter(user_id=group['user_id'], date=group['date'], tag=group['tag']) \
+            .exclude(pk=group['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_conditional_get_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_project_less_rollups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='focusdailyrollup',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(project__isnull=True), fields=('user', 'date', 'tag'),
+                name='focus_rollup_unique_no_project',
+            ),
+        ),
+    ]
@@ -1,18 +1,107 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models.functions import Coalesce
+
+from .services import metrics
 
 User = get_user_model()
 
-class Profile(models.Model):
+class DirtyFieldsMixin(models.Model):
+    """
+    Remembers the database values of every concrete field as they were
+    loaded, so signal handlers can tell what a save actually changed
+    (has_changed/previous_value). A plain save() of a loaded row writes only
+    the fields that changed (plus auto_now ones) and is skipped altogether
+    when nothing did; the outcomes are counted in
+    services.metrics.model_saves. With `save_atomically`, the save and the
+    signal handlers it triggers share one transaction.
+    """
+    save_atomically = False
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using, fields, **kwargs)
+        if fields is None:
+            self._snapshot()
+            return
+        # Also the path of deferred field loads.
+        loaded = self.__dict__
+        loaded_values = getattr(self, '_loaded_values', {})
+        for name in fields:
+            attname = self._meta.get_field(name).attname
+            if attname in loaded:
+                loaded_values[attname] = loaded[attname]
+        self._loaded_values = loaded_values
+
+    def _snapshot(self):
+        loaded = self.__dict__
+        self._loaded_values = {
+            f.attname: loaded[f.attname] for f in self._meta.concrete_fields if f.attname in loaded
+        }
+
+    def previous_value(self, field):
+        """Value of `field` when the instance was loaded (None if unknown)."""
+        return getattr(self, '_loaded_values', {}).get(field)
+
+    def has_changed(self, field):
+        loaded_values = getattr(self, '_loaded_values', {})
+        return field in loaded_values and loaded_values[field] != getattr(self, field)
+
+    def get_dirty_fields(self):
+        """Names of the loaded fields whose value changed (None if never loaded)."""
+        loaded_values = getattr(self, '_loaded_values', None)
+        if loaded_values is None:
+            return None
+        current = self.__dict__
+        return [
+            f.name for f in self._meta.concrete_fields
+            if not f.primary_key and f.attname in current
+            and (f.attname not in loaded_values or loaded_values[f.attname] != current[f.attname])
+        ]
+
+    def save(self, *args, **kwargs):
+        outcome = 'full'
+        if self._state.adding:
+            outcome = 'insert'
+        elif not args and not (kwargs.keys() - {'using'}) and kwargs.get('using', self._state.db) == self._state.db:
+            dirty = self.get_dirty_fields()
+            if dirty == []:
+                metrics.model_saves.inc(model=self._meta.label, outcome='skipped')
+                return
+            if dirty is not None:
+                auto_now = [f.name for f in self._meta.concrete_fields if getattr(f, 'auto_now', False)]
+                kwargs['update_fields'] = update_fields = set(dirty + auto_now)
+                outcome = 'partial'
+                metrics.model_columns_skipped.inc(
+                    len(self._meta.concrete_fields) - 1 - len(update_fields), model=self._meta.label,
+                )
+        metrics.model_saves.inc(model=self._meta.label, outcome=outcome)
+        if self.save_atomically:
+            with transaction.atomic(using=kwargs.get('using')):
+                super().save(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+        self._snapshot()
+
+class Profile(DirtyFieldsMixin, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     display_name = models.CharField(max_length=100, blank=True)
     avatar_index = models.IntegerField(default=0) # Index for predefined avatars
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Profile of {self.user.username}"
 
-class Project(models.Model):
+class Project(DirtyFieldsMixin, models.Model):
     STATUS_CHOICES = [
         ('PENDING', 'Pending'),
         ('IN_PROGRESS', 'In Progress'),
@@ -32,10 +121,18 @@ class Project(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Public leaderboard: status IN (...) ORDER BY progress DESC
+            models.Index(fields=['status', '-progress'], name='project_status_progress_idx'),
+            # ProjectViewSet and /api/sync/: user = ? ORDER BY updated_at DESC
+            models.Index(fields=['user', '-updated_at', '-id'], name='project_user_updated_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
-class Task(models.Model):
+class Task(DirtyFieldsMixin, models.Model):
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='tasks')
     title = models.CharField(max_length=255)
     completed = models.BooleanField(default=False)
@@ -44,23 +141,46 @@ class Task(models.Model):
         validators=[MinValueValidator(0.0), MaxValueValidator(100.0)],
         help_text="Calculated average of subtasks' completion or 100 if completed"
     )
+    # Denormalized counters, kept in sync by the Subtask signals with atomic
+    # F() updates. Use `manage.py reconcile_subtask_counters` to repair them.
+    subtask_total = models.IntegerField(default=0, editable=False)
+    subtask_completed = models.IntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'created_at', 'id'], name='task_project_created_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
-class Subtask(models.Model):
+class Subtask(DirtyFieldsMixin, models.Model):
+    # The counter bookkeeping in the Subtask signals must commit or roll
+    # back together with the row itself.
+    save_atomically = True
+
     task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='subtasks')
     title = models.CharField(max_length=255)
     completed = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['task', 'created_at', 'id'], name='subtask_task_created_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
-class FocusSession(models.Model):
+class FocusSession(DirtyFieldsMixin, models.Model):
+    # The fields behind the FocusDailyRollup row a session counts towards.
+    rollup_fields = ('user_id', 'project_id', 'tag', 'start_time', 'duration_minutes')
+    # Keep the session and its FocusDailyRollup delta in one transaction.
+    save_atomically = True
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='focus_sessions')
     project = models.ForeignKey(Project, on_delete=models.SET_NULL, null=True, blank=True, related_name='focus_sessions')
     tag = models.CharField(max_length=100)
@@ -68,11 +188,43 @@ class FocusSession(models.Model):
     end_time = models.DateTimeField(null=True, blank=True)
     duration_minutes = models.FloatField(default=0.0)
     is_completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-start_time', '-id'], name='focus_user_start_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.tag} ({self.duration_minutes} min)"
 
-class Note(models.Model):
+class FocusDailyRollup(models.Model):
+    """
+    Focus minutes pre-summed per (user, day, tag, project), kept up to date
+    by the FocusSession signals. Rebuild with `manage.py rebuild_focus_rollups`.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='focus_rollups')
+    date = models.DateField()
+    tag = models.CharField(max_length=100)
+    project = models.ForeignKey(Project, on_delete=models.SET_NULL, null=True, blank=True, related_name='focus_rollups')
+    total_minutes = models.FloatField(default=0.0)
+    session_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date', 'tag', 'project'], name='focus_rollup_unique_key'),
+            # NULLs never collide in the key above: one project-less row per
+            # (user, day, tag) is enforced separately.
+            models.UniqueConstraint(
+                fields=['user', 'date', 'tag'], condition=models.Q(project__isnull=True),
+                name='focus_rollup_unique_no_project',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.date} {self.tag}: {self.total_minutes} min"
+
+class Note(DirtyFieldsMixin, models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notes')
     title = models.CharField(max_length=255)
     content = models.TextField(blank=True, null=True)
@@ -80,22 +232,61 @@ class Note(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-updated_at', '-id'], name='note_user_updated_idx'),
+        ]
+
     def __str__(self):
         return f"{self.title} - {self.user.username}"
 
 
-class Community(models.Model):
+def _count_subquery(queryset, fk):
+    """COUNT(*) of `queryset` rows whose `fk` points at the outer row, as a subquery."""
+    counts = (
+        queryset.filter(**{fk: models.OuterRef('pk')})
+        .order_by().values(fk).annotate(c=models.Count('pk')).values('c')
+    )
+    return Coalesce(models.Subquery(counts), 0)
+
+
+class CommunityQuerySet(models.QuerySet):
+    def with_counts(self):
+        """Annotates `member_count` and `project_count` without joining members."""
+        return self.annotate(
+            member_count=_count_subquery(Community.members.through.objects.all(), 'community'),
+            project_count=_count_subquery(SharedProject.objects.all(), 'community'),
+        )
+
+
+class Community(DirtyFieldsMixin, models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='owned_communities')
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
     members = models.ManyToManyField(User, related_name='communities', blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Also bumped when members join or leave (see signals).
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CommunityQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.name} (owner: {self.owner.username})"
 
 
-class SharedProject(models.Model):
+class SharedProjectQuerySet(models.QuerySet):
+    def with_progress(self):
+        """
+        Annotates shared task totals so `progress` can be read without extra
+        queries. Uses subqueries so it composes with other joins/annotations.
+        """
+        return self.annotate(
+            shared_task_total=_count_subquery(SharedTask.objects.all(), 'project'),
+            shared_task_completed=_count_subquery(SharedTask.objects.filter(completed=True), 'project'),
+        )
+
+
+class SharedProject(DirtyFieldsMixin, models.Model):
     STATUS_CHOICES = [
         ('PENDING', 'Pending'),
         ('IN_PROGRESS', 'In Progress'),
@@ -111,19 +302,34 @@ class SharedProject(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = SharedProjectQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['community', '-updated_at', '-id'], name='sharedproject_community_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} [{self.community.name}]"
 
     @property
     def progress(self):
-        tasks = self.shared_tasks.all()
-        if not tasks:
+        total = getattr(self, 'shared_task_total', None)
+        if total is None:
+            # Not loaded through with_progress(): one aggregate query.
+            counts = self.shared_tasks.aggregate(
+                total=models.Count('pk'),
+                completed=models.Count('pk', filter=models.Q(completed=True)),
+            )
+            total, completed = counts['total'], counts['completed']
+        else:
+            completed = self.shared_task_completed
+        if not total:
             return 0.0
-        completed = tasks.filter(completed=True).count()
-        return round((completed / tasks.count()) * 100, 1)
+        return round((completed / total) * 100, 1)
 
 
-class SharedTask(models.Model):
+class SharedTask(DirtyFieldsMixin, models.Model):
     project = models.ForeignKey(SharedProject, on_delete=models.CASCADE, related_name='shared_tasks')
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='shared_tasks_created')
     title = models.CharField(max_length=255)
@@ -131,11 +337,16 @@ class SharedTask(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'created_at', 'id'], name='sharedtask_project_created_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
 
-class SharedNote(models.Model):
+class SharedNote(DirtyFieldsMixin, models.Model):
     project = models.ForeignKey(SharedProject, on_delete=models.CASCADE, related_name='shared_notes')
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='shared_notes_created')
     title = models.CharField(max_length=255)
@@ -143,11 +354,19 @@ class SharedNote(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', '-updated_at', '-id'], name='sharednote_project_updated_idx'),
+        ]
+
     def __str__(self):
         return f"{self.title} [{self.project.name}]"
 
 
-class Notification(models.Model):
+class Notification(DirtyFieldsMixin, models.Model):
+    # Keeps the UnreadCounter update (see signals) in the same transaction.
+    save_atomically = True
+
     TYPE_CHOICES = [
         ('community_invite', 'Community Invitation'),
         ('new_project', 'New Shared Project'),
@@ -167,9 +386,70 @@ class Notification(models.Model):
     message = models.CharField(max_length=500)
     community = models.ForeignKey(Community, on_delete=models.CASCADE, null=True, blank=True, related_name='notifications')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # NotificationViewSet: recipient = ? ORDER BY created_at DESC
+            models.Index(fields=['recipient', '-created_at', '-id'], name='notification_recipient_idx'),
+            # Unread lookups only ever touch pending rows.
+            models.Index(
+                fields=['recipient', '-created_at'],
+                condition=models.Q(status='pending'),
+                name='notification_pending_idx',
+            ),
+        ]
+        constraints = [
+            # At most one open invitation per user and community.
+            models.UniqueConstraint(
+                fields=['recipient', 'community'],
+                condition=models.Q(notification_type='community_invite', status='pending'),
+                name='notification_unique_pending_invite',
+            ),
+        ]
 
     def __str__(self):
         return f"[{self.notification_type}] {self.actor.username} → {self.recipient.username}"
+
+
+class UnreadCounter(models.Model):
+    """Denormalized count of a user's pending notifications (see services.unread)."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='unread_counter')
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.count} unread"
+
+
+class Tombstone(models.Model):
+    """
+    Records a deleted row so /api/sync/ can tell clients what to drop.
+    Rows owned directly by a user carry `owner_id`; tasks and subtasks carry
+    their parent's id instead, which avoids a lookup on every cascade delete.
+    """
+    MODEL_CHOICES = [
+        ('project', 'Project'),
+        ('task', 'Task'),
+        ('subtask', 'Subtask'),
+        ('note', 'Note'),
+        ('focus_session', 'Focus Session'),
+        ('notification', 'Notification'),
+    ]
+
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    # Plain integers rather than FKs: the referenced rows are usually being
+    # deleted in the same transaction.
+    owner_id = models.BigIntegerField(null=True, blank=True)
+    parent_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner_id', 'deleted_at'], name='tombstone_owner_idx'),
+            models.Index(fields=['model', 'parent_id', 'deleted_at'], name='tombstone_parent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id} deleted at {self.deleted_at}"
@@ -0,0 +1,116 @@
+"""
+N+1 query detection: counts same-shape SELECTs per request and, when one
+repeats, points at the serializer field (or code line) that issued it.
+"""
+import os
+import re
+import sys
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class NPlusOneError(AssertionError):
+    pass
+
+
+def _shape(sql):
+    # Prefetches send IN lists of varying length; they are one shape.
+    return _IN_LIST.sub('IN (...)', sql)
+
+
+def _field_path(field):
+    """'NotificationSerializer.actor_name (source=actor.username)' for a bound field."""
+    names = []
+    node = field
+    while node.parent is not None:
+        if node.field_name:
+            names.append(node.field_name)
+        node = node.parent
+    root = getattr(node, 'child', node)
+    path = '.'.join([type(root).__name__] + names[::-1])
+    source = getattr(field, 'source', None)
+    if source and source != field.field_name and source != '*':
+        path += f' (source={source})'
+    return path
+
+
+def find_origin():
+    """
+    Walks the current stack for the serializer field being rendered; falls
+    back to the innermost line of this app's code.
+    """
+    frame = sys._getframe(1)
+    app_line = None
+    while frame is not None:
+        code = frame.f_code
+        if code.co_name == 'to_representation' and 'field' in frame.f_locals and 'rest_framework' in code.co_filename:
+            field = frame.f_locals['field']
+            if getattr(field, 'parent', None) is not None:
+                return _field_path(field)
+        filename = os.path.abspath(code.co_filename)
+        if app_line is None and filename.startswith(_API_DIR) and filename != os.path.abspath(__file__):
+            app_line = f'{os.path.relpath(filename, os.path.dirname(_API_DIR))}:{frame.f_lineno} in {code.co_name}'
+        frame = frame.f_back
+    return app_line or 'unknown'
+
+
+class QueryShapeTracker:
+    """
+    connection.execute_wrapper() hook. Remembers where each SELECT shape was
+    first repeated; repeats from the same origin are the N+1 pattern.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.counts = {}
+        self.origins = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        if sql.lstrip()[:6].upper() == 'SELECT':
+            shape = _shape(sql)
+            count = self.counts[shape] = self.counts.get(shape, 0) + 1
+            if count == 2:
+                # The stack is only inspected once a shape repeats.
+                self.origins[shape] = find_origin()
+        return result
+
+    def problems(self):
+        """(count, origin, sql) for every shape run at least `threshold` times."""
+        return sorted(
+            ((count, self.origins.get(shape, 'unknown'), shape)
+             for shape, count in self.counts.items() if count >= self.threshold),
+            reverse=True,
+        )
+
+    def report(self, label):
+        lines = [f'Possible N+1 queries in {label}:']
+        for count, origin, sql in self.problems():
+            lines.append(f'  {count}x from {origin}: {sql[:300]}')
+        return '\n'.join(lines)
+
+
+class NPlusOneTestMixin:
+    """
+    Makes a test fail with NPlusOneError when a test-client request repeats
+    a query NPLUSONE_THRESHOLD times or more (see NPlusOneMiddleware).
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(NPLUSONE_DETECTION='raise'))
+
+    @contextmanager
+    def assertNoNPlusOne(self, label='block'):
+        """Same check for code that doesn't go through the test client."""
+        tracker = QueryShapeTracker(settings.NPLUSONE_THRESHOLD)
+        with connection.execute_wrapper(tracker):
+            yield tracker
+        if tracker.problems():
+            self.fail(tracker.report(label))
@@ -4,6 +4,52 @@ from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+def _split_param(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+def is_field_requested(request, name, expandable=False):
+    """
+    Whether a GET request wants `name` in the top-level representation.
+    - ?fields=id,name keeps only the listed fields.
+    - ?expand=tasks keeps only the listed nested (expandable) fields;
+      an empty ?expand= drops all of them.
+    """
+    if request is None or request.method != 'GET':
+        return True
+    params = request.query_params
+    if 'fields' in params and name not in _split_param(params['fields']):
+        return False
+    if expandable and 'expand' in params and name not in _split_param(params['expand']):
+        return False
+    return True
+
+class SparseFieldsMixin:
+    """
+    Applies ?fields= / ?expand= to the top-level serializer of a response.
+    An explicit `expand` in the serializer context (an iterable of field
+    names) takes precedence over the query string.
+    """
+    expandable_fields = ()
+
+    def get_fields(self):
+        fields = super().get_fields()
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            return fields
+        expand = self.context.get('expand')
+        if expand is not None:
+            return {
+                name: field for name, field in fields.items()
+                if name not in self.expandable_fields or name in expand
+            }
+        request = self.context.get('request')
+        return {
+            name: field for name, field in fields.items()
+            if is_field_requested(request, name, name in self.expandable_fields)
+        }
+
 class ProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = Profile
@@ -35,13 +81,14 @@ class RegisterSerializer(serializers.ModelSerializer):
         )
         return user
 
-class SubtaskSerializer(serializers.ModelSerializer):
+class SubtaskSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Subtask
         fields = ['id', 'task', 'title', 'completed', 'created_at']
         read_only_fields = ['id', 'created_at']
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = ('subtasks',)
     subtasks = SubtaskSerializer(many=True, read_only=True)
 
     class Meta:
@@ -49,7 +96,32 @@ class TaskSerializer(serializers.ModelSerializer):
         fields = ['id', 'project', 'title', 'completed', 'progress', 'subtasks', 'created_at']
         read_only_fields = ['id', 'progress', 'created_at']
 
-class ProjectSerializer(serializers.ModelSerializer):
+class BulkOperationSerializer(serializers.Serializer):
+    """One entry of a bulk request: {"op": ..., "id": ..., <fields>}."""
+    OPS = ['create', 'update', 'toggle', 'delete']
+
+    op = serializers.ChoiceField(choices=OPS)
+    id = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] != 'create' and 'id' not in attrs:
+            raise serializers.ValidationError({'id': ['This field is required.']})
+        return attrs
+
+class SubtaskBulkItemSerializer(serializers.Serializer):
+    """Subtask fields accepted by the bulk endpoint; `task` is checked by the view."""
+    task = serializers.IntegerField()
+    title = serializers.CharField(max_length=255)
+    completed = serializers.BooleanField(required=False)
+
+class TaskBulkItemSerializer(serializers.Serializer):
+    """Task fields accepted by the bulk endpoint; `project` is checked by the view."""
+    project = serializers.IntegerField()
+    title = serializers.CharField(max_length=255)
+    completed = serializers.BooleanField(required=False)
+
+class ProjectSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = ('tasks',)
     tasks = TaskSerializer(many=True, read_only=True)
     user_name = serializers.CharField(source='user.username', read_only=True)
     display_name = serializers.CharField(source='user.profile.display_name', read_only=True)
@@ -73,7 +145,7 @@ class CommunityProjectSerializer(serializers.ModelSerializer):
         model = Project
         fields = ['id', 'user_name', 'display_name', 'name', 'progress', 'status']
 
-class FocusSessionSerializer(serializers.ModelSerializer):
+class FocusSessionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = FocusSession
         fields = ['id', 'user', 'project', 'tag', 'start_time', 'end_time', 'duration_minutes', 'is_completed']
@@ -83,7 +155,7 @@ class FocusSessionSerializer(serializers.ModelSerializer):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
-class NoteSerializer(serializers.ModelSerializer):
+class NoteSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Note
         fields = ['id', 'user', 'title', 'content', 'note_type', 'created_at', 'updated_at']
@@ -102,7 +174,7 @@ class CommunityMemberSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'display_name']
 
 
-class SharedTaskSerializer(serializers.ModelSerializer):
+class SharedTaskSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     created_by_name = serializers.CharField(source='created_by.username', read_only=True)
 
     class Meta:
@@ -115,7 +187,7 @@ class SharedTaskSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class SharedNoteSerializer(serializers.ModelSerializer):
+class SharedNoteSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     created_by_name = serializers.CharField(source='created_by.username', read_only=True)
 
     class Meta:
@@ -128,7 +200,8 @@ class SharedNoteSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class SharedProjectSerializer(serializers.ModelSerializer):
+class SharedProjectSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = ('shared_tasks', 'shared_notes')
     shared_tasks = SharedTaskSerializer(many=True, read_only=True)
     shared_notes = SharedNoteSerializer(many=True, read_only=True)
     created_by_name = serializers.CharField(source='created_by.username', read_only=True)
@@ -145,7 +218,8 @@ class SharedProjectSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class CommunitySerializer(serializers.ModelSerializer):
+class CommunitySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = ('members', 'projects')
     members = CommunityMemberSerializer(many=True, read_only=True)
     owner_name = serializers.CharField(source='owner.username', read_only=True)
     projects = SharedProjectSerializer(many=True, read_only=True)
@@ -157,6 +231,10 @@ class CommunitySerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'owner', 'owner_name', 'members', 'member_count', 'projects', 'created_at']
 
     def get_member_count(self, obj):
+        if 'members' in getattr(obj, '_prefetched_objects_cache', {}):
+            return len(obj.members.all())
+        if hasattr(obj, 'member_count'):
+            return obj.member_count
         return obj.members.count()
 
     def create(self, validated_data):
@@ -167,7 +245,19 @@ class CommunitySerializer(serializers.ModelSerializer):
         return community
 
 
-class NotificationSerializer(serializers.ModelSerializer):
+class CommunitySummarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """List representation: counts come from CommunityQuerySet.with_counts()."""
+    owner_name = serializers.CharField(source='owner.username', read_only=True)
+    member_count = serializers.IntegerField(read_only=True)
+    project_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Community
+        fields = ['id', 'name', 'description', 'owner', 'owner_name', 'member_count', 'project_count', 'created_at']
+        read_only_fields = fields
+
+
+class NotificationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     actor_name = serializers.CharField(source='actor.username', read_only=True)
     community_name = serializers.CharField(source='community.name', read_only=True, default='')
 
@@ -0,0 +1,9 @@
+# The id lists used for SQL IN (...) clauses are cut to this size to stay
+# below SQLite's bound-parameter limit.
+ID_CHUNK = 2000
+
+
+def chunked(items, size=ID_CHUNK):
+    """Consecutive slices of the sequence `items`, `size` long at most."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
@@ -0,0 +1,61 @@
+from django.db import transaction
+
+from api.services import sync
+from api.services.chunks import chunked
+from api.services.progress import mark_project_dirty
+
+
+def _raw_delete(queryset):
+    """
+    DELETE ... WHERE with no collection, cascade or signals. QuerySet.delete()
+    loads every row to send them, so this relies on the private
+    QuerySet._raw_delete(), which Django itself uses for fast deletes.
+    """
+    return queryset._raw_delete(queryset.db)
+
+
+def _delete_task_rows(task_ids):
+    """
+    Removes tasks and their subtasks with raw DELETEs: no rows are loaded and
+    no signals fire. Subtask tombstones are not needed, since /api/sync/ only
+    reports subtasks of tasks that still exist. Returns the rows deleted.
+    """
+    from api.models import Subtask, Task
+
+    deleted = 0
+    for chunk in chunked(task_ids):
+        deleted += _raw_delete(Subtask.objects.filter(task_id__in=chunk))
+        deleted += _raw_delete(Task.objects.filter(pk__in=chunk))
+    return deleted
+
+
+def delete_tasks(task_ids):
+    """
+    Deletes tasks with their subtasks in a fixed number of queries, doing
+    what the per-row Task signals would: one tombstone per task and a single
+    progress recalculation per affected project. Returns the tasks deleted.
+    """
+    from api.models import Task
+
+    with transaction.atomic():
+        tasks = list(Task.objects.filter(pk__in=task_ids).only('pk', 'project_id'))
+        _delete_task_rows([task.pk for task in tasks])
+        sync.record_deletions('task', tasks)
+        for project_id in {task.project_id for task in tasks}:
+            mark_project_dirty(project_id)
+    return len(tasks)
+
+
+def delete_project(project):
+    """
+    Deletes a project, removing its task tree first so the cascade neither
+    loads nor recalculates rows that are going away. Only the project itself
+    goes through Model.delete(): its signals (tombstone, leaderboard) fire and
+    focus sessions are detached as usual. Clients drop the children of a
+    deleted project, so the tasks get no tombstones of their own.
+    """
+    from api.models import Task
+
+    with transaction.atomic():
+        _delete_task_rows(list(Task.objects.filter(project=project).values_list('pk', flat=True)))
+        return project.delete()
@@ -0,0 +1,133 @@
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    """One connected stream: an asyncio queue owned by the stream's event loop."""
+
+    def __init__(self, broker, user_id, loop):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=settings.NOTIFICATION_STREAM_QUEUE_SIZE)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A stalled client only misses events; the next unread_count
+            # event brings it back in line.
+            pass
+
+    async def get(self, timeout=None):
+        """Next event, or None after `timeout` seconds without one."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """
+    In-process pub/sub. Publishing is thread-safe and hands events over to
+    each subscriber's loop, so request threads and background workers can
+    publish straight into async streams. Only reaches clients connected to
+    this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, user_id):
+        """Must be called from the event loop that will consume the events."""
+        subscription = Subscription(self, user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def subscribed(self, user_ids):
+        """The subset of `user_ids` with at least one open stream."""
+        with self._lock:
+            return {user_id for user_id in user_ids if user_id in self._subscriptions}
+
+    def publish(self, user_id, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._put, event)
+            except RuntimeError:
+                # The stream's loop is gone; it unsubscribes on its way out.
+                pass
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.NOTIFICATION_BROKER)()
+        return _broker
+
+
+def reset_broker():
+    """Drops the current broker (tests swap brokers through settings)."""
+    global _broker
+    with _broker_lock:
+        _broker = None
+
+
+def _publish(user_ids, notification_ids):
+    from api.models import Notification
+    from api.serializers import NotificationSerializer
+    from api.services import unread
+
+    broker = get_broker()
+    user_ids = broker.subscribed(user_ids)
+    if not user_ids:
+        return
+    if notification_ids:
+        notifications = (
+            Notification.objects.filter(pk__in=notification_ids, recipient_id__in=user_ids)
+            .select_related('actor', 'community')
+            .order_by('created_at', 'id')
+        )
+        for notification in notifications:
+            broker.publish(notification.recipient_id, {
+                'event': 'notification',
+                'data': NotificationSerializer(notification).data,
+            })
+    for user_id, count in unread.counts(user_ids).items():
+        broker.publish(user_id, {'event': 'unread_count', 'data': {'count': count}})
+
+
+def notifications_changed(user_ids, notification_ids=()):
+    """
+    Pushes new notifications and fresh unread counts to the given users once
+    the current transaction commits. Users without an open stream cost a
+    set lookup and nothing else.
+    """
+    user_ids = set(user_ids)
+    notification_ids = list(notification_ids)
+    if user_ids:
+        transaction.on_commit(lambda: _publish(user_ids, notification_ids))
@@ -0,0 +1,125 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from api.services import response_cache
+
+
+def apply_session_delta(user_id, start_time, tag, project_id, minutes, sessions):
+    """Adds `minutes`/`sessions` (possibly negative) to one rollup row."""
+    if start_time is None:
+        return
+    apply_rollup_delta(user_id, timezone.localdate(start_time), tag, project_id, minutes, sessions)
+
+
+def apply_rollup_delta(user_id, day, tag, project_id, minutes, sessions):
+    """apply_session_delta() for the row of the given `day`."""
+    from api.models import FocusDailyRollup
+
+    # Every rollup write goes through here or rebuild_rollups(), so the
+    # cached focus reports are invalidated in these two places.
+    response_cache.invalidate(response_cache.USER, [user_id])
+    rollups = FocusDailyRollup.objects.filter(user_id=user_id, date=day, tag=tag, project_id=project_id)
+    updated = rollups.update(
+        total_minutes=F('total_minutes') + minutes,
+        session_count=F('session_count') + sessions,
+    )
+    if updated:
+        if sessions < 0:
+            rollups.filter(session_count__lte=0).delete()
+        return
+    if sessions <= 0:
+        # Nothing to subtract from; a rebuild will pick up any drift.
+        return
+    try:
+        with transaction.atomic():
+            FocusDailyRollup.objects.create(
+                user_id=user_id, date=day, tag=tag,
+                project_id=project_id, total_minutes=minutes, session_count=sessions,
+            )
+    except IntegrityError:
+        # Created concurrently by another request.
+        rollups.update(
+            total_minutes=F('total_minutes') + minutes,
+            session_count=F('session_count') + sessions,
+        )
+
+
+def detach_project(project_id):
+    """
+    Folds the rollups of a project about to be deleted into the
+    project-less rows of the same (user, day, tag). Left to SET_NULL they
+    would become extra rows next to those; rows without a counterpart are
+    simply moved by the SET_NULL.
+    """
+    from api.models import FocusDailyRollup
+
+    rows = FocusDailyRollup.objects.filter(project_id=project_id)
+    same_day = {'user_id': OuterRef('user_id'), 'date': OuterRef('date'), 'tag': OuterRef('tag')}
+    owners = set(rows.annotate(
+        merge=Exists(FocusDailyRollup.objects.filter(project=None, **same_day)),
+    ).values_list('user_id', 'merge').distinct())
+    if any(merge for _, merge in owners):
+        project_row = rows.filter(**same_day)
+        FocusDailyRollup.objects.filter(project=None).filter(Exists(project_row)).update(
+            total_minutes=F('total_minutes') + Subquery(project_row.values('total_minutes')),
+            session_count=F('session_count') + Subquery(project_row.values('session_count')),
+        )
+        rows.filter(Exists(FocusDailyRollup.objects.filter(project=None, **same_day))).delete()
+    response_cache.invalidate(response_cache.USER, [user_id for user_id, _ in owners])
+
+
+def add_session(session, sign=1):
+    apply_session_delta(
+        session.user_id, session.start_time, session.tag, session.project_id,
+        sign * (session.duration_minutes or 0.0), sign,
+    )
+
+
+def remove_previous_session(session):
+    """Subtracts the contribution the session had when it was loaded."""
+    apply_session_delta(
+        session.previous_value('user_id'), session.previous_value('start_time'),
+        session.previous_value('tag'), session.previous_value('project_id'),
+        -(session.previous_value('duration_minutes') or 0.0), -1,
+    )
+
+
+def rebuild_rollups(user_ids=None, batch_size=1000):
+    """
+    Recomputes FocusDailyRollup rows from the raw sessions of the given users
+    (everyone if None). Returns the number of rows written.
+    """
+    from api.models import FocusSession, FocusDailyRollup
+
+    rollups = FocusDailyRollup.objects.all()
+    sessions = FocusSession.objects.all()
+    if user_ids is not None:
+        rollups = rollups.filter(user_id__in=user_ids)
+        sessions = sessions.filter(user_id__in=user_ids)
+
+    rows = (
+        sessions.annotate(date=TruncDate('start_time'))
+        .values('user_id', 'date', 'tag', 'project_id')
+        .annotate(total_minutes=Sum('duration_minutes'), session_count=Count('id'))
+        .order_by()
+    )
+    written = 0
+    with transaction.atomic():
+        rollups.delete()
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(FocusDailyRollup(**row))
+            if len(batch) >= batch_size:
+                FocusDailyRollup.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            FocusDailyRollup.objects.bulk_create(batch)
+            written += len(batch)
+    if user_ids is None:
+        response_cache.invalidate_all()
+    else:
+        response_cache.invalidate(response_cache.USER, user_ids)
+    return written
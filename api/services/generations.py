@@ -0,0 +1,28 @@
+import uuid
+
+from django.db import transaction
+
+
+def new_token():
+    return uuid.uuid4().hex
+
+
+def start(cache, keys, value=new_token):
+    """
+    Starts new cache generations: stores a fresh value() under each of
+    `keys`, orphaning whatever was cached under the old ones. Nothing is
+    deleted, so this works the same for locmem, file and shared backends.
+
+    Done once more on commit: a request that read the old rows while the
+    writer's transaction was open may have cached them under the first new
+    generation.
+    """
+    keys = list(keys)
+    if not keys:
+        return
+
+    def bump():
+        cache.set_many({key: value() for key in keys}, None)
+
+    bump()
+    transaction.on_commit(bump)
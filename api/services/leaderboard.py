@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from api.services import generations
+
+LEADERBOARD_STATUSES = ('IN_PROGRESS', 'COMPLETED')
+
+_STATE_KEY = 'leaderboard:state'
+
+
+def _new_state():
+    return {'token': generations.new_token(), 'modified': timezone.now()}
+
+
+def _state():
+    """Current cache generation: a random token plus when it was started."""
+    state = cache.get(_STATE_KEY)
+    if state is None:
+        cache.add(_STATE_KEY, _new_state(), None)
+        state = cache.get(_STATE_KEY)
+    return state
+
+
+def invalidate():
+    """Starts a new cache generation (see generations.start)."""
+    generations.start(cache, [_STATE_KEY], _new_state)
+
+
+def get_page(page):
+    """
+    Returns a cached leaderboard page as a dict with `results`, `has_next`,
+    `etag` and `last_modified`. Pages are 1-based.
+    """
+    from api.models import Project
+    from api.serializers import CommunityProjectSerializer
+
+    state = _state()
+    key = f"leaderboard:{state['token']}:{page}"
+    entry = cache.get(key)
+    if entry is None:
+        size = settings.LEADERBOARD_PAGE_SIZE
+        offset = (page - 1) * size
+        projects = list(
+            Project.objects.filter(status__in=LEADERBOARD_STATUSES)
+            .select_related('user__profile')
+            .order_by('-progress', '-id')[offset:offset + size + 1]
+        )
+        entry = {
+            'results': list(CommunityProjectSerializer(projects[:size], many=True).data),
+            'has_next': len(projects) > size and page < settings.LEADERBOARD_MAX_PAGES,
+            'etag': f'"{state["token"]}-{page}"',
+            'last_modified': state['modified'],
+        }
+        cache.set(key, entry, settings.LEADERBOARD_CACHE_TIMEOUT)
+    return entry
+
+
+def affects_leaderboard(*statuses):
+    return any(status in LEADERBOARD_STATUSES for status in statuses)
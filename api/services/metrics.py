@@ -0,0 +1,160 @@
+import bisect
+import threading
+
+# Prometheus-style cumulative buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labelnames):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), sum, count.
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for key, (counts, total, count) in sorted(self.snapshot().items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{_labels(labels + [("le", _number(bound))])} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(labels)} {count}')
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for key, value in sorted(self.snapshot().items()):
+            lines.append(f'{self.name}{_labels(list(zip(self.labelnames, key)))} {_number(value)}')
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+def _number(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+request_duration = Histogram(
+    'http_request_duration_seconds', 'Wall time per request.', LATENCY_BUCKETS, ('route', 'method'),
+)
+request_queries = Histogram(
+    'http_request_db_queries', 'Database queries per request.', QUERY_COUNT_BUCKETS, ('route', 'method'),
+)
+request_db_time = Histogram(
+    'http_request_db_seconds', 'Time spent in the database per request.', LATENCY_BUCKETS, ('route', 'method'),
+)
+response_size = Histogram(
+    'http_response_size_bytes', 'Response body size (not measured for streams).', SIZE_BUCKETS, ('route', 'method'),
+)
+requests_total = Counter('http_requests_total', 'Requests by status code.', ('route', 'method', 'status'))
+# Written by api.models.DirtyFieldsMixin.
+model_saves = Counter(
+    'model_saves_total', 'Model saves by outcome (insert, full, partial, skipped).', ('model', 'outcome'),
+)
+model_columns_skipped = Counter(
+    'model_save_columns_skipped_total', 'Unchanged columns left out of partial saves.', ('model',),
+)
+
+# Written by api.services.response_cache.
+response_cache_lookups = Counter(
+    'response_cache_lookups_total', 'Response cache lookups by result (hit, miss).', ('view', 'result'),
+)
+
+METRICS = [request_duration, request_queries, request_db_time, response_size, requests_total, model_saves,
+           model_columns_skipped, response_cache_lookups]
+
+# Callables returning (name, type, help, value) tuples for gauges owned by
+# other modules, e.g. the token cache.
+_collectors = []
+
+
+def register_collector(collector):
+    if collector not in _collectors:
+        _collectors.append(collector)
+    return collector
+
+
+def observe_request(route, method, status_code, duration, queries, db_time, size=None):
+    request_duration.observe(duration, route=route, method=method)
+    request_queries.observe(queries, route=route, method=method)
+    request_db_time.observe(db_time, route=route, method=method)
+    if size is not None:
+        response_size.observe(size, route=route, method=method)
+    requests_total.inc(route=route, method=method, status=str(status_code))
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    for collector in _collectors:
+        for name, metric_type, help_text, value in collector():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}', f'{name} {_number(value)}']
+    return '\n'.join(lines) + '\n'
+
+
+def clear():
+    for metric in METRICS:
+        metric.clear()
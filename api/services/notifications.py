@@ -0,0 +1,91 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.NOTIFICATION_WORKERS,
+                thread_name_prefix='notifications',
+            )
+        return _executor
+
+
+def shutdown(wait=True):
+    """Drains the background fan-out queue (used on shutdown and in tests)."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def create_notifications(recipient_ids, actor_id, notification_type, message, community_id=None, batch_size=None):
+    """
+    Writes one Notification per recipient with batched bulk_create.
+    Returns the number of rows created.
+    """
+    from api.models import Notification
+    from api.services import events, unread
+
+    batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+    created = 0
+    for start in range(0, len(recipient_ids), batch_size):
+        recipients = recipient_ids[start:start + batch_size]
+        batch = [
+            Notification(
+                recipient_id=recipient_id,
+                actor_id=actor_id,
+                notification_type=notification_type,
+                message=message,
+                community_id=community_id,
+            )
+            for recipient_id in recipients
+        ]
+        with transaction.atomic():
+            Notification.objects.bulk_create(batch)
+            # bulk_create skips post_save: bump the unread counters and push
+            # to connected clients here.
+            unread.adjust(recipients, 1)
+            events.notifications_changed(recipients, [notification.pk for notification in batch if notification.pk])
+        created += len(batch)
+    return created
+
+
+def _create_in_worker(*args):
+    try:
+        with transaction.atomic():
+            create_notifications(*args)
+    except Exception:
+        logger.exception("Background notification fan-out failed")
+    finally:
+        # Worker threads hold their own connection; don't leak it.
+        connection.close()
+
+
+def notify_community(community, actor, notification_type, message):
+    """
+    Notifies every member of `community` except `actor`. Fan-outs of at least
+    NOTIFICATION_ASYNC_THRESHOLD recipients are written by a background worker
+    once the current transaction commits, so the request returns right away.
+    Returns the number of recipients.
+    """
+    recipient_ids = list(community.members.exclude(id=actor.id).values_list('id', flat=True))
+    args = (recipient_ids, actor.id, notification_type, message, community.id)
+    threshold = settings.NOTIFICATION_ASYNC_THRESHOLD
+    if threshold and len(recipient_ids) >= threshold:
+        transaction.on_commit(lambda: _get_executor().submit(_create_in_worker, *args))
+    else:
+        create_notifications(*args)
+    return len(recipient_ids)
@@ -1,53 +1,278 @@
-from django.db.models import Avg, Count, Case, When, IntegerField
+import threading
+from contextlib import contextmanager
 
-def recalculate_task_progress(task):
+from django.db.models import Avg, Count, F, OuterRef, Subquery
+from django.dispatch import Signal
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+_state = threading.local()
+
+# Sent with `instances` (the changed Task or Project rows) after a recompute,
+# since bulk_update bypasses post_save.
+progress_updated = Signal()
+
+# Sent after every flush with the `user_ids` owning the tasks and projects
+# the batch touched. Every Task/Subtask write (signals, bulk paths, raw
+# deletes) ends up in a batch, so this is where caches of the task tree are
+# invalidated.
+task_tree_changed = Signal()
+
+
+def _batch():
+    return getattr(_state, 'batch', None)
+
+
+class _ProgressBatch:
+    """Dirty task/project IDs collected while a batch is open."""
+
+    def __init__(self):
+        self.depth = 0
+        self.task_ids = set()
+        self.project_ids = set()
+        # Tasks whose subtask counters get recounted at flush time instead of
+        # being shifted row by row (see progress_batch(recount_counters=True)).
+        self.recount_counters = False
+        self.counter_task_ids = set()
+        # Live instances handed to the signals, keyed by pk, so the objects a
+        # view is about to serialize see the recomputed values.
+        self.tasks = {}
+        self.projects = {}
+
+    def add_task(self, task_id, instance=None):
+        self.task_ids.add(task_id)
+        if instance is not None:
+            self.tasks.setdefault(task_id, []).append(instance)
+
+    def add_project(self, project_id, instance=None):
+        self.project_ids.add(project_id)
+        if instance is not None:
+            self.projects.setdefault(project_id, []).append(instance)
+
+
+@contextmanager
+def progress_batch(recount_counters=False):
+    """
+    Defers progress recalculation until the outermost batch exits.
+    Signals only record which tasks/projects are dirty; everything is
+    recomputed at the end with a handful of grouped queries.
+
+    With `recount_counters`, subtask counters are also recounted once per
+    task at the end instead of being updated for every row; bulk writes
+    that bypass the signals use this through mark_counters_dirty().
     """
-    Recalculates the progress of a Task based on its Subtasks.
+    batch = _batch()
+    if batch is None:
+        batch = _state.batch = _ProgressBatch()
+    batch.recount_counters = batch.recount_counters or recount_counters
+    batch.depth += 1
+    try:
+        yield batch
+    finally:
+        batch.depth -= 1
+        if batch.depth == 0:
+            _state.batch = None
+    # Only flush on a clean exit; on errors the transaction is rolled back.
+    if batch.depth == 0:
+        _flush(batch)
+
+
+def mark_task_dirty(task_id, instance=None):
+    """
+    Schedules a Task for recalculation. Its Project follows automatically
+    if the task's progress changes.
+    """
+    if task_id is None:
+        return
+    with progress_batch() as batch:
+        batch.add_task(task_id, instance)
+
+
+def mark_counters_dirty(task_ids):
+    """Schedules a subtask counter recount (and progress recalculation)."""
+    with progress_batch(recount_counters=True) as batch:
+        batch.counter_task_ids.update(task_ids)
+        batch.task_ids.update(task_ids)
+
+
+def defer_counter_update(task_id):
+    """
+    Called by the Subtask signals: inside a recounting batch the counter
+    update is deferred to the flush. Returns True if it was deferred.
+    """
+    batch = _batch()
+    if batch is None or not batch.recount_counters:
+        return False
+    batch.counter_task_ids.add(task_id)
+    return True
+
+
+def mark_project_dirty(project_id, instance=None):
+    """Schedules a Project for recalculation."""
+    if project_id is None:
+        return
+    with progress_batch() as batch:
+        batch.add_project(project_id, instance)
+
+
+def _flush(batch):
+    if batch.counter_task_ids:
+        _recount_subtask_counters(batch.counter_task_ids)
+    owner_ids = set()
+    changed_tasks = recalculate_tasks(batch.task_ids, instances=batch.tasks, owner_ids=owner_ids)
+    project_ids = batch.project_ids | {task.project_id for task in changed_tasks}
+    recalculate_projects(project_ids, instances=batch.projects, owner_ids=owner_ids)
+    if owner_ids:
+        task_tree_changed.send(sender=None, user_ids=owner_ids)
+
+
+def _task_progress(task):
+    if task.subtask_total <= 0:
+        return 100.0 if task.completed else 0.0
+    return min(task.subtask_completed / task.subtask_total, 1.0) * 100.0
+
+
+def recalculate_tasks(task_ids, instances=None, owner_ids=None):
+    """
+    Recalculates the progress of several Tasks from their subtask counters.
     - If no subtasks: progress is 100 if completed, else 0.
     - If subtasks: progress is the percentage of completed subtasks.
+    Returns the tasks whose progress changed. The owners of all the tasks
+    are added to the `owner_ids` set, if given.
     """
-    subtasks = task.subtasks.all()
-    total = subtasks.count()
-    
-    if total == 0:
-        new_progress = 100.0 if task.completed else 0.0
-    else:
-        completed_count = subtasks.filter(completed=True).count()
-        new_progress = (completed_count / total) * 100.0
-    
-    # Only update if changed to avoid unnecessary recursion/signals
-    if abs(task.progress - new_progress) > 0.01:
+    if not task_ids:
+        return []
+    from api.models import Task
+
+    now = timezone.now()
+    changed = []
+    for task in Task.objects.filter(pk__in=task_ids).annotate(owner_id=F('project__user_id')):
+        if owner_ids is not None:
+            owner_ids.add(task.owner_id)
+        new_progress = _task_progress(task)
+        # Only update if changed to avoid unnecessary writes
+        if abs(task.progress - new_progress) <= 0.01:
+            continue
         task.progress = new_progress
-        # Auto-complete task if progress is 100 (optional but nice)
+        # Auto-complete task if progress is 100
         if new_progress == 100.0:
             task.completed = True
-        elif new_progress < 100.0 and total > 0:
-             # If it has subtasks and not 100%, it's not "completed" in the binary sense?
-             # User said: "Si no tiene subtareas, entonces sí es 0% o 100%."
-             # For now let's update completed status based on progress = 100
-             task.completed = False
-             
-        task.save()  # This triggers Task.post_save
+        elif task.subtask_total > 0:
+            task.completed = False
+        task.updated_at = now
+        changed.append(task)
 
-def recalculate_project_progress(project):
+    if changed:
+        Task.objects.bulk_update(changed, ['progress', 'completed', 'updated_at'])
+        _sync_instances(changed, instances, ['progress', 'completed', 'updated_at'])
+        progress_updated.send(sender=Task, instances=changed)
+    return changed
+
+
+def recalculate_projects(project_ids, instances=None, owner_ids=None):
     """
-    Recalculates the progress of a Project based on its Tasks.
+    Recalculates the progress of several Projects based on their Tasks.
     - Progress is the average of all tasks' progress.
+    Returns the projects whose progress changed; `owner_ids` as above.
     """
-    tasks = project.tasks.all()
-    if not tasks.exists():
-        new_progress = 0.0
-    else:
-        # User said: "El promedio del progreso de todas las tareas define el progreso del Proyecto."
-        aggregate = tasks.aggregate(avg_progress=Avg('progress'))
-        new_progress = aggregate['avg_progress'] or 0.0
-        
-    if abs(project.progress - new_progress) > 0.01:
+    if not project_ids:
+        return []
+    from api.models import Project, Task
+
+    averages = dict(
+        Task.objects.filter(project_id__in=project_ids)
+        .values_list('project_id')
+        .annotate(avg_progress=Avg('progress'))
+        .order_by()
+    )
+    now = timezone.now()
+    changed = []
+    for project in Project.objects.filter(pk__in=project_ids):
+        if owner_ids is not None:
+            owner_ids.add(project.user_id)
+        new_progress = averages.get(project.pk) or 0.0
+        if abs(project.progress - new_progress) <= 0.01:
+            continue
         project.progress = new_progress
         # Update status based on progress
         if new_progress == 100.0:
-             project.status = 'COMPLETED'
+            project.status = 'COMPLETED'
         elif new_progress > 0.0 and project.status == 'PENDING':
-             project.status = 'IN_PROGRESS'
-             
-        project.save()
+            project.status = 'IN_PROGRESS'
+        project.updated_at = now
+        changed.append(project)
+
+    if changed:
+        Project.objects.bulk_update(changed, ['progress', 'status', 'updated_at'])
+        _sync_instances(changed, instances, ['progress', 'status', 'updated_at'])
+        progress_updated.send(sender=Project, instances=changed)
+    return changed
+
+
+def _sync_instances(changed, instances, fields):
+    if not instances:
+        return
+    for obj in changed:
+        for instance in instances.get(obj.pk, ()):
+            for field in fields:
+                setattr(instance, field, getattr(obj, field))
+
+
+def recalculate_task_progress(task):
+    """Recalculates a single Task (and its Project), deferred if a batch is open."""
+    mark_task_dirty(task.pk, task)
+
+
+def recalculate_project_progress(project):
+    """Recalculates a single Project, deferred if a batch is open."""
+    mark_project_dirty(project.pk, project)
+
+
+def adjust_subtask_counters(task_id, total=0, completed=0):
+    """Atomically shifts a Task's subtask counters by the given deltas."""
+    if task_id is None or not (total or completed):
+        return
+    from api.models import Task
+
+    Task.objects.filter(pk=task_id).update(
+        subtask_total=F('subtask_total') + total,
+        subtask_completed=F('subtask_completed') + completed,
+    )
+
+
+def sync_subtask_counters(task_ids=None):
+    """
+    Recounts the subtask counters of the given Tasks (all if None), fixing
+    the ones that drifted. Returns the IDs of the tasks that were repaired;
+    their progress is recalculated as well.
+    """
+    drifted = _recount_subtask_counters(task_ids)
+    if drifted:
+        with progress_batch() as batch:
+            batch.task_ids.update(drifted)
+    return drifted
+
+
+def _recount_subtask_counters(task_ids):
+    from api.models import Task, Subtask
+
+    def count(**filters):
+        counts = (
+            Subtask.objects.filter(task=OuterRef('pk'), **filters)
+            .order_by().values('task').annotate(c=Count('pk')).values('c')
+        )
+        return Coalesce(Subquery(counts), 0)
+
+    tasks = Task.objects.all()
+    if task_ids is not None:
+        tasks = tasks.filter(pk__in=task_ids)
+    drifted = list(
+        tasks.annotate(real_total=count(), real_completed=count(completed=True))
+        .exclude(subtask_total=F('real_total'), subtask_completed=F('real_completed'))
+        .values_list('pk', flat=True)
+    )
+    if drifted:
+        Task.objects.filter(pk__in=drifted).update(
+            subtask_total=count(), subtask_completed=count(completed=True),
+        )
+    return drifted
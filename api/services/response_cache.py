@@ -0,0 +1,110 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from api.services import generations, metrics
+
+# Scopes whose generation is part of an entry's key. A user's scope covers
+# their projects, task tree and focus reports; a community's covers its
+# members, shared projects, tasks and notes.
+USER = 'user'
+COMMUNITY = 'community'
+
+_GLOBAL_KEY = 'resp:gen'
+
+_lock = threading.Lock()
+_hits = _misses = 0
+
+
+def _cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def is_shared():
+    """False for LocMemCache, whose entries and invalidations stay in one process."""
+    return not isinstance(_cache(), LocMemCache)
+
+
+def _generation_key(scope, object_id):
+    return f'resp:gen:{scope}:{object_id}'
+
+
+def _generations(keys):
+    """
+    Current token of each generation key, starting the missing ones. Like
+    the leaderboard, nothing is ever deleted: stale entries are simply never
+    read again and age out of the LRU.
+    """
+    cache = _cache()
+    tokens = cache.get_many(keys)
+    missing = [key for key in keys if key not in tokens]
+    if missing:
+        for key in missing:
+            cache.add(key, generations.new_token(), None)
+        tokens.update(cache.get_many(missing))
+    return [tokens.get(key, '') for key in keys]
+
+
+def key_for(user_id, path, scopes):
+    """Entry key for `user_id` fetching `path`, under the given (scope, id) pairs."""
+    keys = [_GLOBAL_KEY] + [_generation_key(scope, object_id) for scope, object_id in scopes]
+    digest = hashlib.md5(path.encode(), usedforsecurity=False).hexdigest()
+    return f"resp:{':'.join(_generations(keys))}:{user_id}:{digest}"
+
+
+def get(key, view):
+    """Cached data for `key` or None; counts the lookup for `view`."""
+    global _hits, _misses
+    data = _cache().get(key)
+    hit = data is not None
+    with _lock:
+        if hit:
+            _hits += 1
+        else:
+            _misses += 1
+    metrics.response_cache_lookups.inc(view=view, result='hit' if hit else 'miss')
+    return data
+
+
+def store(key, data):
+    _cache().set(key, data, settings.RESPONSE_CACHE_TIMEOUT)
+
+
+def invalidate(scope, object_ids):
+    """Starts a new generation for each object, orphaning its entries."""
+    generations.start(
+        _cache(), [_generation_key(scope, object_id) for object_id in set(object_ids) if object_id is not None],
+    )
+
+
+def invalidate_all():
+    generations.start(_cache(), [_GLOBAL_KEY])
+
+
+def invalidate_shared_projects(shared_project_ids):
+    """Invalidates the communities the given shared projects belong to."""
+    from api.models import SharedProject
+
+    shared_project_ids = [pk for pk in shared_project_ids if pk is not None]
+    if shared_project_ids:
+        invalidate(COMMUNITY, SharedProject.objects.filter(pk__in=shared_project_ids).values_list('community_id', flat=True))
+
+
+def stats():
+    with _lock:
+        lookups = _hits + _misses
+        return {'hits': _hits, 'misses': _misses, 'hit_ratio': _hits / lookups if lookups else 0.0}
+
+
+def reset_stats():
+    global _hits, _misses
+    with _lock:
+        _hits = _misses = 0
+
+
+@metrics.register_collector
+def response_cache_metrics():
+    return [('response_cache_hit_ratio', 'gauge', 'Response cache hits over lookups.', stats()['hit_ratio'])]
@@ -0,0 +1,207 @@
+import html
+import re
+
+from django.conf import settings
+from django.db import connection
+
+TABLE = 'api_search_index'
+
+NOTE = 'note'
+SHARED_NOTE = 'shared_note'
+
+# Highlight markers used inside the database; the text around them is
+# escaped before they are swapped for <mark> tags.
+_START, _STOP = '\x02', '\x03'
+
+
+def _highlight(text):
+    if not text:
+        return ''
+    return html.escape(text).replace(_START, '<mark>').replace(_STOP, '</mark>')
+
+
+def _row(kind, obj):
+    """Index columns for a Note or SharedNote."""
+    if kind == NOTE:
+        return {
+            'kind': kind, 'object_id': obj.pk, 'title': obj.title, 'content': obj.content or '',
+            'user_id': obj.user_id, 'community_id': None, 'project_id': None,
+        }
+    return {
+        'kind': kind, 'object_id': obj.pk, 'title': obj.title, 'content': obj.content or '',
+        'user_id': None, 'community_id': obj.project.community_id, 'project_id': obj.project_id,
+    }
+
+
+class SQLiteSearchBackend:
+    """
+    FTS5 virtual table. The rowid encodes the source row (note id * 2, shared
+    note id * 2 + 1) so updates and deletes are rowid lookups.
+    """
+
+    def _rowid(self, kind, object_id):
+        return object_id * 2 + (kind == SHARED_NOTE)
+
+    def index(self, rows):
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [
+                (self._rowid(row['kind'], row['object_id']),) for row in rows
+            ])
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (rowid, title, content, kind, object_id, user_id, community_id, project_id) '
+                'VALUES (%s, %s, %s, %s, %s, %s, %s, %s)',
+                [
+                    (self._rowid(row['kind'], row['object_id']), row['title'], row['content'], row['kind'],
+                     row['object_id'], row['user_id'], row['community_id'], row['project_id'])
+                    for row in rows
+                ],
+            )
+
+    def remove(self, kind, object_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [
+                (self._rowid(kind, object_id),) for object_id in object_ids
+            ])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE}')
+
+    def _match(self, query):
+        # Every word must match, as a prefix; quoting keeps FTS5 operators
+        # in user input from being interpreted.
+        words = re.findall(r'\w+', query)
+        return ' '.join(f'"{word}"*' for word in words)
+
+    def search(self, query, user_id, community_ids, limit, offset):
+        match = self._match(query)
+        if not match:
+            return []
+        placeholders = ', '.join(['%s'] * len(community_ids)) or 'NULL'
+        sql = (
+            f"SELECT kind, object_id, project_id, highlight({TABLE}, 0, %s, %s), "
+            f"snippet({TABLE}, 1, %s, %s, '…', 24), bm25({TABLE}, 10.0, 1.0) AS score "
+            f"FROM {TABLE} WHERE {TABLE} MATCH %s "
+            f"AND ((kind = %s AND user_id = %s) OR (kind = %s AND community_id IN ({placeholders}))) "
+            "ORDER BY score, rowid LIMIT %s OFFSET %s"
+        )
+        params = [_START, _STOP, _START, _STOP, match, NOTE, user_id, SHARED_NOTE, *community_ids, limit, offset]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            # bm25() is lower-is-better; flip it so higher ranks first.
+            return [(kind, pk, project, title, snippet, -score)
+                    for kind, pk, project, title, snippet, score in cursor.fetchall()]
+
+
+class PostgresSearchBackend:
+    """Plain table with a weighted tsvector column and a GIN index."""
+
+    def _document(self):
+        config = settings.SEARCH_TEXT_CONFIG
+        return (
+            f"setweight(to_tsvector('{config}', %s), 'A') || "
+            f"setweight(to_tsvector('{config}', %s), 'B')"
+        )
+
+    def index(self, rows):
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (kind, object_id, title, content, user_id, community_id, project_id, document) '
+                f'VALUES (%s, %s, %s, %s, %s, %s, %s, {self._document()}) '
+                'ON CONFLICT (kind, object_id) DO UPDATE SET title = EXCLUDED.title, '
+                'content = EXCLUDED.content, user_id = EXCLUDED.user_id, '
+                'community_id = EXCLUDED.community_id, project_id = EXCLUDED.project_id, '
+                'document = EXCLUDED.document',
+                [
+                    (row['kind'], row['object_id'], row['title'], row['content'], row['user_id'],
+                     row['community_id'], row['project_id'], row['title'], row['content'])
+                    for row in rows
+                ],
+            )
+
+    def remove(self, kind, object_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE} WHERE kind = %s AND object_id = ANY(%s)', [kind, list(object_ids)])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {TABLE}')
+
+    def search(self, query, user_id, community_ids, limit, offset):
+        config = settings.SEARCH_TEXT_CONFIG
+        options = f'StartSel={_START}, StopSel={_STOP}, MaxWords=24, MinWords=8'
+        sql = (
+            f"SELECT kind, object_id, project_id, "
+            f"ts_headline('{config}', title, q, %s), ts_headline('{config}', content, q, %s), "
+            f"ts_rank_cd(document, q) AS score "
+            f"FROM {TABLE}, websearch_to_tsquery('{config}', %s) q WHERE document @@ q "
+            "AND ((kind = %s AND user_id = %s) OR (kind = %s AND community_id = ANY(%s))) "
+            "ORDER BY score DESC, kind, object_id LIMIT %s OFFSET %s"
+        )
+        params = [options + ', HighlightAll=true', options, query, NOTE, user_id, SHARED_NOTE,
+                  list(community_ids), limit, offset]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+def get_backend():
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return SQLiteSearchBackend()
+
+
+def index_notes(notes):
+    get_backend().index([_row(NOTE, note) for note in notes])
+
+
+def index_shared_notes(shared_notes):
+    get_backend().index([_row(SHARED_NOTE, note) for note in shared_notes])
+
+
+def remove(kind, object_ids):
+    get_backend().remove(kind, object_ids)
+
+
+def search(user, query, limit, offset):
+    """
+    Ranked matches among the user's notes and the shared notes of their
+    communities, as dicts with highlighted `title` and `snippet`.
+    """
+    community_ids = list(user.communities.values_list('pk', flat=True))
+    rows = get_backend().search(query, user.pk, community_ids, limit, offset)
+    return [
+        {
+            'type': kind,
+            'id': object_id,
+            'shared_project': project_id,
+            'title': _highlight(title),
+            'snippet': _highlight(snippet),
+            'rank': score,
+        }
+        for kind, object_id, project_id, title, snippet, score in rows
+    ]
+
+
+def rebuild(batch_size=1000):
+    """Rebuilds the whole index from Note and SharedNote. Returns the row count."""
+    from api.models import Note, SharedNote
+
+    backend = get_backend()
+    backend.clear()
+    indexed = 0
+    for kind, queryset in ((NOTE, Note.objects.all()), (SHARED_NOTE, SharedNote.objects.select_related('project'))):
+        batch = []
+        for obj in queryset.order_by('pk').iterator(chunk_size=batch_size):
+            batch.append(_row(kind, obj))
+            if len(batch) >= batch_size:
+                backend.index(batch)
+                indexed += len(batch)
+                batch = []
+        backend.index(batch)
+        indexed += len(batch)
+    return indexed
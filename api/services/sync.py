@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+# model label -> (owner attribute, parent attribute) read off the deleted row
+TOMBSTONE_FIELDS = {
+    'project': ('user_id', None),
+    'task': (None, 'project_id'),
+    'subtask': (None, 'task_id'),
+    'note': ('user_id', None),
+    'focus_session': ('user_id', None),
+    'notification': ('recipient_id', None),
+}
+
+
+def record_deletion(label, instance):
+    """Writes a Tombstone for a deleted row. Costs one INSERT, no lookups."""
+    from api.models import Tombstone
+
+    owner_attr, parent_attr = TOMBSTONE_FIELDS[label]
+    Tombstone.objects.create(
+        model=label,
+        object_id=instance.pk,
+        owner_id=getattr(instance, owner_attr) if owner_attr else None,
+        parent_id=getattr(instance, parent_attr) if parent_attr else None,
+    )
+
+
+def record_deletions(label, instances):
+    """record_deletion() for rows removed without signals, in one INSERT."""
+    from api.models import Tombstone
+
+    owner_attr, parent_attr = TOMBSTONE_FIELDS[label]
+    Tombstone.objects.bulk_create([
+        Tombstone(
+            model=label,
+            object_id=instance.pk,
+            owner_id=getattr(instance, owner_attr) if owner_attr else None,
+            parent_id=getattr(instance, parent_attr) if parent_attr else None,
+        )
+        for instance in instances
+    ])
+
+
+def retention_cutoff():
+    return timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+
+
+def deleted_since(user, since):
+    """{label: [ids]} of the user's rows deleted after `since`."""
+    from api.models import Project, Task, Tombstone
+
+    tombstones = Tombstone.objects.filter(deleted_at__gt=since).filter(
+        Q(owner_id=user.pk)
+        | Q(model='task', parent_id__in=Project.objects.filter(user=user).values('pk'))
+        | Q(model='subtask', parent_id__in=Task.objects.filter(project__user=user).values('pk'))
+    )
+    deleted = {label: [] for label in TOMBSTONE_FIELDS}
+    for label, object_id in tombstones.values_list('model', 'object_id').order_by('deleted_at'):
+        deleted[label].append(object_id)
+    return deleted
+
+
+def prune_tombstones():
+    """Drops tombstones older than the retention window. Returns the count."""
+    from api.models import Tombstone
+
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=retention_cutoff()).delete()
+    return deleted
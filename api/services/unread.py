@@ -0,0 +1,83 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+UNREAD_STATUS = 'pending'
+
+
+def _pending_count(user_ref='pk'):
+    from api.models import Notification
+
+    counts = (
+        Notification.objects.filter(recipient=OuterRef(user_ref), status=UNREAD_STATUS)
+        .order_by().values('recipient').annotate(c=Count('pk')).values('c')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+def adjust(user_ids, delta):
+    """
+    Atomically shifts the unread counters of `user_ids` by `delta`. Users
+    without a counter row are skipped; theirs is counted on first read.
+    """
+    from api.models import UnreadCounter
+
+    if not delta or not user_ids:
+        return
+    UnreadCounter.objects.filter(user_id__in=set(user_ids)).update(count=F('count') + delta)
+
+
+def counts(user_ids):
+    """Unread counts keyed by user id: one primary-key lookup per call."""
+    from api.models import UnreadCounter
+
+    user_ids = set(user_ids)
+    result = dict(UnreadCounter.objects.filter(user_id__in=user_ids).values_list('user_id', 'count'))
+    missing = user_ids - result.keys()
+    if missing:
+        result.update(_create_counters(missing))
+    return result
+
+
+def get_count(user_id):
+    return counts([user_id])[user_id]
+
+
+def _create_counters(user_ids):
+    from django.contrib.auth import get_user_model
+    from api.models import UnreadCounter
+
+    real = dict(
+        get_user_model().objects.filter(pk__in=user_ids)
+        .annotate(real=_pending_count()).values_list('pk', 'real')
+    )
+    UnreadCounter.objects.bulk_create(
+        [UnreadCounter(user_id=user_id, count=count) for user_id, count in real.items()],
+        ignore_conflicts=True,
+    )
+    return {user_id: real.get(user_id, 0) for user_id in user_ids}
+
+
+def reconcile(user_ids=None):
+    """
+    Recounts the unread counters of the given users (all if None), creating
+    missing ones. Returns the IDs of the users whose counter was repaired.
+    """
+    from django.contrib.auth import get_user_model
+    from api.models import UnreadCounter
+
+    users = get_user_model().objects.all()
+    counters = UnreadCounter.objects.all()
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+        counters = counters.filter(user_id__in=user_ids)
+    missing = list(users.filter(unread_counter__isnull=True).values_list('pk', flat=True))
+    if missing:
+        _create_counters(missing)
+    drifted = list(
+        counters.annotate(real=_pending_count('user_id'))
+        .exclude(count=F('real'))
+        .values_list('user_id', flat=True)
+    )
+    if drifted:
+        UnreadCounter.objects.filter(user_id__in=drifted).update(count=_pending_count('user_id'))
+    return missing + drifted
@@ -0,0 +1,226 @@
+import csv
+import itertools
+import json
+from collections import namedtuple
+from datetime import date, datetime
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from api.services import focus, leaderboard, search
+from api.services.chunks import chunked
+from api.services.progress import mark_counters_dirty, mark_project_dirty, progress_batch
+
+FORMAT_VERSION = 1
+
+# Exports are flushed to the client in pieces of about this many characters.
+STREAM_BUFFER_SIZE = 64 * 1024
+
+Kind = namedtuple('Kind', 'model owner fields parent')
+
+# Export order: parents always come before their children, which lets the
+# import remap ids in a single pass. `parent` is (attname, parent kind).
+KINDS = {
+    'project': Kind(
+        'Project', 'user', ('id', 'name', 'description', 'status', 'progress', 'created_at', 'updated_at'), None,
+    ),
+    'task': Kind(
+        'Task', 'project__user', ('id', 'project_id', 'title', 'completed', 'progress', 'created_at', 'updated_at'),
+        ('project_id', 'project'),
+    ),
+    'subtask': Kind(
+        'Subtask', 'task__project__user', ('id', 'task_id', 'title', 'completed', 'created_at', 'updated_at'),
+        ('task_id', 'task'),
+    ),
+    'note': Kind('Note', 'user', ('id', 'title', 'content', 'note_type', 'created_at', 'updated_at'), None),
+    'focus_session': Kind(
+        'FocusSession', 'user',
+        ('id', 'project_id', 'tag', 'start_time', 'end_time', 'duration_minutes', 'is_completed'),
+        ('project_id', 'project'),
+    ),
+}
+
+
+def _model(kind):
+    return apps.get_model('api', KINDS[kind].model)
+
+
+def export_rows(user, kinds, chunk_size):
+    """
+    (kind, row) pairs for everything `user` owns, as plain values() dicts
+    read `chunk_size` rows at a time.
+    """
+    for kind in kinds:
+        spec = KINDS[kind]
+        rows = _model(kind).objects.filter(**{spec.owner: user}).order_by('pk').values(*spec.fields)
+        for row in rows.iterator(chunk_size=chunk_size):
+            yield kind, row
+
+
+class _Encoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder rounds to milliseconds; exports keep microseconds.
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _buffered(pieces):
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= STREAM_BUFFER_SIZE:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def export_ndjson(user, kinds, chunk_size):
+    """A meta line, then one JSON object per row tagged with its `type`."""
+    meta = {'type': 'meta', 'version': FORMAT_VERSION, 'exported_at': timezone.now()}
+    objects = itertools.chain([meta], ({'type': kind, **row} for kind, row in export_rows(user, kinds, chunk_size)))
+    return _buffered(json.dumps(obj, cls=_Encoder, ensure_ascii=False) + '\n' for obj in objects)
+
+
+class _Echo:
+    """File-like object whose write() hands the formatted line back."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def export_csv(user, kinds, chunk_size):
+    """One table: a `type` column plus the union of the kinds' columns."""
+    columns = ['type'] + list(dict.fromkeys(field for kind in kinds for field in KINDS[kind].fields))
+    writer = csv.DictWriter(_Echo(), fieldnames=columns)
+    lines = (
+        writer.writerow({'type': kind, **{key: _csv_value(value) for key, value in row.items()}})
+        for kind, row in export_rows(user, kinds, chunk_size)
+    )
+    return _buffered(itertools.chain([writer.writeheader()], lines))
+
+
+class _Importer:
+    def __init__(self, user, batch_size):
+        self.user = user
+        self.batch_size = batch_size
+        self.counts = dict.fromkeys(KINDS, 0)
+        # Old id -> new id, for the kinds other rows point at.
+        self.id_maps = {'project': {}, 'task': {}}
+        self.pending_kind = None
+        self.pending = []
+
+    def add(self, number, data):
+        kind = data.pop('type', None)
+        if kind == 'meta':
+            if data.get('version') != FORMAT_VERSION:
+                raise ValidationError(f"Line {number}: unsupported export version {data.get('version')!r}.")
+            return
+        if kind not in KINDS:
+            raise ValidationError(f"Line {number}: unknown type {kind!r}.")
+        # Rows are written per kind, so a child only ever refers to parents
+        # that already have their new id.
+        if kind != self.pending_kind or len(self.pending) >= self.batch_size:
+            self.flush()
+            self.pending_kind = kind
+        self.pending.append((data.get('id'), self.build(number, kind, data)))
+
+    def build(self, number, kind, data):
+        spec = KINDS[kind]
+        values = {field: data[field] for field in spec.fields if field != 'id' and field in data}
+        exclude = ['user']
+        if spec.parent is not None:
+            attname, parent_kind = spec.parent
+            old_id = values.pop(attname, None)
+            new_id = self.id_maps[parent_kind].get(old_id)
+            # Focus sessions may outlive their project; nothing else may.
+            if new_id is None and kind != 'focus_session':
+                raise ValidationError(f"Line {number}: unknown {parent_kind} {old_id!r}.")
+            values[attname] = new_id
+            exclude.append(parent_kind)
+        if spec.owner == 'user':
+            values['user'] = self.user
+        obj = _model(kind)(**values)
+        try:
+            obj.clean_fields(exclude=exclude)
+        except ValidationError as exc:
+            errors = '; '.join(f"{field}: {' '.join(messages)}" for field, messages in exc.message_dict.items())
+            raise ValidationError(f"Line {number}: {errors}")
+        return obj
+
+    def flush(self):
+        if not self.pending:
+            return
+        kind, model = self.pending_kind, _model(self.pending_kind)
+        objs = [obj for _, obj in self.pending]
+        # bulk_create stamps auto_now_add fields with now(); put the exported
+        # values back afterwards.
+        historical = [
+            f.attname for f in model._meta.concrete_fields
+            if getattr(f, 'auto_now_add', False) and f.attname in KINDS[kind].fields
+        ]
+        kept = [{field: getattr(obj, field) for field in historical} for obj in objs]
+        model.objects.bulk_create(objs)
+        restored = []
+        for obj, values in zip(objs, kept):
+            values = {field: value for field, value in values.items() if value is not None}
+            if values:
+                for field, value in values.items():
+                    setattr(obj, field, value)
+                restored.append(obj)
+        if restored:
+            model.objects.bulk_update(restored, historical)
+
+        if kind in self.id_maps:
+            self.id_maps[kind].update((old_id, obj.pk) for old_id, obj in self.pending if old_id is not None)
+        if kind == 'note':
+            search.index_notes(objs)
+        self.counts[kind] += len(objs)
+        self.pending = []
+
+    def finish(self):
+        self.flush()
+        # Counters, progress and rollups are recomputed rather than trusted.
+        for chunk in chunked(list(self.id_maps['task'].values())):
+            mark_counters_dirty(chunk)
+        for chunk in chunked(list(self.id_maps['project'].values())):
+            with progress_batch():
+                for project_id in chunk:
+                    mark_project_dirty(project_id)
+        if self.counts['focus_session']:
+            focus.rebuild_rollups([self.user.pk])
+        if self.counts['project']:
+            leaderboard.invalidate()
+        return self.counts
+
+
+def import_ndjson(user, lines, batch_size):
+    """
+    Adds the rows of an export_ndjson() stream to `user`'s workspace as new
+    objects, `batch_size` rows per bulk_create, all in one transaction.
+    Lines are consumed as they come; only the old -> new id maps of projects
+    and tasks are kept. Returns the number of rows imported per kind and
+    raises ValidationError naming the first bad line.
+    """
+    importer = _Importer(user, batch_size)
+    with transaction.atomic():
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                raise ValidationError(f"Line {number}: invalid JSON.")
+            if not isinstance(data, dict):
+                raise ValidationError(f"Line {number}: expected an object.")
+            importer.add(number, data)
+        return importer.finish()
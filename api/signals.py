@@ -1,8 +1,19 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import pre_save, pre_delete, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Task, Subtask, Profile
-from .services.progress import recalculate_task_progress, recalculate_project_progress
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from .authentication import token_cache
+from django.db.models import Q
+from .models import (
+    Project, Task, Subtask, Profile, FocusSession, Note, Community, SharedProject, SharedTask, SharedNote,
+    Notification, UnreadCounter,
+)
+from .services import events, focus, leaderboard, response_cache, search, sync, unread
+from .services.progress import (
+    progress_batch, mark_task_dirty, mark_project_dirty, adjust_subtask_counters,
+    defer_counter_update, progress_updated, task_tree_changed,
+)
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -10,38 +21,288 @@ def create_user_profile(sender, instance, created, **kwargs):
         Profile.objects.get_or_create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+def create_unread_counter(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UnreadCounter.objects.get_or_create(user=instance)
+
+@receiver(post_save, sender=User)
+def ensure_user_profile(sender, instance, created, raw=False, update_fields=None, **kwargs):
     # For legacy users without a profile, we ensure it exists
-    # instead of crashing with RelatedObjectDoesNotExist
+    # instead of crashing with RelatedObjectDoesNotExist. Nothing on the
+    # profile changes with the user, so it is never re-saved here.
+    if created or raw or update_fields is not None:
+        return
     if not hasattr(instance, 'profile'):
         Profile.objects.create(user=instance)
-    else:
-        instance.profile.save()
+
+@receiver(pre_save, sender=User)
+def user_rename_check(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance._state.adding or (update_fields is not None and 'username' not in update_fields):
+        instance._renamed = False
+        return
+    instance._renamed = User.objects.filter(pk=instance.pk).exclude(username=instance.username).exists()
+
+@receiver(post_save, sender=User)
+def user_renamed_profile(sender, instance, **kwargs):
+    # Usernames are shown next to the profile; bumping its updated_at
+    # changes the ETags of the views that list it (see ConditionalGetMixin).
+    if getattr(instance, '_renamed', False):
+        Profile.objects.filter(user=instance).update(updated_at=timezone.now())
+
+@receiver(pre_save, sender=Subtask)
+def subtask_counters_pre_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    if defer_counter_update(instance.task_id):
+        if instance.has_changed('task_id'):
+            defer_counter_update(instance.previous_value('task_id'))
+            mark_task_dirty(instance.previous_value('task_id'))
+        return
+    if instance.has_changed('task_id'):
+        # Moved to another task: shift the counters from the old one.
+        old_task_id = instance.previous_value('task_id')
+        was_completed = int(bool(instance.previous_value('completed')))
+        adjust_subtask_counters(old_task_id, total=-1, completed=-was_completed)
+        adjust_subtask_counters(instance.task_id, total=1, completed=int(instance.completed))
+        mark_task_dirty(old_task_id)
+        return
+    if update_fields is not None and 'completed' not in update_fields:
+        return
+    # Compare-and-set on the row itself: only the request that actually
+    # flips `completed` moves the counter, however stale its instance is.
+    flipped = Subtask.objects.filter(pk=instance.pk).exclude(
+        completed=instance.completed
+    ).update(completed=instance.completed)
+    if flipped:
+        adjust_subtask_counters(instance.task_id, completed=1 if instance.completed else -1)
+
+@receiver(pre_delete, sender=Subtask)
+def subtask_counters_pre_delete(sender, instance, **kwargs):
+    if defer_counter_update(instance.task_id):
+        return
+    # The same compare-and-set as on save, in the delete's transaction: the
+    # row, not the loaded instance, says whether it still counts as completed.
+    if Subtask.objects.filter(pk=instance.pk, completed=True).update(completed=False):
+        adjust_subtask_counters(instance.task_id, completed=-1)
 
 @receiver(post_save, sender=Subtask)
 @receiver(post_delete, sender=Subtask)
 def subtask_changed(sender, instance, **kwargs):
-    recalculate_task_progress(instance.task)
+    if kwargs.get('raw') or defer_counter_update(instance.task_id):
+        pass
+    elif kwargs.get('signal') == post_delete:
+        adjust_subtask_counters(instance.task_id, total=-1)
+    elif kwargs.get('created'):
+        adjust_subtask_counters(instance.task_id, total=1, completed=int(instance.completed))
+    # Only mark the parent task as dirty; the recalculation runs once
+    # per batch (see services.progress.progress_batch).
+    mark_task_dirty(instance.task_id)
 
 @receiver(post_save, sender=Task)
 @receiver(post_delete, sender=Task)
 def task_changed(sender, instance, **kwargs):
-    # If the task was just deleted, we don't recalculate its own progress
-    # because it doesn't exist anymore and save() would fail.
-    # We only update the project progress.
-    if kwargs.get('created') is not None or 'update_fields' in kwargs or sender.objects.filter(pk=instance.pk).exists():
-        # This is a safe way to check if it's NOT a deletion or if it still exists
-        # Actually post_save has 'created', post_delete does not.
-        pass
+    with progress_batch():
+        # A deleted task can't be recalculated, only its project.
+        if kwargs.get('signal') == post_save:
+            mark_task_dirty(instance.pk, instance)
+        mark_project_dirty(instance.project_id)
 
-    # Better approach:
-    if kwargs.get('signal') == post_save:
-         recalculate_task_progress(instance)
-    
-    # Always update project (if it exists)
-    try:
-        if instance.project:
-            recalculate_project_progress(instance.project)
-    except Exception:
-        # Project might have been deleted too (cascade)
-        pass
+
+@receiver(post_save, sender=Project)
+def project_saved_leaderboard(sender, instance, created, **kwargs):
+    changed = created or any(instance.has_changed(f) for f in ('name', 'status', 'progress'))
+    if changed and leaderboard.affects_leaderboard(instance.status, instance.previous_value('status')):
+        leaderboard.invalidate()
+
+@receiver(post_delete, sender=Project)
+def project_deleted_leaderboard(sender, instance, **kwargs):
+    if leaderboard.affects_leaderboard(instance.status):
+        leaderboard.invalidate()
+
+@receiver(progress_updated, sender=Project)
+def project_progress_leaderboard(sender, instances, **kwargs):
+    if leaderboard.affects_leaderboard(*(p.status for p in instances)):
+        leaderboard.invalidate()
+
+@receiver(post_save, sender=Profile)
+def profile_saved_leaderboard(sender, instance, **kwargs):
+    if instance.has_changed('display_name'):
+        leaderboard.invalidate()
+
+
+@receiver(post_save, sender=FocusSession)
+def focus_session_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        focus.add_session(instance)
+    elif any(instance.has_changed(f) for f in FocusSession.rollup_fields):
+        focus.remove_previous_session(instance)
+        focus.add_session(instance)
+
+@receiver(post_delete, sender=FocusSession)
+def focus_session_deleted(sender, instance, **kwargs):
+    focus.add_session(instance, sign=-1)
+
+@receiver(pre_delete, sender=Project)
+def project_deleted_focus(sender, instance, **kwargs):
+    focus.detach_project(instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed_token_cache(sender, instance, **kwargs):
+    # Password changes, deactivation and deletion all go through here.
+    token_cache.invalidate_user(instance.pk)
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+TOMBSTONE_LABELS = {
+    Project: 'project',
+    Task: 'task',
+    Subtask: 'subtask',
+    Note: 'note',
+    FocusSession: 'focus_session',
+    Notification: 'notification',
+}
+
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Subtask)
+@receiver(post_delete, sender=Note)
+@receiver(post_delete, sender=FocusSession)
+@receiver(post_delete, sender=Notification)
+def record_tombstone(sender, instance, **kwargs):
+    sync.record_deletion(TOMBSTONE_LABELS[sender], instance)
+
+
+def _is_unread(status):
+    return int(status == unread.UNREAD_STATUS)
+
+@receiver(pre_save, sender=Notification)
+def unread_counter_pre_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    if instance.has_changed('recipient_id'):
+        old_recipient_id = instance.previous_value('recipient_id')
+        unread.adjust([old_recipient_id], -_is_unread(instance.previous_value('status')))
+        unread.adjust([instance.recipient_id], _is_unread(instance.status))
+        events.notifications_changed([old_recipient_id])
+        return
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    # Compare-and-set on the row, as for Subtask.completed: of several
+    # requests accepting/reading the same notification only one moves the
+    # counter.
+    rows = Notification.objects.filter(pk=instance.pk)
+    if instance.status == unread.UNREAD_STATUS:
+        if rows.exclude(status=instance.status).update(status=instance.status):
+            unread.adjust([instance.recipient_id], 1)
+    elif rows.filter(status=unread.UNREAD_STATUS).update(status=instance.status):
+        unread.adjust([instance.recipient_id], -1)
+
+@receiver(post_save, sender=Notification)
+def notification_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        unread.adjust([instance.recipient_id], _is_unread(instance.status))
+    events.notifications_changed([instance.recipient_id], [instance.pk] if created else ())
+
+@receiver(pre_delete, sender=Notification)
+def unread_counter_pre_delete(sender, instance, **kwargs):
+    # Same compare-and-set as for a status change, run in the delete's
+    # transaction: of a delete racing accept/mark_read only the one that
+    # takes the row out of pending decrements, whatever the loaded status.
+    rows = Notification.objects.filter(pk=instance.pk, status=unread.UNREAD_STATUS)
+    if rows.update(status='read'):
+        unread.adjust([instance.recipient_id], -1)
+
+@receiver(post_delete, sender=Notification)
+def notification_deleted(sender, instance, **kwargs):
+    events.notifications_changed([instance.recipient_id])
+
+
+@receiver(post_save, sender=Note)
+def note_saved_search(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_notes([instance])
+
+@receiver(post_save, sender=SharedNote)
+def shared_note_saved_search(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_shared_notes([instance])
+
+@receiver(post_delete, sender=Note)
+@receiver(post_delete, sender=SharedNote)
+def note_deleted_search(sender, instance, **kwargs):
+    search.remove(search.NOTE if sender is Note else search.SHARED_NOTE, [instance.pk])
+
+
+@receiver(m2m_changed, sender=Community.members.through)
+def community_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Membership lives in the through table, so the community's updated_at
+    # (and with it its ETag) has to be bumped by hand.
+    if not reverse:
+        community_ids = [instance.pk] if action in ('post_add', 'post_remove', 'post_clear') else ()
+    elif action in ('post_add', 'post_remove'):
+        community_ids = pk_set
+    elif action == 'pre_clear':
+        community_ids = list(instance.communities.values_list('pk', flat=True))
+    else:
+        community_ids = ()
+    if community_ids:
+        Community.objects.filter(pk__in=community_ids).update(updated_at=timezone.now())
+        response_cache.invalidate(response_cache.COMMUNITY, community_ids)
+
+
+# Response cache: each write starts a new generation of the user and/or
+# community scopes whose cached responses show the changed rows.
+
+def _invalidate_user_responses(user_id):
+    response_cache.invalidate(response_cache.USER, [user_id])
+    response_cache.invalidate(response_cache.COMMUNITY, Community.objects.filter(
+        Q(members=user_id) | Q(owner=user_id)
+    ).values_list('pk', flat=True).distinct())
+
+@receiver(post_save, sender=User)
+def user_saved_response_cache(sender, instance, created, update_fields=None, **kwargs):
+    # Usernames are shown on projects and communities; logins only touch last_login.
+    if created:
+        response_cache.invalidate(response_cache.USER, [instance.pk])
+    elif update_fields is None or 'username' in update_fields:
+        _invalidate_user_responses(instance.pk)
+
+@receiver(post_save, sender=Profile)
+def profile_saved_response_cache(sender, instance, **kwargs):
+    if instance.has_changed('display_name'):
+        _invalidate_user_responses(instance.user_id)
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def project_changed_response_cache(sender, instance, **kwargs):
+    response_cache.invalidate(response_cache.USER, [instance.user_id, instance.previous_value('user_id')])
+
+@receiver(task_tree_changed)
+def task_tree_changed_response_cache(sender, user_ids, **kwargs):
+    response_cache.invalidate(response_cache.USER, user_ids)
+
+@receiver(post_save, sender=Community)
+@receiver(post_delete, sender=Community)
+def community_changed_response_cache(sender, instance, **kwargs):
+    response_cache.invalidate(response_cache.COMMUNITY, [instance.pk])
+
+@receiver(post_save, sender=SharedProject)
+@receiver(post_delete, sender=SharedProject)
+def shared_project_changed_response_cache(sender, instance, **kwargs):
+    response_cache.invalidate(
+        response_cache.COMMUNITY, [instance.community_id, instance.previous_value('community_id')],
+    )
+
+@receiver(post_save, sender=SharedTask)
+@receiver(post_delete, sender=SharedTask)
+@receiver(post_save, sender=SharedNote)
+@receiver(post_delete, sender=SharedNote)
+def shared_item_changed_response_cache(sender, instance, **kwargs):
+    response_cache.invalidate_shared_projects([instance.project_id, instance.previous_value('project_id')])
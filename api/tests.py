@@ -1,13 +1,61 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.db import models
+from django.db import connection, DatabaseError, IntegrityError, OperationalError
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase
 from rest_framework import status
-from .models import Project, Task, Subtask
+from rest_framework.authtoken.models import Token
+from .models import (
+    Project, Task, Subtask, FocusSession, FocusDailyRollup,
+    Community, SharedProject, SharedTask, SharedNote, Notification, Note,
+    UnreadCounter, Tombstone,
+)
+from .authentication import TokenCache, token_cache
+from .nplusone import NPlusOneError, NPlusOneTestMixin
+from .services import events, leaderboard, metrics, notifications, response_cache, unread as unread_service
+from .services.progress import progress_batch, sync_subtask_counters
+from .views import NotificationViewSet
 
 User = get_user_model()
 
-class ProjectAPITests(APITestCase):
+
+class QueryCountTestMixin:
+    def count_queries(self, url):
+        """(response, number of queries) of a GET that must succeed."""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(ctx.captured_queries)
+
+    def assertConstantQueries(self, url, grow):
+        """GET `url` costs as many queries after grow() as before."""
+        _, small = self.count_queries(url)
+        grow()
+        _, large = self.count_queries(url)
+        self.assertEqual(small, large)
+
+
+class ProjectAPITests(NPlusOneTestMixin, APITestCase):
     def setUp(self):
+        super().setUp()
         self.user = User.objects.create_user(username='testuser', password='password123')
         self.client.force_authenticate(user=self.user)
         self.project = Project.objects.create(user=self.user, name="Test Project", description="Test Description")
@@ -15,11 +63,33 @@ class ProjectAPITests(APITestCase):
         self.subtask = Subtask.objects.create(task=self.task, title="Test Subtask")
 
     def test_delete_project(self):
-        response = self.client.delete(f'/api/projects/{self.project.id}/')
+        for t in range(30):
+            task = Task.objects.create(project=self.project, title=f"Task {t}")
+            Subtask.objects.bulk_create([Subtask(task=task, title=f"Subtask {s}") for s in range(3)])
+        session = FocusSession.objects.create(user=self.user, project=self.project, duration_minutes=25)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.delete(f'/api/projects/{self.project.id}/')
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        # Independent of the size of the tree.
+        self.assertLessEqual(len(ctx.captured_queries), 12)
         self.assertEqual(Project.objects.count(), 0)
         self.assertEqual(Task.objects.count(), 0)
         self.assertEqual(Subtask.objects.count(), 0)
+        session.refresh_from_db()
+        self.assertIsNone(session.project_id)
+        self.assertEqual(
+            list(Tombstone.objects.values_list('model', 'object_id')), [('project', self.project.id)],
+        )
+
+    def test_delete_task_recalculates_project(self):
+        done = Task.objects.create(project=self.project, title="Done", completed=True)
+        response = self.client.delete(f'/api/tasks/{self.task.id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Subtask.objects.exists())
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.progress, 100.0)
+        self.assertEqual(Tombstone.objects.get().object_id, self.task.id)
+        self.assertTrue(Task.objects.filter(pk=done.pk).exists())
 
     def test_update_project(self):
         response = self.client.patch(f'/api/projects/{self.project.id}/', {'name': 'Updated Project'})
@@ -38,3 +108,1547 @@ class ProjectAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.subtask.refresh_from_db()
         self.assertEqual(self.subtask.title, 'Updated Subtask')
+
+
+class ProgressEngineTests(NPlusOneTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='progressuser', password='password123')
+        self.client.force_authenticate(user=self.user)
+        self.project = Project.objects.create(user=self.user, name="Progress Project")
+        self.task = Task.objects.create(project=self.project, title="Task")
+        self.subtasks = [Subtask.objects.create(task=self.task, title=f"Subtask {i}") for i in range(4)]
+
+    def test_subtask_toggle_updates_task_and_project(self):
+        response = self.client.patch(f'/api/subtasks/{self.subtasks[0].id}/', {'completed': True})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.task.refresh_from_db()
+        self.project.refresh_from_db()
+        self.assertEqual(self.task.progress, 25.0)
+        self.assertEqual(self.project.progress, 25.0)
+        self.assertEqual(self.project.status, 'IN_PROGRESS')
+
+    def test_task_without_subtasks_reports_its_own_progress(self):
+        response = self.client.post('/api/tasks/', {'project': self.project.id, 'title': 'Solo'})
+        task_id = response.data['id']
+        response = self.client.patch(f'/api/tasks/{task_id}/', {'completed': True})
+        self.assertEqual(response.data['progress'], 100.0)
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.progress, 50.0)
+
+    def test_batch_recomputes_once(self):
+        with CaptureQueriesContext(connection) as ctx:
+            with progress_batch():
+                for subtask in self.subtasks:
+                    subtask.completed = True
+                    subtask.save()
+        # Per subtask: compare-and-set, counter shift and the save itself.
+        # The recompute then adds a constant number of queries.
+        queries = [q for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertLessEqual(len(queries), 3 * len(self.subtasks) + 5)
+        self.task.refresh_from_db()
+        self.project.refresh_from_db()
+        self.assertTrue(self.task.completed)
+        self.assertEqual(self.project.progress, 100.0)
+        self.assertEqual(self.project.status, 'COMPLETED')
+
+
+class SubtaskCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='counteruser', password='password123')
+        self.project = Project.objects.create(user=self.user, name="Counters")
+        self.task = Task.objects.create(project=self.project, title="Task")
+        self.subtasks = [Subtask.objects.create(task=self.task, title=f"Subtask {i}") for i in range(5)]
+
+    def assertCountersMatch(self, task):
+        task.refresh_from_db()
+        self.assertEqual(task.subtask_total, task.subtasks.count())
+        self.assertEqual(task.subtask_completed, task.subtasks.filter(completed=True).count())
+
+    def test_create_toggle_delete_keep_counters(self):
+        self.subtasks[0].completed = True
+        self.subtasks[0].save()
+        self.subtasks[1].delete()
+        Subtask.objects.create(task=self.task, title="Done", completed=True)
+        self.assertCountersMatch(self.task)
+        self.assertEqual(self.task.progress, 40.0)
+
+    def test_move_between_tasks(self):
+        other = Task.objects.create(project=self.project, title="Other")
+        subtask = Subtask.objects.get(pk=self.subtasks[0].pk)
+        subtask.completed = True
+        subtask.save()
+        subtask.task = other
+        subtask.save()
+        self.assertCountersMatch(self.task)
+        self.assertCountersMatch(other)
+        self.assertEqual(other.progress, 100.0)
+
+    def test_stale_instances_do_not_drift(self):
+        # Interleaved requests that all loaded the row before any of them wrote.
+        for _ in range(10):
+            copies = [Subtask.objects.get(pk=self.subtasks[0].pk) for _ in range(4)]
+            for copy in copies:
+                copy.completed = not copy.completed
+                copy.save()
+            for copy in copies:
+                copy.completed = not copy.completed
+                copy.save()
+        self.assertCountersMatch(self.task)
+
+    def test_deleting_a_stale_instance(self):
+        stale = Subtask.objects.get(pk=self.subtasks[0].pk)
+        fresh = Subtask.objects.get(pk=self.subtasks[0].pk)
+        fresh.completed = True
+        fresh.save()
+        stale.delete()
+        self.assertCountersMatch(self.task)
+        self.assertEqual(self.task.progress, 0.0)
+
+    def test_reconcile_repairs_drift(self):
+        Task.objects.filter(pk=self.task.pk).update(subtask_total=42, subtask_completed=7)
+        call_command('reconcile_subtask_counters', stdout=StringIO())
+        self.assertCountersMatch(self.task)
+        self.assertEqual(self.task.progress, 0.0)
+
+
+class SubtaskCounterConcurrencyTests(TransactionTestCase):
+    def test_concurrent_toggles(self):
+        user = User.objects.create_user(username='concurrent', password='password123')
+        project = Project.objects.create(user=user, name="Concurrent")
+        task = Task.objects.create(project=project, title="Task")
+        subtasks = [Subtask.objects.create(task=task, title=f"Subtask {i}") for i in range(4)]
+
+        saved = []
+
+        def hammer(pk, rounds):
+            try:
+                for i in range(rounds):
+                    for attempt in range(50):
+                        try:
+                            subtask = Subtask.objects.get(pk=pk)
+                            subtask.completed = i % 2 == 0
+                            subtask.save()
+                            saved.append(pk)
+                            break
+                        except OperationalError:
+                            # SQLite serializes writers; retry on "locked".
+                            time.sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=hammer, args=(subtask.pk, 15))
+            for subtask in subtasks for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Counters that never moved would match trivially; a toggle may
+        # still run out of retries now and then.
+        self.assertGreater(len(saved), len(threads) * 15 // 2)
+        task.refresh_from_db()
+        self.assertEqual(task.subtask_total, 4)
+        self.assertEqual(task.subtask_completed, task.subtasks.filter(completed=True).count())
+
+
+class ProjectQueryCountTests(QueryCountTestMixin, NPlusOneTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='queryuser', password='password123')
+        self.client.force_authenticate(user=self.user)
+
+    def seed(self, projects, tasks, subtasks):
+        for p in range(projects):
+            project = Project.objects.create(user=self.user, name=f"Project {p}")
+            for t in range(tasks):
+                task = Task.objects.create(project=project, title=f"Task {t}")
+                for s in range(subtasks):
+                    Subtask.objects.create(task=task, title=f"Subtask {s}")
+
+    def test_project_list_query_count_is_constant(self):
+        self.seed(1, 1, 1)
+        self.assertConstantQueries('/api/projects/', lambda: self.seed(5, 4, 3))
+
+    def test_task_list_query_count_is_constant(self):
+        self.seed(1, 1, 1)
+        self.assertConstantQueries('/api/tasks/', lambda: self.seed(3, 5, 4))
+
+    def test_nested_subtasks_are_ordered(self):
+        self.seed(1, 1, 3)
+        response = self.client.get('/api/projects/')
+        titles = [s['title'] for s in response.data['results'][0]['tasks'][0]['subtasks']]
+        self.assertEqual(titles, ['Subtask 0', 'Subtask 1', 'Subtask 2'])
+
+
+class PaginationAndSparseFieldsTests(NPlusOneTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='pageuser', password='password123')
+        self.client.force_authenticate(user=self.user)
+        for p in range(5):
+            project = Project.objects.create(user=self.user, name=f"Project {p}")
+            Task.objects.create(project=project, title="Task")
+
+    def test_cursor_pagination_walks_every_project(self):
+        seen = []
+        url = '/api/projects/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen.extend(p['id'] for p in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(sorted(seen), sorted(Project.objects.values_list('id', flat=True)))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_fields_param_limits_representation(self):
+        response = self.client.get('/api/projects/?fields=id,name')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name'})
+
+    def test_empty_expand_skips_nested_tasks_and_their_queries(self):
+        with CaptureQueriesContext(connection) as flat:
+            response = self.client.get('/api/projects/?expand=')
+        self.assertNotIn('tasks', response.data['results'][0])
+        self.assertIn('progress', response.data['results'][0])
+        with CaptureQueriesContext(connection) as nested:
+            response = self.client.get('/api/projects/?expand=tasks')
+        self.assertIn('tasks', response.data['results'][0])
+        self.assertLess(len(flat.captured_queries), len(nested.captured_queries))
+
+
+class CommunityLeaderboardTests(NPlusOneTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user(username='leader', password='password123')
+        self.projects = [
+            Project.objects.create(user=self.user, name=f"Public {i}", status='IN_PROGRESS', progress=i * 10)
+            for i in range(3)
+        ]
+        Project.objects.create(user=self.user, name="Hidden", status='PENDING')
+
+    def test_leaderboard_is_ordered_and_cached(self):
+        response = self.client.get('/api/projects/community/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['name'] for p in response.data['results']], ['Public 2', 'Public 1', 'Public 0'])
+        with self.assertNumQueries(0):
+            self.client.get('/api/projects/community/')
+
+    def test_etag_returns_not_modified(self):
+        etag = self.client.get('/api/projects/community/')['ETag']
+        response = self.client.get('/api/projects/community/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_progress_change_invalidates(self):
+        etag = self.client.get('/api/projects/community/')['ETag']
+        task = Task.objects.create(project=self.projects[0], title="Done")
+        task.completed = True
+        task.save()
+        response = self.client.get('/api/projects/community/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['name'], 'Public 0')
+
+    def test_unrelated_change_keeps_cache(self):
+        self.client.get('/api/projects/community/')
+        Project.objects.create(user=self.user, name="Another pending", status='PENDING')
+        with self.assertNumQueries(0):
+            self.client.get('/api/projects/community/')
+
+    def test_generation_is_bumped_again_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            project = self.projects[0]
+            project.status = 'COMPLETED'
+            project.save()
+            # A reader caching the page before the writer commits.
+            stale = leaderboard.get_page(1)['etag']
+        self.assertNotEqual(leaderboard.get_page(1)['etag'], stale)
+
+    def test_out_of_range_page(self):
+        response = self.client.get('/api/projects/community/?page=0')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class FocusRollupTests(NPlusOneTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='focususer', password='password123')
+        self.client.force_authenticate(user=self.user)
+        self.project = Project.objects.create(user=self.user, name="Focus Project")
+
+    def create_session(self, tag, minutes, project=None, days_ago=0):
+        session = FocusSession.objects.create(
+            user=self.user, tag=tag, project=project, duration_minutes=minutes, is_completed=True,
+        )
+        if days_ago:
+            # start_time is auto_now_add; move it like an edit would.
+            session.start_time = timezone.now() - timedelta(days=days_ago)
+            session.save()
+        return session
+
+    def reports(self):
+        response = self.client.get('/api/focus-sessions/reports/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return {key: list(rows) for key, rows in response.data.items()}
+
+    def test_reports_follow_creates_edits_and_deletes(self):
+        self.create_session('study', 25, self.project)
+        self.create_session('study', 30, days_ago=2)
+        reading = self.create_session('reading', 10)
+        response = self.client.patch(f'/api/focus-sessions/{reading.id}/', {'tag': 'study', 'duration_minutes': 15})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.create_session('deleted', 99).delete()
+
+        data = self.reports()
+        self.assertEqual([(r['tag'], r['total_minutes']) for r in data['by_tag']], [('study', 70.0)])
+        self.assertEqual([(r['project__name'], r['total_minutes']) for r in data['by_project']], [('Focus Project', 25.0)])
+        self.assertEqual([r['total_minutes'] for r in data['daily_stats']], [30.0, 40.0])
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.create_session('study', 25, self.project)
+        self.create_session('code', 45, days_ago=3)
+        before = self.reports()
+        FocusDailyRollup.objects.update(total_minutes=0)
+        call_command('rebuild_focus_rollups', stdout=StringIO())
+        self.assertEqual(self.reports(), before)
+
+    def test_deleting_a_project_merges_its_rollups(self):
+        self.create_session('study', 10)
+        self.create_session('study', 5, self.project)
+        self.project.delete()
+        self.assertEqual(FocusDailyRollup.objects.filter(user=self.user).count(), 1)
+        self.create_session('study', 7)
+        self.create_session('study', 3).delete()
+        rollup = FocusDailyRollup.objects.get(user=self.user)
+        self.assertEqual((rollup.total_minutes, rollup.session_count), (22.0, 3))
+        self.assertEqual([(r['tag'], r['total_minutes']) for r in self.reports()['by_tag']], [('study', 22.0)])
+
+    def test_report_queries_do_not_grow_with_history(self):
+        self.create_session('study', 25)
+        with CaptureQueriesContext(connection) as small:
+            self.reports()
+        for day in range(1, 20):
+            self.create_session('study', 5, days_ago=day)
+        with CaptureQueriesContext(connection) as large:
+            self.reports()
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+
+class NotificationFanOutTests(NPlusOneTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user(username='owner', password='password123')
+        self.client.force_authenticate(user=self.owner)
+        self.community = Community.objects.create(owner=self.owner, name="Big")
+        members = User.objects.bulk_create([User(username=f'member{i}') for i in range(25)])
+        self.community.members.add(self.owner, *members)
+
+    @override_settings(NOTIFICATION_BATCH_SIZE=10)
+    def test_shared_project_fan_out_uses_batched_inserts(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/shared-projects/', {'community': self.community.id, 'name': 'Plan'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "api_notification"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(Notification.objects.filter(notification_type='new_project').count(), 25)
+        self.assertFalse(Notification.objects.filter(recipient=self.owner).exists())
+
+    def test_shared_note_notifies_members(self):
+        project = SharedProject.objects.create(community=self.community, created_by=self.owner, name="Plan")
+        response = self.client.post('/api/shared-notes/', {'project': project.id, 'title': 'Minutes'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Notification.objects.filter(notification_type='new_note').count(), 25)
+
+
+class BackgroundFanOutTests(TransactionTestCase):
+    @override_settings(NOTIFICATION_ASYNC_THRESHOLD=5)
+    def test_large_fan_out_runs_in_worker(self):
+        owner = User.objects.create_user(username='owner', password='password123')
+        community = Community.objects.create(owner=owner, name="Huge")
+        community.members.add(owner, *User.objects.bulk_create([User(username=f'm{i}') for i in range(8)]))
+
+        recipients = notifications.notify_community(community, owner, 'new_project', 'Hello')
+        notifications.shutdown(wait=True)
+        self.assertEqual(recipients, 8)
+        self.assertEqual(Notification.objects.count(), 8)
+
+
+class SharedProjectProgressTests(QueryCountTestMixin, NPlusOneTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='sharer', password='password123')
+        self.client.force_authenticate(user=self.user)
+        self.community = Community.objects.create(owner=self.user, name="Team")
+        self.community.members.add(self.user)
+
+    def seed(self, projects, tasks):
+        for p in range(projects):
+            project = SharedProject.objects.create(community=self.community, created_by=self.user, name=f"Shared {p}")
+            for t in range(tasks):
+                SharedTask.objects.create(project=project, created_by=self.user, title=f"Task {t}", completed=t % 2 == 0)
+
+    def test_progress_is_annotated(self):
+        self.seed(1, 3)
+        project = SharedProject.objects.with_progress().get()
+        with self.assertNumQueries(0):
+            self.assertEqual(project.progress, 66.7)
+        self.assertEqual(SharedProject.objects.get().progress, 66.7)
+
+    def test_shared_project_list_query_count_is_constant(self):
+        self.seed(1, 1)
+        self.assertConstantQueries('/api/shared-projects/', lambda: self.seed(4, 5))
+
+    def test_community_list_reports_progress_without_per_project_queries(self):
+        self.seed(1, 1)
+        self.assertConstantQueries('/api/communities/', lambda: self.seed(4, 5))
+
+
+class CommunitySummaryTests(QueryCountTestMixin, NPlusOneTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='summary', password='password123')
+        self.client.force_authenticate(user=self.user)
+
+    def seed(self, communities, members, projects):
+        for c in range(communities):
+            community = Community.objects.create(owner=self.user, name=f"Community {c}")
+            extra = User.objects.bulk_create([User(username=f'c{community.pk}m{m}') for m in range(members)])
+            community.members.add(self.user, *extra)
+            for p in range(projects):
+                project = SharedProject.objects.create(community=community, created_by=self.user, name=f"P{p}")
+                SharedTask.objects.create(project=project, created_by=self.user, title="Task")
+                SharedNote.objects.create(project=project, created_by=self.user, title="Note", content="x" * 100)
+
+    def test_list_is_a_flat_summary_with_counts(self):
+        self.seed(1, 3, 2)
+        response, _ = self.count_queries('/api/communities/')
+        community = response.data['results'][0]
+        self.assertEqual(community['member_count'], 4)
+        self.assertEqual(community['project_count'], 2)
+        self.assertNotIn('projects', community)
+        self.assertNotIn('members', community)
+
+    def test_list_query_count_is_constant(self):
+        self.seed(1, 1, 1)
+        self.assertConstantQueries('/api/communities/', lambda: self.seed(4, 5, 3))
+
+    def test_detail_tree_is_prefetched(self):
+        self.seed(1, 1, 1)
+        community_id = Community.objects.get().pk
+        _, small = self.count_queries(f'/api/communities/{community_id}/')
+        Community.objects.all().delete()
+        self.seed(1, 6, 4)
+        community_id = Community.objects.get().pk
+        response, large = self.count_queries(f'/api/communities/{community_id}/')
+        self.assertEqual(small, large)
+        self.assertEqual(response.data['member_count'], 7)
+        self.assertEqual(len(response.data['projects']), 4)
+        self.assertEqual(len(response.data['projects'][0]['shared_notes']), 1)
+
+
+class CachedTokenAuthenticationTests(NPlusOneTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        token_cache.clear()
+        self.user = User.objects.create_user(username='tokenuser', password='password123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_repeated_requests_skip_token_lookup(self):
+        self.assertEqual(self.client.get('/api/me/').status_code, status.HTTP_200_OK)
+        before = token_cache.stats()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get('/api/me/').status_code, status.HTTP_200_OK)
+        self.assertFalse(any('authtoken_token' in q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(token_cache.stats()['hits'], before['hits'] + 1)
+
+    def test_deleted_token_is_rejected(self):
+        self.client.get('/api/me/')
+        self.token.delete()
+        self.assertEqual(self.client.get('/api/me/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get('/api/me/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/me/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_evicts_cached_user(self):
+        self.client.get('/api/me/')
+        response = self.client.put('/api/change-password/', {'old_password': 'password123', 'new_password': 'n3w-Passw0rd'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(token_cache.stats()['size'], 0)
+
+    def test_cache_is_bounded(self):
+        cache_ = TokenCache(maxsize=2, ttl=60)
+        for i in range(3):
+            cache_.set(f'key{i}', self.user, None)
+        self.assertIsNone(cache_.get('key0'))
+        self.assertIsNotNone(cache_.get('key2'))
+        self.assertEqual(cache_.stats()['evictions'], 1)
+
+
+class BulkMutationTests(NPlusOneTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='bulkuser', password='password123')
+        self.client.force_authenticate(user=self.user)
+        self.project = Project.objects.create(user=self.user, name="Bulk")
+        self.task = Task.objects.create(project=self.project, title="Task")
+        self.subtasks = [Subtask.objects.create(task=self.task, title=f"Subtask {i}") for i in range(20)]
+
+    def test_bulk_toggle_recomputes_once(self):
+        operations = [{'op': 'toggle', 'id': s.id} for s in self.subtasks[:15]]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/subtasks/bulk/', {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['updated']), 15)
+        self.assertLess(len(ctx.captured_queries), 20)
+        self.task.refresh_from_db()
+        self.project.refresh_from_db()
+        self.assertEqual((self.task.subtask_total, self.task.subtask_completed), (20, 15))
+        self.assertEqual(self.task.progress, 75.0)
+        self.assertEqual(self.project.progress, 75.0)
+
+    def test_mixed_operations(self):
+        operations = [
+            {'op': 'create', 'task': self.task.id, 'title': 'New', 'completed': True},
+            {'op': 'update', 'id': self.subtasks[0].id, 'title': 'Renamed'},
+            {'op': 'delete', 'id': self.subtasks[1].id},
+            {'op': 'delete', 'id': self.subtasks[2].id},
+        ]
+        response = self.client.post('/api/subtasks/bulk/', {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'][0]['title'], 'New')
+        self.assertEqual(response.data['updated'][0]['title'], 'Renamed')
+        self.assertEqual(response.data['deleted'], sorted([self.subtasks[1].id, self.subtasks[2].id]))
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.subtask_total, self.task.subtask_completed), (19, 1))
+        self.assertAlmostEqual(self.task.progress, 100 / 19)
+
+    def test_invalid_operation_rolls_back_everything(self):
+        other = User.objects.create_user(username='intruder', password='password123')
+        foreign_task = Task.objects.create(project=Project.objects.create(user=other, name="Theirs"), title="T")
+        operations = [
+            {'op': 'toggle', 'id': self.subtasks[0].id},
+            {'op': 'create', 'task': foreign_task.id, 'title': 'Sneaky'},
+            {'op': 'delete', 'id': 999999},
+        ]
+        response = self.client.post('/api/subtasks/bulk/', {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data['operations']), {1, 2})
+        self.subtasks[0].refresh_from_db()
+        self.assertFalse(self.subtasks[0].completed)
+        self.assertFalse(Subtask.objects.filter(title='Sneaky').exists())
+
+    def test_bulk_tasks(self):
+        operations = [
+            {'op': 'create', 'project': self.project.id, 'title': 'Done already', 'completed': True},
+            {'op': 'toggle', 'id': self.task.id},
+        ]
+        response = self.client.post('/api/tasks/bulk/', {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'][0]['progress'], 100.0)
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.progress, 50.0)
+
+    def test_bulk_tasks_reject_foreign_projects(self):
+        other = User.objects.create_user(username='intruder', password='password123')
+        theirs = Project.objects.create(user=other, name="Theirs")
+        operations = [{'op': 'update', 'id': self.task.id, 'project': theirs.id}]
+        response = self.client.post('/api/tasks/bulk/', {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data['operations'][0]), {'project'})
+
+    def test_bulk_delete_tasks(self):
+        done = Task.objects.create(project=self.project, title="Done", completed=True)
+        response = self.client.post(
+            '/api/tasks/bulk/', {'operations': [{'op': 'delete', 'id': self.task.id}]}, format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['deleted'], [self.task.id])
+        self.assertFalse(Subtask.objects.exists())
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.progress, 100.0)
+        self.assertEqual(list(Task.objects.values_list('pk', flat=True)), [done.pk])
+
+
+@override_settings(SYNC_WATERMARK_LAG_SECONDS=0)
+class DeltaSyncTests(NPlusOneTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='syncuser', password='password123')
+        self.client.force_authenticate(user=self.user)
+        self.project = Project.objects.create(user=self.user, name="Synced")
+        self.task = Task.objects.create(project=self.project, title="Task")
+        self.subtask = Subtask.objects.create(task=self.task, title="Subtask")
+        self.note = Note.objects.create(user=self.user, title="Note")
+
+    def sync(self, since=None):
+        response = self.client.get('/api/sync/', {'since': since} if since else {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_full_snapshot_is_flat(self):
+        data = self.sync()
+        self.assertEqual([p['name'] for p in data['projects']], ['Synced'])
+        self.assertNotIn('tasks', data['projects'][0])
+        self.assertNotIn('subtasks', data['tasks'][0])
+        self.assertEqual(len(data['subtasks']), 1)
+
+    def test_delta_only_contains_changes(self):
+        watermark = self.sync()['watermark'].isoformat()
+        self.assertEqual(sum(len(v) for k, v in self.sync(watermark).items() if isinstance(v, list)), 0)
+
+        self.client.patch(f'/api/notes/{self.note.id}/', {'title': 'Edited'})
+        FocusSession.objects.create(user=self.user, tag='study', duration_minutes=5)
+        data = self.sync(watermark)
+        self.assertEqual([n['title'] for n in data['notes']], ['Edited'])
+        self.assertEqual(len(data['focus_sessions']), 1)
+        self.assertEqual(data['projects'], [])
+
+    def test_deletions_are_reported_as_tombstones(self):
+        other_task = Task.objects.create(project=self.project, title="Other")
+        ids = {'subtask': self.subtask.id, 'task': other_task.id, 'note': self.note.id}
+        watermark = self.sync()['watermark'].isoformat()
+        self.subtask.delete()
+        other_task.delete()
+        self.note.delete()
+        deleted = self.sync(watermark)['deleted']
+        for label, pk in ids.items():
+            self.assertEqual(deleted[label], [pk])
+
+    def test_other_users_deletions_are_not_leaked(self):
+        watermark = self.sync()['watermark'].isoformat()
+        other = User.objects.create_user(username='stranger', password='password123')
+        Project.objects.create(user=other, name="Theirs").delete()
+        self.assertEqual(self.sync(watermark)['deleted']['project'], [])
+
+    @override_settings(SYNC_WATERMARK_LAG_SECONDS=60)
+    def test_rows_committed_after_the_read_are_not_missed(self):
+        watermark = self.sync()['watermark'].isoformat()
+        # Stamped before the response above, committed after it.
+        Note.objects.filter(pk=self.note.pk).update(title='Late', updated_at=timezone.now() - timedelta(seconds=5))
+        self.assertEqual([n['title'] for n in self.sync(watermark)['notes']], ['Late'])
+
+    def test_stale_watermark_requires_reset(self):
+        since = (timezone.now() - timedelta(days=365)).isoformat()
+        self.assertTrue(self.sync(since)['reset'])
+
+
+class RecordingBroker:
+    """Stand-in broker: every user counts as connected, events are kept in a list."""
+
+    def __init__(self):
+        self.events = []
+
+    def subscribed(self, user_ids):
+        return set(user_ids)
+
+    def publish(self, user_id, event):
+        self.events.append((user_id, event))
+
+
+@override_settings(NOTIFICATION_BROKER='api.tests.RecordingBroker')
+class NotificationStreamTests(NPlusOneTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        events.reset_broker()
+        self.addCleanup(events.reset_broker)
+        self.broker = events.get_broker()
+        self.owner = User.objects.create_user(username='streamowner', password='password123')
+        self.member = User.objects.create_user(username='streammember', password='password123')
+        self.community = Community.objects.create(name="Streamers", owner=self.owner)
+        self.community.members.add(self.owner, self.member)
+
+    def published(self, event_type):
+        return [(user_id, event['data']) for user_id, event in self.broker.events if event['event'] == event_type]
+
+    def test_new_notification_is_pushed_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            Notification.objects.create(recipient=self.member, actor=self.owner, message="Hi")
+            self.assertEqual(self.broker.events, [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual([(u, d['message']) for u, d in self.published('notification')], [(self.member.id, "Hi")])
+        self.assertEqual(self.published('unread_count'), [(self.member.id, {'count': 1})])
+
+    def test_bulk_fan_out_and_mark_all_read_push_counts(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications.notify_community(self.community, self.owner, 'project_created', "New project")
+        self.assertEqual(self.published('unread_count'), [(self.member.id, {'count': 1})])
+
+        self.broker.events.clear()
+        self.client.force_authenticate(user=self.member)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/notifications/mark_all_read/')
+        self.assertEqual(self.published('unread_count'), [(self.member.id, {'count': 0})])
+
+    def test_disconnected_users_cost_no_queries(self):
+        self.broker.subscribed = lambda user_ids: set()
+        with self.captureOnCommitCallbacks() as callbacks:
+            Notification.objects.create(recipient=self.member, actor=self.owner, message="Hi")
+        with CaptureQueriesContext(connection) as ctx:
+            for callback in callbacks:
+                callback()
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_wsgi_fallback_sends_count_and_retry(self):
+        Notification.objects.create(recipient=self.member, actor=self.owner, message="Hi")
+        token = Token.objects.create(user=self.member)
+        response = self.client.get('/api/notifications/stream/', {'token': token.key})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = response.content.decode()
+        self.assertIn('retry: ', body)
+        self.assertIn('event: unread_count\ndata: {"count": 1}', body)
+
+        response = self.client.get('/api/notifications/stream/', {'token': 'bogus'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class LocalBrokerTests(TestCase):
+    def test_publish_from_another_thread_reaches_subscriber(self):
+        broker = events.LocalBroker()
+
+        async def listen():
+            subscription = broker.subscribe(7)
+            self.assertEqual(broker.subscribed({7, 8}), {7})
+            publisher = threading.Thread(target=broker.publish, args=(7, {'event': 'ping'}))
+            publisher.start()
+            event = await subscription.get(timeout=5)
+            publisher.join()
+            subscription.close()
+            return event
+
+        self.assertEqual(asyncio.run(listen()), {'event': 'ping'})
+        self.assertEqual(broker.subscribed({7}), set())
+
+
+class AsgiNotificationStreamTests(TestCase):
+    def setUp(self):
+        events.reset_broker()
+        self.addCleanup(events.reset_broker)
+        self.user = User.objects.create_user(username='asgistream', password='password123')
+        self.token = Token.objects.create(user=self.user)
+
+    async def test_stream_pushes_published_events(self):
+        response = await self.async_client.get('/api/notifications/stream/', {'token': self.token.key})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        chunks = aiter(response.streaming_content)
+        self.assertIn(b'data: {"count": 0}', await anext(chunks))
+
+        events.get_broker().publish(self.user.id, {'event': 'unread_count', 'data': {'count': 3}})
+        self.assertEqual(await anext(chunks), b'event: unread_count\ndata: {"count": 3}\n\n')
+
+        # A client disconnect cancels the pending read; the stream unsubscribes.
+        pending = asyncio.ensure_future(anext(chunks))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(events.get_broker().subscribed({self.user.id}), set())
+
+
+class UnreadCounterTests(NPlusOneTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user(username='counterowner', password='password123')
+        self.user = User.objects.create_user(username='counteruser', password='password123')
+        self.client.force_authenticate(user=self.user)
+        self.community = Community.objects.create(name="Counted", owner=self.owner)
+
+    def notify(self, **kwargs):
+        kwargs.setdefault('notification_type', 'new_note')
+        return Notification.objects.create(recipient=self.user, actor=self.owner, message="Hi", **kwargs)
+
+    def assertCounter(self, expected):
+        real = Notification.objects.filter(recipient=self.user, status='pending').count()
+        self.assertEqual(real, expected)
+        self.assertEqual(UnreadCounter.objects.get(user=self.user).count, expected)
+
+    def test_unread_count_is_a_single_lookup(self):
+        self.notify()
+        self.notify()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/notifications/unread_count/')
+        self.assertEqual(response.data, {'count': 2})
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_counter_follows_every_transition(self):
+        invite = self.notify(notification_type='community_invite', community=self.community)
+        other_community = Community.objects.create(name="Other", owner=self.owner)
+        other_invite = self.notify(notification_type='community_invite', community=other_community)
+        note = self.notify()
+        self.notify()
+        self.assertCounter(4)
+
+        self.client.post(f'/api/notifications/{invite.id}/accept/')
+        self.client.post(f'/api/notifications/{other_invite.id}/reject/')
+        self.client.post(f'/api/notifications/{note.id}/mark_read/')
+        self.client.post(f'/api/notifications/{note.id}/mark_read/')
+        self.assertCounter(1)
+
+        self.client.post('/api/notifications/mark_all_read/')
+        self.assertCounter(0)
+
+        pending = self.notify()
+        self.client.delete(f'/api/notifications/{pending.id}/')
+        self.client.delete(f'/api/notifications/{note.id}/')
+        self.assertCounter(0)
+
+    def test_fan_out_increments_counters(self):
+        self.community.members.add(self.owner, self.user)
+        notifications.notify_community(self.community, self.owner, 'new_project', "New project")
+        self.assertCounter(1)
+        self.assertEqual(UnreadCounter.objects.get(user=self.owner).count, 0)
+
+    def test_stale_instance_only_decrements_once(self):
+        note = self.notify()
+        first, second = Notification.objects.get(pk=note.pk), Notification.objects.get(pk=note.pk)
+        first.status = 'read'
+        first.save()
+        second.status = 'read'
+        second.save()
+        self.assertCounter(0)
+
+    def test_actions_on_a_concurrently_deleted_notification(self):
+        get_object = NotificationViewSet.get_object
+
+        def load_then_delete(view):
+            notification = get_object(view)
+            Notification.objects.filter(pk=notification.pk).delete()
+            return notification
+
+        with mock.patch.object(NotificationViewSet, 'get_object', load_then_delete):
+            for action, notification_type in (
+                ('accept', 'community_invite'), ('reject', 'community_invite'), ('mark_read', 'new_note'),
+            ):
+                notification = self.notify(notification_type=notification_type, community=self.community)
+                response = self.client.post(f'/api/notifications/{notification.id}/{action}/')
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, action)
+        self.assertFalse(self.community.members.filter(pk=self.user.pk).exists())
+
+    def test_reconcile_command_repairs_drift(self):
+        self.notify()
+        UnreadCounter.objects.filter(user=self.user).update(count=42)
+        UnreadCounter.objects.filter(user=self.owner).delete()
+        out = StringIO()
+        call_command('reconcile_unread_counters', stdout=out)
+        self.assertIn("2 user(s)", out.getvalue())
+        self.assertCounter(1)
+        self.assertEqual(UnreadCounter.objects.get(user=self.owner).count, 0)
+
+
+class UnreadCounterConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='racer', password='password123')
+        self.user = User.objects.create_user(username='racee', password='password123')
+        self.pending = [
+            Notification.objects.create(
+                recipient=self.user, actor=self.owner, notification_type='new_note', message=str(i),
+            )
+            for i in range(10)
+        ]
+        self.errors = []
+
+    def retry(self, operation):
+        for attempt in range(50):
+            try:
+                return operation()
+            except OperationalError:
+                # SQLite serializes writers; retry on "locked".
+                time.sleep(0.01)
+            except Notification.DoesNotExist:
+                # Lost to a concurrent delete.
+                return None
+            except DatabaseError as exc:
+                # A partial save of a row deleted in the meantime.
+                if 'did not affect any rows' not in str(exc):
+                    raise
+                return None
+        self.errors.append(f'{operation} still locked after 50 attempts')
+
+    def run_threads(self, *targets):
+        def run(target, *args):
+            try:
+                target(*args)
+            except Exception as exc:
+                self.errors.append(repr(exc))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=target) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.errors, [])
+
+    def mark_read(self, pk):
+        notification = Notification.objects.get(pk=pk)
+        notification.status = 'read'
+        notification.save()
+
+    def test_concurrent_reads_and_fan_outs(self):
+        user, owner = self.user, self.owner
+
+        def reader(pks):
+            for pk in pks:
+                self.retry(lambda: self.mark_read(pk))
+
+        def fan_out():
+            for i in range(5):
+                self.retry(lambda: notifications.create_notifications([user.id], owner.id, 'new_note', f"Fan-out {i}"))
+
+        pks = [notification.pk for notification in self.pending]
+        self.run_threads(*[(reader, pks) for _ in range(3)], (fan_out,))
+
+        self.assertEqual(UnreadCounter.objects.get(user=user).count, 5)
+        self.assertEqual(Notification.objects.filter(recipient=user, status='pending').count(), 5)
+
+    def test_deletes_racing_reads(self):
+        def reader(pks):
+            for pk in pks:
+                self.retry(lambda: self.mark_read(pk))
+
+        def deleter(instances):
+            # Loaded while pending; the readers get to most rows first.
+            for notification in instances:
+                self.retry(notification.delete)
+
+        pks = [notification.pk for notification in self.pending]
+        # Each deleter has its own copies: delete() clears the instance's pk.
+        stale = [list(Notification.objects.filter(pk__in=pks).order_by(order)) for order in ('id', '-id')]
+        self.run_threads((reader, pks), (reader, pks[::-1]), *[(deleter, instances) for instances in stale])
+
+        self.assertFalse(Notification.objects.filter(recipient=self.user, status='pending').exists())
+        # Each notification left pending exactly once: no double decrements.
+        self.assertEqual(UnreadCounter.objects.get(user=self.user).count, 0)
+
+
+class SearchTests(NPlusOneTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='searcher', password='password123')
+        self.other = User.objects.create_user(username='outsider', password='password123')
+        self.client.force_authenticate(user=self.user)
+        self.community = Community.objects.create(name="Readers", owner=self.other)
+        self.community.members.add(self.user, self.other)
+        self.shared_project = SharedProject.objects.create(community=self.community, created_by=self.other, name="Club")
+
+    def search(self, q, **params):
+        response = self.client.get('/api/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def hits(self, q):
+        return [(r['type'], r['id']) for r in self.search(q)['results']]
+
+    def test_ranked_and_highlighted(self):
+        body = Note.objects.create(user=self.user, title="Groceries", content="Buy volcano stones and milk")
+        title = Note.objects.create(user=self.user, title="Volcano trip", content="Pack boots")
+        results = self.search('volcano')['results']
+        self.assertEqual([r['id'] for r in results], [title.id, body.id])
+        self.assertEqual(results[0]['title'], '<mark>Volcano</mark> trip')
+        self.assertIn('<mark>volcano</mark>', results[1]['snippet'])
+
+    def test_scoped_to_own_and_community_notes(self):
+        mine = Note.objects.create(user=self.user, title="Secret plan")
+        Note.objects.create(user=self.other, title="Secret plan")
+        shared = SharedNote.objects.create(project=self.shared_project, created_by=self.other, title="Secret plan")
+        stranger_community = Community.objects.create(name="Closed", owner=self.other)
+        closed = SharedProject.objects.create(community=stranger_community, created_by=self.other, name="Closed")
+        SharedNote.objects.create(project=closed, created_by=self.other, title="Secret plan")
+        self.assertCountEqual(self.hits('secret'), [('note', mine.id), ('shared_note', shared.id)])
+
+    def test_index_follows_updates_and_deletes(self):
+        note = Note.objects.create(user=self.user, title="Draft", content="alpha")
+        self.client.patch(f'/api/notes/{note.id}/', {'content': 'omega'})
+        self.assertEqual(self.hits('alpha'), [])
+        self.assertEqual(self.hits('omeg'), [('note', note.id)])
+        self.client.delete(f'/api/notes/{note.id}/')
+        self.assertEqual(self.hits('omega'), [])
+
+        shared = SharedNote.objects.create(project=self.shared_project, created_by=self.other, title="Minutes")
+        self.shared_project.delete()
+        self.assertNotIn(('shared_note', shared.id), self.hits('minutes'))
+
+    def test_user_input_is_escaped(self):
+        Note.objects.create(user=self.user, title="Markup", content='<script>alert("x")</script> markup')
+        result = self.search('markup "(')['results'][0]
+        self.assertNotIn('<script>', result['snippet'])
+        self.assertIn('&lt;script&gt;', result['snippet'])
+        self.assertEqual(self.search('*)(')['results'], [])
+
+    def test_pagination(self):
+        for i in range(5):
+            Note.objects.create(user=self.user, title=f"Page note {i}")
+        first = self.search('page', page_size=2)
+        self.assertEqual(len(first['results']), 2)
+        self.assertIsNone(first['previous'])
+        last = self.client.get(first['next'].replace('page=2', 'page=3')).data
+        self.assertEqual(len(last['results']), 1)
+        self.assertIsNone(last['next'])
+        self.assertIn('page=2', last['previous'])
+        self.assertEqual(self.client.get('/api/search/').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rebuild_command(self):
+        note = Note.objects.create(user=self.user, title="Rebuilt")
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM api_search_index')
+        self.assertEqual(self.hits('rebuilt'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn("Indexed 1 note(s)", out.getvalue())
+        self.assertEqual(self.hits('rebuilt'), [('note', note.id)])
+
+
+class AccessPathIndexTests(TransactionTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='indexowner', password='password123')
+        self.invitee = User.objects.create_user(username='indexinvitee', password='password123')
+        self.community = Community.objects.create(name="Indexed", owner=self.owner)
+        self.community.members.add(self.owner)
+
+    def test_only_one_pending_invite_per_community(self):
+        self.client.force_login(self.owner)
+        Notification.objects.create(
+            recipient=self.invitee, actor=self.owner, notification_type='community_invite',
+            message="Join", community=self.community,
+        )
+        with self.assertRaises(IntegrityError):
+            Notification.objects.create(
+                recipient=self.invitee, actor=self.owner, notification_type='community_invite',
+                message="Join again", community=self.community,
+            )
+        self.assertEqual(UnreadCounter.objects.get(user=self.invitee).count, 1)
+        # Answered invites don't count towards the constraint.
+        Notification.objects.filter(recipient=self.invitee).update(status='rejected')
+        response = self.client.post(f'/api/communities/{self.community.id}/add_member/', {'username': 'indexinvitee'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_benchmark_leaves_indexes_in_place(self):
+        Project.objects.create(user=self.owner, name="Benchmarked")
+        out = StringIO()
+        call_command('benchmark_indexes', repeat=1, stdout=out)
+        output = out.getvalue()
+        self.assertIn('USING INDEX project_user_updated_idx', output)
+        self.assertIn('speedup', output)
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(cursor, 'api_project')
+        self.assertIn('project_user_updated_idx', indexes)
+
+
+class MetricsTests(NPlusOneTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.clear()
+        self.user = User.objects.create_user(username='measured', password='password123')
+        self.client.force_authenticate(user=self.user)
+
+    def test_requests_are_recorded_per_route(self):
+        Project.objects.create(user=self.user, name="Measured")
+        self.client.get('/api/projects/')
+        self.client.get('/api/projects/')
+        self.client.get('/api/nowhere/')
+
+        ((counts, total, count),) = [
+            series for key, series in metrics.request_queries.snapshot().items() if key == ('project-list', 'GET')
+        ]
+        self.assertEqual(count, 2)
+        self.assertGreater(total, 0)
+        requests = metrics.requests_total.snapshot()
+        self.assertEqual(requests[('project-list', 'GET', '200')], 2)
+        self.assertEqual(requests[('unmatched', 'GET', '404')], 1)
+
+    def test_metrics_endpoint_is_restricted(self):
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+
+        staff = User.objects.create_user(username='staff', password='password123', is_staff=True)
+        token = Token.objects.create(user=staff)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn('token_cache_hit_ratio', body)
+
+        with override_settings(METRICS_TOKEN='scrape-me'):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-me')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn('http_requests_total{route="metrics",method="GET",status="403"} 2', response.content.decode())
+
+    @override_settings(METRICS_SLOW_REQUEST_MS=0, METRICS_SLOW_SQL_LIMIT=2)
+    def test_slow_requests_log_their_sql(self):
+        with self.assertLogs('api.slow_requests', level='WARNING') as logs:
+            self.client.get('/api/notes/')
+        (message,) = logs.output
+        self.assertIn('/api/notes/ (note-list)', message)
+        self.assertIn('FROM "api_note"', message)
+        self.assertLessEqual(message.count('SELECT'), 2)
+
+
+class HistogramTests(TestCase):
+    def test_prometheus_rendering(self):
+        histogram = metrics.Histogram('demo_seconds', 'Demo.', (0.1, 1.0), ('route',))
+        for value in (0.05, 0.5, 3):
+            histogram.observe(value, route='a"b')
+        self.assertEqual(histogram.render(), [
+            '# HELP demo_seconds Demo.',
+            '# TYPE demo_seconds histogram',
+            'demo_seconds_bucket{route="a\\"b",le="0.1"} 1',
+            'demo_seconds_bucket{route="a\\"b",le="1"} 2',
+            'demo_seconds_bucket{route="a\\"b",le="+Inf"} 3',
+            'demo_seconds_sum{route="a\\"b"} 3.55',
+            'demo_seconds_count{route="a\\"b"} 3',
+        ])
+
+
+class GenerateDataTests(TestCase):
+    def generate(self, prefix, seed=7):
+        out = StringIO()
+        call_command(
+            'generate_data', users=6, projects=2, tasks=3, subtasks=2, sessions=4, notes=2,
+            communities=2, members=4, shared_projects=1, shared_tasks=2, shared_notes=1, notifications=2,
+            prefix=prefix, seed=seed, users_per_chunk=4, stdout=out,
+        )
+        return out.getvalue()
+
+    def test_generates_consistent_derived_data(self):
+        output = self.generate('gen')
+        self.assertIn("6 users", output)
+        self.assertEqual(Project.objects.filter(user__username__startswith='gen_').count(), 12)
+        self.assertEqual(Community.objects.count(), 2)
+        self.assertEqual(Notification.objects.count(), 2 * 4 * 2)
+
+        # Every derived table matches what the live code paths would produce.
+        for task in Task.objects.all():
+            self.assertEqual(task.subtask_total, task.subtasks.count())
+            self.assertEqual(task.subtask_completed, task.subtasks.filter(completed=True).count())
+        self.assertEqual(sync_subtask_counters(), [])
+        self.assertEqual(unread_service.reconcile(), [])
+        self.assertEqual(
+            FocusDailyRollup.objects.aggregate(n=models.Sum('session_count'))['n'], FocusSession.objects.count(),
+        )
+        user = User.objects.filter(username__startswith='gen_').first()
+        self.assertTrue(hasattr(user, 'profile'))
+        note = Note.objects.filter(user=user).first()
+        self.client.force_login(user)
+        hits = self.client.get('/api/search/', {'q': note.title}).data['results']
+        self.assertIn(note.id, [hit['id'] for hit in hits if hit['type'] == 'note'])
+
+    def test_seed_is_deterministic(self):
+        self.generate('first')
+        self.generate('second')
+        names = lambda prefix: list(
+            Project.objects.filter(user__username__startswith=prefix).order_by('pk').values_list('name', flat=True)
+        )
+        self.assertEqual(names('first_'), names('second_'))
+        with self.assertRaises(CommandError):
+            self.generate('first')
+
+
+class BenchmarkApiTests(TestCase):
+    def run_benchmark(self, *args):
+        out = StringIO()
+        call_command('benchmark_api', '--scale', 'small', '--iterations', '2', '--warmup', '0', *args,
+                     stdout=out, stderr=StringIO())
+        return json.loads(out.getvalue())
+
+    def test_report_and_regression_mode(self):
+        report = self.run_benchmark()
+        results = report['results']['small']
+        self.assertEqual(set(results), {
+            'projects', 'leaderboard', 'focus_reports', 'communities', 'unread_count', 'subtask_toggle',
+        })
+        self.assertEqual(results['unread_count']['queries_max'], 1)
+        self.assertLessEqual(results['projects']['p50_ms'], results['projects']['p99_ms'])
+        # Seeded rows are rolled back.
+        self.assertFalse(User.objects.filter(username__startswith='bench_').exists())
+
+        results['projects']['queries_max'] -= 1
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump(report, f)
+        self.addCleanup(os.unlink, f.name)
+        with self.assertRaisesMessage(CommandError, 'small/projects'):
+            self.run_benchmark('--baseline', f.name, '--tolerance', '1000')
+
+
+class NPlusOneDetectionTests(NPlusOneTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='reader', password='password')
+        self.community = Community.objects.create(name='Club', owner=self.user)
+        for i in range(4):
+            actor = User.objects.create_user(username=f'actor{i}', password='password')
+            Notification.objects.create(
+                recipient=self.user, actor=actor, community=self.community,
+                notification_type='new_note', message=f'Note {i}',
+            )
+        self.client.force_authenticate(user=self.user)
+
+    def unjoined_notifications(self):
+        return mock.patch(
+            'api.views.NotificationViewSet.get_queryset',
+            lambda viewset: Notification.objects.filter(recipient=viewset.request.user).order_by('-id'),
+        )
+
+    def test_list_is_clean(self):
+        response = self.client.get('/api/notifications/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_lazy_relation_reports_serializer_field(self):
+        with self.unjoined_notifications():
+            with self.assertRaisesMessage(NPlusOneError, 'from NotificationSerializer.actor_name (source=actor.username)'):
+                self.client.get('/api/notifications/')
+
+    @override_settings(NPLUSONE_DETECTION='log')
+    def test_log_mode_only_warns(self):
+        with self.unjoined_notifications(), self.assertLogs('api.nplusone', 'WARNING') as logs:
+            response = self.client.get('/api/notifications/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('GET /api/notifications/', logs.output[0])
+
+    def test_prefetch_in_lists_are_one_shape(self):
+        with self.assertNoNPlusOne('prefetch') as tracker:
+            list(Notification.objects.filter(pk__in=[1]))
+            list(Notification.objects.filter(pk__in=[1, 2, 3]))
+        self.assertEqual(list(tracker.counts.values()), [2])
+        with self.assertRaisesMessage(AssertionError, 'api/tests.py'):
+            with self.assertNoNPlusOne('loop'):
+                for notification in Notification.objects.order_by('pk'):
+                    notification.actor.username
+
+
+class DirtyFieldSaveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='writer', password='password123')
+        Project.objects.create(user=self.user, name="Dirty", description="Long description")
+        self.project = Project.objects.get()
+        metrics.clear()
+
+    def updates(self, ctx, table):
+        return [q['sql'] for q in ctx.captured_queries if q['sql'].startswith(f'UPDATE "{table}"')]
+
+    def test_only_changed_fields_are_written(self):
+        # A concurrent recompute the loaded instance doesn't know about.
+        Project.objects.filter(pk=self.project.pk).update(progress=40.0)
+        self.project.name = "Renamed"
+        with CaptureQueriesContext(connection) as ctx:
+            self.project.save()
+        [sql] = self.updates(ctx, 'api_project')
+        self.assertIn('"name"', sql)
+        self.assertIn('"updated_at"', sql)
+        self.assertNotIn('"description"', sql)
+        self.project.refresh_from_db()
+        self.assertEqual((self.project.name, self.project.progress), ("Renamed", 40.0))
+        snapshot = metrics.model_saves.snapshot()
+        self.assertEqual(snapshot[('api.Project', 'partial')], 1)
+
+    def test_noop_save_is_skipped(self):
+        task = Task.objects.create(project=self.project, title="Task")
+        subtask = Subtask.objects.get(pk=Subtask.objects.create(task=task, title="Sub").pk)
+        metrics.clear()
+        with self.assertNumQueries(0):
+            self.project.save()
+            subtask.save()
+        snapshot = metrics.model_saves.snapshot()
+        self.assertEqual(snapshot[('api.Project', 'skipped')], 1)
+        self.assertEqual(snapshot[('api.Subtask', 'skipped')], 1)
+
+    def test_refresh_from_db_resets_the_snapshot(self):
+        note = Note.objects.create(user=self.user, title="A")
+        note = Note.objects.get(pk=note.pk)
+        Note.objects.filter(pk=note.pk).update(title="B")
+        note.refresh_from_db()
+        self.assertFalse(note.has_changed('title'))
+        note.title = "A"
+        note.save()
+        self.assertEqual(Note.objects.get(pk=note.pk).title, "A")
+        # Deferred loads refresh the snapshot of their field only.
+        note = Note.objects.only('id').get(pk=note.pk)
+        self.assertEqual(note.title, "A")
+        self.assertEqual(note.previous_value('title'), "A")
+        self.assertEqual(note.get_dirty_fields(), [])
+
+    def test_user_save_does_not_rewrite_profile(self):
+        self.user.set_password('another')
+        with CaptureQueriesContext(connection) as ctx:
+            self.user.save()
+        self.assertEqual(self.updates(ctx, 'api_profile'), [])
+
+    def test_notification_action_writes_status_only(self):
+        actor = User.objects.create_user(username='actor', password='password123')
+        notification = Notification.objects.create(
+            recipient=self.user, actor=actor, notification_type='new_note', message='Hi',
+        )
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(f'/api/notifications/{notification.id}/mark_read/')
+        self.assertNotIn('"message"', ' '.join(self.updates(ctx, 'api_notification')))
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, 'read')
+
+
+class WorkspaceExportImportTests(NPlusOneTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='exporter', password='password123')
+        self.client.force_authenticate(user=self.user)
+        self.project = Project.objects.create(user=self.user, name="Tesis", description="Capítulo 1")
+        self.task = Task.objects.create(project=self.project, title="Leer")
+        Subtask.objects.create(task=self.task, title="Parte 1", completed=True)
+        Subtask.objects.create(task=self.task, title="Parte 2")
+        Note.objects.create(user=self.user, title="Volcanes", content="Notas de campo")
+        self.started = timezone.now() - timedelta(days=3)
+        session = FocusSession.objects.create(user=self.user, project=self.project, tag='study', duration_minutes=25)
+        FocusSession.objects.filter(pk=session.pk).update(start_time=self.started)
+
+    def export(self, **params):
+        response = self.client.get('/api/export/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    @override_settings(EXPORT_CHUNK_SIZE=1)
+    def test_ndjson_export(self):
+        lines = [json.loads(line) for line in self.export().splitlines()]
+        self.assertEqual(lines[0]['type'], 'meta')
+        types = [line['type'] for line in lines[1:]]
+        self.assertEqual(types, ['project', 'task', 'subtask', 'subtask', 'note', 'focus_session'])
+        self.assertEqual(lines[2]['project_id'], self.project.id)
+        self.assertEqual(lines[1]['description'], "Capítulo 1")
+
+    @override_settings(EXPORT_CHUNK_SIZE=1)
+    async def test_asgi_export_streams_asynchronously(self):
+        token = await Token.objects.acreate(user=self.user)
+        response = await self.async_client.get('/api/export/', headers={'authorization': f'Token {token.key}'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        types = [json.loads(line)['type'] for line in content.splitlines()]
+        self.assertEqual(types, ['meta', 'project', 'task', 'subtask', 'subtask', 'note', 'focus_session'])
+
+    def test_csv_export_of_selected_types(self):
+        response = self.client.get('/api/export/', {'format': 'csv', 'types': 'task,subtask'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['type'] for row in rows], ['task', 'subtask', 'subtask'])
+        self.assertEqual(rows[1]['task_id'], str(self.task.id))
+        response = self.client.get('/api/export/', {'types': 'project,secrets'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_round_trip_into_another_account(self):
+        dump = self.export()
+        other = User.objects.create_user(username='importer', password='password123')
+        self.client.force_authenticate(user=other)
+        with override_settings(IMPORT_BATCH_SIZE=1):
+            response = self.client.post('/api/import/', dump, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['imported'], {
+            'project': 1, 'task': 1, 'subtask': 2, 'note': 1, 'focus_session': 1,
+        })
+        project = Project.objects.get(user=other)
+        self.assertNotEqual(project.pk, self.project.pk)
+        task = project.tasks.get()
+        self.assertEqual((task.subtask_total, task.subtask_completed, task.progress), (2, 1, 50.0))
+        self.assertEqual(project.progress, 50.0)
+        session = FocusSession.objects.get(user=other)
+        self.assertEqual((session.project_id, session.start_time), (project.pk, self.started))
+        self.assertEqual(FocusDailyRollup.objects.get(user=other).total_minutes, 25)
+        hits = self.client.get('/api/search/', {'q': 'volcanes'}).data['results']
+        self.assertEqual(len(hits), 1)
+
+    def test_bad_line_rolls_back(self):
+        dump = self.export().splitlines()
+        dump.insert(3, json.dumps({'type': 'subtask', 'task_id': 999999, 'title': 'Orphan'}))
+        response = self.client.post('/api/import/', '\n'.join(dump), content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Line 4: unknown task 999999', response.data['detail'])
+        self.assertEqual(Project.objects.count(), 1)
+
+
+class ConditionalGetTests(NPlusOneTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='etaguser', password='password123')
+        self.client.force_authenticate(user=self.user)
+        self.project = Project.objects.create(user=self.user, name="Cached")
+        self.task = Task.objects.create(project=self.project, title="Task")
+        self.subtask = Subtask.objects.create(task=self.task, title="Subtask")
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response['ETag']
+
+    def test_unchanged_list_is_not_modified(self):
+        etag = self.etag('/api/projects/')
+        # Validators only: the tree is neither loaded nor serialized.
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/projects/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertNotEqual(self.etag('/api/projects/?expand='), etag)
+
+    def test_nested_changes_and_deletions_change_the_etag(self):
+        url = f'/api/projects/{self.project.id}/'
+        etag = self.etag(url)
+        self.client.patch(f'/api/subtasks/{self.subtask.id}/', {'title': 'Renamed'})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        etag = self.etag(url)
+        Task.objects.create(project=self.project, title="Second")
+        etag = self.etag(url)
+        # A deletion doesn't move MAX(updated_at), but the count changes.
+        Subtask.objects.filter(pk=self.subtask.pk).delete()
+        self.assertNotEqual(self.etag(url), etag)
+        profile = self.user.profile
+        profile.display_name = 'Nuevo'
+        profile.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get('/api/projects/999999/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_if_modified_since(self):
+        note = Note.objects.create(user=self.user, title="Note")
+        response = self.client.get(f'/api/notes/{note.id}/')
+        response = self.client.get(f'/api/notes/{note.id}/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_lists_ignore_if_modified_since(self):
+        notes = [Note.objects.create(user=self.user, title=f"Note {i}") for i in range(2)]
+        response = self.client.get('/api/notes/')
+        self.assertNotIn('Last-Modified', response)
+        since = http_date(time.time() + 60)
+        notes[0].delete()
+        response = self.client.get('/api/notes/', HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['id'], notes[1].id)
+
+    def test_renaming_the_owner_changes_the_etag(self):
+        etag = self.etag('/api/projects/')
+        self.client.patch('/api/me/', {'username': 'renamed'})
+        response = self.client.get('/api/projects/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['user_name'], 'renamed')
+
+    def test_community_membership_and_shared_tasks(self):
+        community = Community.objects.create(name="Club", owner=self.user)
+        community.members.add(self.user)
+        shared = SharedProject.objects.create(community=community, name="Shared", created_by=self.user)
+        community_etag = self.etag(f'/api/communities/{community.id}/')
+        list_etag = self.etag('/api/communities/')
+        shared_etag = self.etag(f'/api/shared-projects/{shared.id}/')
+
+        other = User.objects.create_user(username='joiner', password='password123')
+        other.communities.add(community)
+        self.assertNotEqual(self.etag(f'/api/communities/{community.id}/'), community_etag)
+        self.assertNotEqual(self.etag('/api/communities/'), list_etag)
+
+        SharedTask.objects.create(project=shared, title="Todo", created_by=self.user)
+        self.assertNotEqual(self.etag(f'/api/shared-projects/{shared.id}/'), shared_etag)
+
+
+class ResponseCacheTests(NPlusOneTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='cacheuser', password='password123')
+        self.client.force_authenticate(user=self.user)
+        self.project = Project.objects.create(user=self.user, name="Cached")
+        self.task = Task.objects.create(project=self.project, title="Task")
+        self.subtask = Subtask.objects.create(task=self.task, title="Subtask")
+
+    def get(self, url, queries=None):
+        if queries is None:
+            response = self.client.get(url)
+        else:
+            with self.assertNumQueries(queries):
+                response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_hit_serves_the_same_data_without_loading_the_tree(self):
+        url = f'/api/projects/{self.project.id}/'
+        data = self.get(url)
+        # Only the ETag validators are read on a hit.
+        self.assertEqual(self.get(url, queries=1), data)
+        self.assertEqual(self.get('/api/projects/')['results'][0]['id'], self.project.id)
+        other = User.objects.create_user(username='other', password='password123')
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.get('/api/projects/')['results'], [])
+
+    def test_task_tree_writes_invalidate(self):
+        url = f'/api/projects/{self.project.id}/'
+        self.get(url)
+        self.client.patch(f'/api/subtasks/{self.subtask.id}/', {'completed': True})
+        self.assertTrue(self.get(url)['tasks'][0]['subtasks'][0]['completed'])
+        # Bulk paths skip post_save; the progress flush still invalidates.
+        operations = [{'op': 'create', 'task': self.task.id, 'title': 'Bulk'}]
+        self.client.post('/api/subtasks/bulk/', {'operations': operations}, format='json')
+        self.assertEqual(len(self.get(url)['tasks'][0]['subtasks']), 2)
+        self.client.delete(f'/api/tasks/{self.task.id}/')
+        self.assertEqual(self.get(url)['tasks'], [])
+        profile = self.user.profile
+        profile.display_name = 'Renamed'
+        profile.save()
+        self.assertEqual(self.get(url)['display_name'], 'Renamed')
+
+    def test_community_detail_follows_shared_items_and_members(self):
+        community = Community.objects.create(name="Club", owner=self.user)
+        community.members.add(self.user)
+        shared = SharedProject.objects.create(community=community, name="Shared", created_by=self.user)
+        url = f'/api/communities/{community.id}/'
+        self.get(url)
+        SharedTask.objects.create(project=shared, title="Todo", created_by=self.user)
+        self.assertEqual(len(self.get(url)['projects'][0]['shared_tasks']), 1)
+        other = User.objects.create_user(username='joiner', password='password123')
+        other.communities.add(community)
+        self.assertEqual(self.get(url)['member_count'], 2)
+        community.members.remove(self.user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_entries_are_keyed_by_etag(self):
+        url = f'/api/projects/{self.project.id}/'
+        self.get(url)
+        # A write whose invalidation only reached another process's cache.
+        Project.objects.filter(pk=self.project.pk).update(name="Elsewhere", updated_at=timezone.now())
+        self.assertEqual(self.get(url)['name'], "Elsewhere")
+
+    def test_focus_reports_need_a_shared_backend(self):
+        FocusSession.objects.create(user=self.user, tag='study', duration_minutes=25, is_completed=True)
+        response_cache.reset_stats()
+        self.get('/api/focus-sessions/reports/')
+        self.assertEqual(response_cache.stats()['misses'], 0)
+
+    @override_settings(CACHES={
+        **settings.CACHES,
+        'responses': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempfile.mkdtemp()},
+    })
+    def test_focus_reports_follow_sessions(self):
+        FocusSession.objects.create(user=self.user, tag='study', duration_minutes=25, is_completed=True)
+        self.get('/api/focus-sessions/reports/')
+        self.get('/api/focus-sessions/reports/', queries=0)
+        FocusSession.objects.create(user=self.user, tag='study', duration_minutes=5, is_completed=True)
+        data = self.get('/api/focus-sessions/reports/')
+        self.assertEqual(data['by_tag'][0]['total_minutes'], 30.0)
+
+    def test_hit_ratio(self):
+        response_cache.reset_stats()
+        for _ in range(4):
+            self.get('/api/projects/')
+        self.assertEqual(response_cache.stats(), {'hits': 3, 'misses': 1, 'hit_ratio': 0.75})
+        self.assertIn('response_cache_hit_ratio 0.75', metrics.render())
+
+    @override_settings(RESPONSE_CACHE_ENABLED=False)
+    def test_disabled(self):
+        response_cache.reset_stats()
+        self.get('/api/projects/')
+        self.get('/api/projects/')
+        self.assertEqual(response_cache.stats()['hits'], 0)
@@ -4,7 +4,7 @@ from .views import (
     ProjectViewSet, TaskViewSet, SubtaskViewSet, FocusSessionViewSet,
     MeView, ProfileUpdateView, ChangePasswordView, NoteViewSet,
     CommunityViewSet, SharedProjectViewSet, SharedTaskViewSet, SharedNoteViewSet,
-    NotificationViewSet
+    NotificationViewSet, SyncView, SearchView, ExportView, ImportView, notification_stream
 )
 
 router = DefaultRouter()
@@ -20,8 +20,14 @@ router.register(r'shared-notes', SharedNoteViewSet, basename='shared-note')
 router.register(r'notifications', NotificationViewSet, basename='notification')
 
 urlpatterns = [
+    # Before the router, which would read "stream" as a notification pk.
+    path('notifications/stream/', notification_stream, name='notification-stream'),
     path('', include(router.urls)),
     path('me/', MeView.as_view(), name='me'),
     path('profile/', ProfileUpdateView.as_view(), name='profile-update'),
     path('change-password/', ChangePasswordView.as_view(), name='change-password'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('export/', ExportView.as_view(), name='export'),
+    path('import/', ImportView.as_view(), name='import'),
 ]
@@ -1,20 +1,170 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import partial
+
+from asgiref.sync import sync_to_async
 from rest_framework import viewsets, permissions, status, generics
 from rest_framework.decorators import action
+from rest_framework.renderers import BaseRenderer
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
-from .models import Project, Task, Subtask, Profile, FocusSession, Note, Community, SharedProject, SharedTask, SharedNote, Notification
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Count, Max, Prefetch, Value
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from .authentication import CachedTokenAuthentication
+from .models import Project, Task, Subtask, Profile, FocusSession, FocusDailyRollup, Note, Community, SharedProject, SharedTask, SharedNote, Notification
 from .serializers import (
     ProjectSerializer, TaskSerializer, SubtaskSerializer,
-    CommunityProjectSerializer, RegisterSerializer, UserSerializer,
+    RegisterSerializer, UserSerializer,
     ProfileSerializer, ChangePasswordSerializer, FocusSessionSerializer,
     NoteSerializer, CommunitySerializer, SharedProjectSerializer,
     SharedTaskSerializer, SharedNoteSerializer, CommunityMemberSerializer,
-    NotificationSerializer
+    NotificationSerializer, CommunitySummarySerializer, is_field_requested,
+    BulkOperationSerializer, SubtaskBulkItemSerializer, TaskBulkItemSerializer
 )
+from .services import deletion, events, leaderboard, metrics, response_cache, search, sync, unread, workspace
+from .services.notifications import notify_community
+from .services.progress import progress_batch, mark_task_dirty, mark_project_dirty, mark_counters_dirty
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+class ProgressBatchMixin:
+    """
+    Runs every write inside a single progress batch, so a request that touches
+    many tasks/subtasks (e.g. a cascade delete) recomputes progress once.
+    """
+
+    def perform_create(self, serializer):
+        with progress_batch():
+            super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        with progress_batch():
+            super().perform_update(serializer)
+
+    def perform_destroy(self, instance):
+        with progress_batch():
+            super().perform_destroy(instance)
+
+class ConditionalGetMixin:
+    """
+    ETag on list and retrieve, derived from MAX(updated_at) and COUNT(*) of
+    the querysets get_validator_sources() returns (one UNION query) before
+    anything is serialized; a matching If-None-Match gets a bodyless 304.
+    MAX(updated_at) alone misses deletions, so Last-Modified (and with it
+    If-Modified-Since) is only used for a single row from a single source.
+    """
+
+    def get_validator_sources(self, queryset):
+        """
+        Querysets (of models with updated_at) the response is built from.
+        Profile stands in for its User: username changes bump it (see signals).
+        """
+        return [queryset]
+
+    def get_validators(self, queryset):
+        """(etag, last_modified, row count of `queryset`)."""
+        sources = [
+            source.prefetch_related(None).order_by().annotate(source=Value(index))
+            .values('source').annotate(last=Max('updated_at'), count=Count('pk')).values('source', 'last', 'count')
+            for index, source in enumerate(self.get_validator_sources(queryset))
+        ]
+        # Empty sources have no group, hence no row.
+        found = {row['source']: (row['last'], row['count']) for row in sources[0].union(*sources[1:], all=True)}
+        stamps = [self.request.get_full_path(), str(self.request.user.pk), self.request.accepted_renderer.format]
+        last_modified = None
+        for index in range(len(sources)):
+            last, count = found.get(index, (None, 0))
+            stamps.append(f'{last.isoformat() if last else ""}/{count}')
+            if last is not None and (last_modified is None or last > last_modified):
+                last_modified = last
+        etag = '"%s"' % hashlib.md5('|'.join(stamps).encode(), usedforsecurity=False).hexdigest()
+        if self.action != 'retrieve' or len(sources) > 1:
+            last_modified = None
+        return etag, last_modified, found.get(0, (None, 0))[1]
+
+    def _conditional(self, queryset, respond):
+        etag, last_modified, count = self.get_validators(queryset)
+        if self.action == 'retrieve' and not count:
+            return respond()  # 404 as usual
+        self.validator_etag = etag  # see ResponseCacheMixin
+        # Whole seconds, as HTTP dates have no fractions.
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(self.request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = respond()
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+            response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(self.filter_queryset(self.get_queryset()), partial(super().list, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = {self.lookup_field: self.kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        queryset = self.filter_queryset(self.get_queryset()).filter(**lookup)
+        return self._conditional(queryset, partial(super().retrieve, request, *args, **kwargs))
+
+class ResponseCacheMixin:
+    """
+    Serves `cached_actions` from the per-user response cache. Only the
+    response data of 200s is stored, so content negotiation and the ETag
+    check (which runs first) behave the same on hits and misses. Entries are
+    keyed by user, URL, the ETag and the generations of get_cache_scopes(),
+    which the signals bump on every write to the rows a response shows.
+
+    The ETag is read from the database, so an entry another process cached
+    before a write is never served after it, even from a per-process cache
+    the write's invalidation didn't reach. Actions without an ETag rely on
+    invalidation alone and are only cached on a shared backend.
+    """
+    cached_actions = ('list', 'retrieve')
+
+    def get_cache_scopes(self):
+        return [(response_cache.USER, self.request.user.pk)]
+
+    def get_cache_path(self):
+        return self.request.build_absolute_uri()
+
+    def cached_response(self, respond):
+        if not settings.RESPONSE_CACHE_ENABLED or self.action not in self.cached_actions:
+            return respond()
+        etag = getattr(self, 'validator_etag', None)
+        if etag is None and not response_cache.is_shared():
+            return respond()
+        path = f'{self.get_cache_path()} {etag or ""}'
+        key = response_cache.key_for(self.request.user.pk, path, self.get_cache_scopes())
+        data = response_cache.get(key, f'{self.basename}-{self.action}')
+        if data is not None:
+            return Response(data)
+        response = respond()
+        if response.status_code == status.HTTP_200_OK:
+            response_cache.store(key, response.data)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(partial(super().list, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(partial(super().retrieve, request, *args, **kwargs))
+
 class MeView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = UserSerializer
@@ -41,7 +191,7 @@ class ChangePasswordView(generics.UpdateAPIView):
         if not user.check_password(serializer.data.get("old_password")):
             return Response({"old_password": ["Wrong password."]}, status=status.HTTP_400_BAD_REQUEST)
         user.set_password(serializer.data.get("new_password"))
-        user.save()
+        user.save(update_fields=['password'])  # Also evicts the user's cached tokens (see signals)
         return Response({"status": "password set"}, status=status.HTTP_200_OK)
 
 class RegisterView(generics.CreateAPIView):
@@ -58,95 +208,328 @@ class RegisterView(generics.CreateAPIView):
             "token": token.key
         }, status=status.HTTP_201_CREATED)
 
-class ProjectViewSet(viewsets.ModelViewSet):
+class BulkMutationMixin:
+    """
+    Adds POST <list>/bulk/ taking {"operations": [...]} where each entry is
+    {"op": "create" | "update" | "toggle" | "delete", "id": ..., <fields>}.
+    The whole list is validated first, applied in one transaction with
+    bulk_create/bulk_update, and progress is recalculated once at the end.
+    """
+    bulk_item_serializer_class = None
+    bulk_parent_field = None
+    # Lookup from the parent model to the user who may write to it.
+    bulk_parent_owner = None
+    bulk_max_operations = 500
+
+    def get_bulk_parent_ids(self, parent_ids):
+        """Subset of `parent_ids` the current user may write to."""
+        parent_model = self.get_queryset().model._meta.get_field(self.bulk_parent_field).related_model
+        return set(parent_model.objects.filter(
+            pk__in=parent_ids, **{self.bulk_parent_owner: self.request.user}
+        ).values_list('pk', flat=True))
+
+    def bulk_written(self, objects, parent_ids):
+        """
+        Called after the bulk write, inside its transaction; override to
+        schedule derived data (counters, progress). Does nothing by default.
+        """
+
+    def bulk_delete(self, pks):
+        self.get_queryset().model.objects.filter(pk__in=pks).delete()
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        payload = request.data.get('operations') if isinstance(request.data, dict) else request.data
+        operations = BulkOperationSerializer(
+            data=payload, many=True, allow_empty=False, max_length=self.bulk_max_operations,
+        )
+        operations.is_valid(raise_exception=True)
+
+        parent = self.bulk_parent_field
+        parent_attr = f'{parent}_id'
+        queryset = self.get_queryset().prefetch_related(None)
+        model = queryset.model
+
+        with transaction.atomic(), progress_batch(recount_counters=True):
+            existing = queryset.select_for_update(of=('self',)).in_bulk(
+                [op['id'] for op in operations.validated_data if op['op'] != 'create']
+            )
+            items, errors = [], {}
+            for index, (operation, raw) in enumerate(zip(operations.validated_data, payload)):
+                op, pk = operation['op'], operation.get('id')
+                if op != 'create' and pk not in existing:
+                    errors[index] = {'id': ['Not found.']}
+                    continue
+                data = {}
+                if op in ('create', 'update'):
+                    item = self.bulk_item_serializer_class(data=raw, partial=op == 'update')
+                    if not item.is_valid():
+                        errors[index] = item.errors
+                        continue
+                    data = dict(item.validated_data)
+                items.append((index, op, pk, data))
+
+            allowed = self.get_bulk_parent_ids({data[parent] for _, _, _, data in items if parent in data})
+            for index, _, _, data in items:
+                if parent in data and data[parent] not in allowed:
+                    errors[index] = {parent: ['Invalid pk - object does not exist.']}
+            if errors:
+                raise ValidationError({'operations': errors})
+
+            now = timezone.now()
+            created, updated, deleted = [], {}, set()
+            parent_ids = set()
+            for _, op, pk, data in items:
+                if parent in data:
+                    data[parent_attr] = data.pop(parent)
+                if op == 'create':
+                    created.append(model(**data))
+                    continue
+                obj = existing[pk]
+                parent_ids.add(getattr(obj, parent_attr))
+                if op == 'delete':
+                    deleted.add(pk)
+                    continue
+                if op == 'toggle':
+                    obj.completed = not obj.completed
+                for field, value in data.items():
+                    setattr(obj, field, value)
+                obj.updated_at = now
+                updated[pk] = obj
+            for pk in deleted:
+                updated.pop(pk, None)
+
+            if deleted:
+                self.bulk_delete(deleted)
+            if updated:
+                model.objects.bulk_update(updated.values(), ['title', 'completed', parent_attr, 'updated_at'])
+            if created:
+                model.objects.bulk_create(created)
+            written = created + list(updated.values())
+            parent_ids.update(getattr(obj, parent_attr) for obj in written)
+            self.bulk_written(written, parent_ids)
+
+        # Serialized after the batch so progress reflects the new state.
+        results = self.get_queryset().in_bulk([obj.pk for obj in written])
+        return Response({
+            'created': self.get_serializer([results[obj.pk] for obj in created], many=True).data,
+            'updated': self.get_serializer([results[pk] for pk in updated], many=True).data,
+            'deleted': sorted(deleted),
+        })
+
+def task_tree_queryset(with_subtasks=True):
+    """Tasks ordered by creation with their subtasks prefetched in order."""
+    queryset = Task.objects.order_by('created_at', 'id')
+    if with_subtasks:
+        queryset = queryset.prefetch_related(
+            Prefetch('subtasks', queryset=Subtask.objects.order_by('created_at', 'id'))
+        )
+    return queryset
+
+def shared_project_tree_queryset():
+    """Shared projects with progress annotated and their tasks/notes prefetched."""
+    return SharedProject.objects.with_progress().select_related('created_by').prefetch_related(
+        Prefetch('shared_tasks', queryset=SharedTask.objects.select_related('created_by').order_by('created_at', 'id')),
+        Prefetch('shared_notes', queryset=SharedNote.objects.select_related('created_by').order_by('-updated_at', '-id')),
+    )
+
+class ProjectViewSet(ConditionalGetMixin, ResponseCacheMixin, ProgressBatchMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = ProjectSerializer
+    ordering = ('-updated_at', '-id')
 
     def get_queryset(self):
-        # Default queryset is personal projects
-        return Project.objects.filter(user=self.request.user).order_by('-updated_at')
+        # Default queryset is personal projects, with the whole task tree
+        # prefetched so serialization costs a fixed number of queries.
+        queryset = Project.objects.filter(user=self.request.user).select_related('user__profile')
+        if self.action != 'destroy' and is_field_requested(self.request, 'tasks', expandable=True):
+            queryset = queryset.prefetch_related(Prefetch('tasks', queryset=task_tree_queryset()))
+        return queryset.order_by(*self.ordering)
+
+    def get_validator_sources(self, queryset):
+        # The owner's profile: user_name and display_name.
+        sources = [queryset, Profile.objects.filter(user=self.request.user)]
+        if is_field_requested(self.request, 'tasks', expandable=True):
+            sources += [Task.objects.filter(project__in=queryset), Subtask.objects.filter(task__project__in=queryset)]
+        return sources
+
+    def perform_destroy(self, instance):
+        with progress_batch():
+            deletion.delete_project(instance)
 
     @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
     def community(self, request):
         """
-        Public view of all projects with their progress.
+        Public leaderboard of projects by progress, served from the cache
+        in fixed-size pages (?page=1..LEADERBOARD_MAX_PAGES).
         """
-        projects = Project.objects.filter(status__in=['IN_PROGRESS', 'COMPLETED']).order_by('-progress')
-        serializer = CommunityProjectSerializer(projects, many=True)
-        return Response(serializer.data)
-
-class TaskViewSet(viewsets.ModelViewSet):
+        try:
+            page = int(request.query_params.get('page', 1))
+        except ValueError:
+            page = 0
+        if not 1 <= page <= settings.LEADERBOARD_MAX_PAGES:
+            return Response({'detail': 'Invalid page.'}, status=status.HTTP_404_NOT_FOUND)
+
+        entry = leaderboard.get_page(page)
+        last_modified = entry['last_modified'].timestamp()
+        not_modified = get_conditional_response(request, etag=entry['etag'], last_modified=last_modified)
+        if not_modified is None:
+            base_url = request.build_absolute_uri(request.path)
+            response = Response({
+                'next': f'{base_url}?page={page + 1}' if entry['has_next'] else None,
+                'previous': f'{base_url}?page={page - 1}' if page > 1 else None,
+                'results': entry['results'],
+            })
+        else:
+            response = not_modified
+        response['ETag'] = entry['etag']
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'public, max-age=60'
+        return response
+
+class TaskViewSet(ProgressBatchMixin, BulkMutationMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = TaskSerializer
+    ordering = ('created_at', 'id')
+    bulk_item_serializer_class = TaskBulkItemSerializer
+    bulk_parent_field = 'project'
+    bulk_parent_owner = 'user'
+
+    def bulk_written(self, objects, parent_ids):
+        for task in objects:
+            mark_task_dirty(task.pk)
+        for project_id in parent_ids:
+            mark_project_dirty(project_id)
+
+    def bulk_delete(self, pks):
+        deletion.delete_tasks(pks)
+
+    def perform_destroy(self, instance):
+        with progress_batch():
+            deletion.delete_tasks([instance.pk])
 
     def get_queryset(self):
         # Only show tasks from user's projects
-        queryset = Task.objects.filter(project__user=self.request.user).order_by('created_at')
+        queryset = task_tree_queryset(
+            with_subtasks=self.action != 'destroy' and is_field_requested(self.request, 'subtasks', expandable=True)
+        ).filter(project__user=self.request.user)
         project_id = self.request.query_params.get('project')
         if project_id:
             queryset = queryset.filter(project_id=project_id)
         return queryset
 
-class SubtaskViewSet(viewsets.ModelViewSet):
+class SubtaskViewSet(ProgressBatchMixin, BulkMutationMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = SubtaskSerializer
+    ordering = ('created_at', 'id')
+    bulk_item_serializer_class = SubtaskBulkItemSerializer
+    bulk_parent_field = 'task'
+    bulk_parent_owner = 'project__user'
+
+    def bulk_written(self, objects, parent_ids):
+        mark_counters_dirty(parent_ids)
 
     def get_queryset(self):
-        return Subtask.objects.filter(task__project__user=self.request.user).order_by('created_at')
+        return Subtask.objects.filter(task__project__user=self.request.user).order_by(*self.ordering)
 
-class FocusSessionViewSet(viewsets.ModelViewSet):
+class FocusSessionViewSet(ResponseCacheMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = FocusSessionSerializer
+    ordering = ('-start_time', '-id')
+    cached_actions = ('reports',)
 
     def get_queryset(self):
-        return FocusSession.objects.filter(user=self.request.user).order_by('-start_time')
+        return FocusSession.objects.filter(user=self.request.user).order_by(*self.ordering)
+
+    def get_cache_path(self):
+        # The daily stats window moves with the date.
+        return f'{super().get_cache_path()}#{timezone.now().date()}'
 
     @action(detail=False, methods=['get'])
     def reports(self, request):
         """
-        Get productivity reports aggregated by tag/project and daily stats.
+        Get productivity reports aggregated by tag/project and daily stats,
+        read from the pre-summed FocusDailyRollup rows.
         """
-        sessions = self.get_queryset()
         from django.db.models import Sum
-        from django.db.models.functions import TruncDate
         from django.utils import timezone
         from datetime import timedelta
 
+        rollups = FocusDailyRollup.objects.filter(user=request.user)
+
         # Aggregations by Tag and Project
-        tag_data = sessions.values('tag').annotate(total_minutes=Sum('duration_minutes'))
-        project_data = sessions.filter(project__isnull=False).values('project__name').annotate(total_minutes=Sum('duration_minutes'))
-        
+        tag_data = rollups.values('tag').annotate(total_minutes=Sum('total_minutes')).order_by('tag')
+        project_data = rollups.filter(project__isnull=False).values('project__name') \
+            .annotate(total_minutes=Sum('total_minutes')).order_by('project__name')
+
         # Daily stats for the last 365 days (for heatmap and histogram)
         today = timezone.now().date()
         one_year_ago = today - timedelta(days=365)
-        
-        daily_stats = sessions.filter(start_time__date__gte=one_year_ago) \
-            .annotate(date=TruncDate('start_time')) \
+
+        daily_stats = rollups.filter(date__gte=one_year_ago) \
             .values('date') \
-            .annotate(total_minutes=Sum('duration_minutes')) \
+            .annotate(total_minutes=Sum('total_minutes')) \
             .order_by('date')
 
-        return Response({
-            "by_tag": tag_data,
-            "by_project": project_data,
-            "daily_stats": daily_stats
-        })
+        return self.cached_response(lambda: Response({
+            "by_tag": list(tag_data),
+            "by_project": list(project_data),
+            "daily_stats": list(daily_stats)
+        }))
 
-class NoteViewSet(viewsets.ModelViewSet):
+class NoteViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = NoteSerializer
+    ordering = ('-updated_at', '-id')
 
     def get_queryset(self):
-        return Note.objects.filter(user=self.request.user).order_by('-updated_at')
+        return Note.objects.filter(user=self.request.user).order_by(*self.ordering)
 
 
-class CommunityViewSet(viewsets.ModelViewSet):
+class CommunityViewSet(ConditionalGetMixin, ResponseCacheMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = CommunitySerializer
+    ordering = ('-created_at', '-id')
+    cached_actions = ('retrieve',)
 
     def get_queryset(self):
         """Returns communities the user owns OR is a member of."""
-        return Community.objects.filter(members=self.request.user).order_by('-created_at')
+        queryset = Community.objects.filter(members=self.request.user).with_counts().select_related('owner')
+        if self.action != 'list':
+            # Full tree, prefetched in a fixed number of queries.
+            if is_field_requested(self.request, 'members', expandable=True):
+                queryset = queryset.prefetch_related(Prefetch(
+                    'members', queryset=User.objects.select_related('profile').order_by('id')
+                ))
+            if is_field_requested(self.request, 'projects', expandable=True):
+                queryset = queryset.prefetch_related(Prefetch(
+                    'projects', queryset=shared_project_tree_queryset().order_by('-updated_at', '-id')
+                ))
+        return queryset.order_by(*self.ordering)
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return CommunitySummarySerializer
+        return CommunitySerializer
+
+    def get_cache_scopes(self):
+        # Shared with every member; the key still includes the user.
+        return [(response_cache.COMMUNITY, self.kwargs[self.lookup_field])]
+
+    def get_validator_sources(self, queryset):
+        # Member changes bump Community.updated_at (see signals).
+        projects = SharedProject.objects.filter(community__in=queryset)
+        if self.action == 'list':
+            return [queryset, projects, Profile.objects.filter(user__owned_communities__in=queryset)]
+        # Member names also show up as owner_name and created_by_name.
+        sources = [queryset, Profile.objects.filter(user__communities__in=queryset)]
+        if is_field_requested(self.request, 'projects', expandable=True):
+            sources += [
+                projects,
+                SharedTask.objects.filter(project__community__in=queryset),
+                SharedNote.objects.filter(project__community__in=queryset),
+            ]
+        return sources
 
     @action(detail=True, methods=['post'])
     def add_member(self, request, pk=None):
@@ -173,13 +556,17 @@ class CommunityViewSet(viewsets.ModelViewSet):
         if existing:
             return Response({'detail': 'Invitation already sent.'}, status=status.HTTP_400_BAD_REQUEST)
         # Create the invitation notification
-        Notification.objects.create(
-            recipient=user,
-            actor=request.user,
-            notification_type='community_invite',
-            message=f'{request.user.username} te ha invitado a la comunidad "{community.name}"',
-            community=community,
-        )
+        try:
+            Notification.objects.create(
+                recipient=user,
+                actor=request.user,
+                notification_type='community_invite',
+                message=f'{request.user.username} te ha invitado a la comunidad "{community.name}"',
+                community=community,
+            )
+        except IntegrityError:
+            # A concurrent request won the notification_unique_pending_invite race.
+            return Response({'detail': 'Invitation already sent.'}, status=status.HTTP_400_BAD_REQUEST)
         return Response({'detail': f'Invitación enviada a {username}.'}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'])
@@ -195,18 +582,31 @@ class CommunityViewSet(viewsets.ModelViewSet):
         if user == community.owner:
             return Response({'detail': 'Cannot remove the owner.'}, status=status.HTTP_400_BAD_REQUEST)
         community.members.remove(user)
+        community = self.get_queryset().get(pk=community.pk)
         return Response(CommunitySerializer(community, context={'request': request}).data)
 
 
-class SharedProjectViewSet(viewsets.ModelViewSet):
+class SharedProjectViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = SharedProjectSerializer
+    ordering = ('-updated_at', '-id')
 
     def get_queryset(self):
         """Only projects from communities the user belongs to."""
-        return SharedProject.objects.filter(
+        return shared_project_tree_queryset().filter(
             community__members=self.request.user
-        ).order_by('-updated_at')
+        ).order_by(*self.ordering)
+
+    def get_validator_sources(self, queryset):
+        # Progress comes from the shared tasks, so they always count.
+        sources = [
+            queryset, SharedTask.objects.filter(project__in=queryset),
+            # created_by_name of the project, its tasks and notes.
+            Profile.objects.filter(user__communities__projects__in=queryset),
+        ]
+        if is_field_requested(self.request, 'shared_notes', expandable=True):
+            sources.append(SharedNote.objects.filter(project__in=queryset))
+        return sources
 
     def get_serializer_context(self):
         return {**super().get_serializer_context(), 'request': self.request}
@@ -216,24 +616,23 @@ class SharedProjectViewSet(viewsets.ModelViewSet):
         project = serializer.save(created_by=self.request.user)
         community = project.community
         # Notify all members except the creator
-        for member in community.members.exclude(id=self.request.user.id):
-            Notification.objects.create(
-                recipient=member,
-                actor=self.request.user,
-                notification_type='new_project',
-                message=f'{self.request.user.username} creó el proyecto "{project.name}" en {community.name}',
-                community=community,
-            )
+        notify_community(
+            community,
+            actor=self.request.user,
+            notification_type='new_project',
+            message=f'{self.request.user.username} creó el proyecto "{project.name}" en {community.name}',
+        )
 
 
 class SharedTaskViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = SharedTaskSerializer
+    ordering = ('created_at', 'id')
 
     def get_queryset(self):
         queryset = SharedTask.objects.filter(
             project__community__members=self.request.user
-        ).order_by('created_at')
+        ).select_related('created_by').order_by(*self.ordering)
         project_id = self.request.query_params.get('project')
         if project_id:
             queryset = queryset.filter(project_id=project_id)
@@ -243,11 +642,12 @@ class SharedTaskViewSet(viewsets.ModelViewSet):
 class SharedNoteViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = SharedNoteSerializer
+    ordering = ('-updated_at', '-id')
 
     def get_queryset(self):
         queryset = SharedNote.objects.filter(
             project__community__members=self.request.user
-        ).order_by('-updated_at')
+        ).select_related('created_by').order_by(*self.ordering)
         project_id = self.request.query_params.get('project')
         if project_id:
             queryset = queryset.filter(project_id=project_id)
@@ -257,32 +657,47 @@ class SharedNoteViewSet(viewsets.ModelViewSet):
         """Create note and notify all community members."""
         note = serializer.save(created_by=self.request.user)
         community = note.project.community
-        for member in community.members.exclude(id=self.request.user.id):
-            Notification.objects.create(
-                recipient=member,
-                actor=self.request.user,
-                notification_type='new_note',
-                message=f'{self.request.user.username} creó la nota "{note.title}" en {community.name}',
-                community=community,
-            )
+        notify_community(
+            community,
+            actor=self.request.user,
+            notification_type='new_note',
+            message=f'{self.request.user.username} creó la nota "{note.title}" en {community.name}',
+        )
 
 
 class NotificationViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = NotificationSerializer
+    ordering = ('-created_at', '-id')
     http_method_names = ['get', 'post', 'delete']
 
     def get_queryset(self):
-        return Notification.objects.filter(recipient=self.request.user)
+        return Notification.objects.filter(
+            recipient=self.request.user
+        ).select_related('actor', 'community').order_by(*self.ordering)
+
+    def _save_status(self, notification, new_status):
+        """
+        Partial save of the new status. Raises DoesNotExist if the row was
+        deleted since get_object() loaded it, which the partial UPDATE reports
+        as a DatabaseError instead.
+        """
+        notification.status = new_status
+        try:
+            with transaction.atomic():
+                notification.save()
+        except DatabaseError as exc:
+            if 'did not affect any rows' not in str(exc):
+                raise
+            raise Notification.DoesNotExist from exc
+
+    def _gone(self):
+        return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
 
     @action(detail=False, methods=['get'])
     def unread_count(self, request):
         """How many unread/pending notifications."""
-        count = Notification.objects.filter(
-            recipient=request.user,
-            status__in=['pending']
-        ).count()
-        return Response({'count': count})
+        return Response({'count': unread.get_count(request.user.id)})
 
     @action(detail=True, methods=['post'])
     def accept(self, request, pk=None):
@@ -292,12 +707,15 @@ class NotificationViewSet(viewsets.ModelViewSet):
             return Response({'detail': 'Only invitations can be accepted.'}, status=status.HTTP_400_BAD_REQUEST)
         if notification.status != 'pending':
             return Response({'detail': 'Already processed.'}, status=status.HTTP_400_BAD_REQUEST)
-        # Add user to community
-        community = notification.community
-        if community:
-            community.members.add(request.user)
-        notification.status = 'accepted'
-        notification.save()
+        try:
+            with transaction.atomic():
+                # Add user to community
+                community = notification.community
+                if community:
+                    community.members.add(request.user)
+                self._save_status(notification, 'accepted')
+        except Notification.DoesNotExist:
+            return self._gone()
         return Response(NotificationSerializer(notification).data)
 
     @action(detail=True, methods=['post'])
@@ -308,8 +726,10 @@ class NotificationViewSet(viewsets.ModelViewSet):
             return Response({'detail': 'Only invitations can be rejected.'}, status=status.HTTP_400_BAD_REQUEST)
         if notification.status != 'pending':
             return Response({'detail': 'Already processed.'}, status=status.HTTP_400_BAD_REQUEST)
-        notification.status = 'rejected'
-        notification.save()
+        try:
+            self._save_status(notification, 'rejected')
+        except Notification.DoesNotExist:
+            return self._gone()
         return Response(NotificationSerializer(notification).data)
 
     @action(detail=True, methods=['post'])
@@ -317,15 +737,259 @@ class NotificationViewSet(viewsets.ModelViewSet):
         """Mark an informational notification as read."""
         notification = self.get_object()
         if notification.status == 'pending' and notification.notification_type != 'community_invite':
-            notification.status = 'read'
-            notification.save()
+            try:
+                self._save_status(notification, 'read')
+            except Notification.DoesNotExist:
+                return self._gone()
         return Response(NotificationSerializer(notification).data)
 
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
         """Mark all non-invite pending notifications as read."""
-        Notification.objects.filter(
-            recipient=request.user,
-            status='pending',
-        ).exclude(notification_type='community_invite').update(status='read')
+        with transaction.atomic():
+            marked = Notification.objects.filter(
+                recipient=request.user,
+                status='pending',
+            ).exclude(notification_type='community_invite').update(status='read', updated_at=timezone.now())
+            unread.adjust([request.user.id], -marked)
+        events.notifications_changed([request.user.id])
         return Response({'detail': 'OK'})
+
+
+class SyncView(generics.GenericAPIView):
+    """
+    Delta sync: GET /api/sync/?since=<watermark> returns the user's rows that
+    changed after `since` (flat, without nested children) plus the ids of
+    deleted rows. Omit `since` for a full snapshot. Store the returned
+    `watermark` and send it back on the next call. It lags the clock by
+    SYNC_WATERMARK_LAG_SECONDS, so consecutive responses overlap and clients
+    must apply rows and deletions idempotently, by id. If `reset` is true the
+    watermark is older than the tombstone retention window and the client
+    must resync from scratch.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        since = None
+        if 'since' in request.query_params:
+            since = parse_datetime(request.query_params['since'])
+            if since is None:
+                return Response({'since': ['Invalid datetime.']}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        # A row's updated_at is stamped before its transaction commits; the
+        # lag keeps rows that commit after this read above the watermark.
+        watermark = timezone.now() - timedelta(seconds=settings.SYNC_WATERMARK_LAG_SECONDS)
+        if since is not None and since < sync.retention_cutoff():
+            return Response({'watermark': watermark, 'reset': True})
+
+        user = request.user
+        changed = {
+            'projects': (Project.objects.filter(user=user).select_related('user__profile'), ProjectSerializer),
+            'tasks': (Task.objects.filter(project__user=user), TaskSerializer),
+            'subtasks': (Subtask.objects.filter(task__project__user=user), SubtaskSerializer),
+            'notes': (Note.objects.filter(user=user), NoteSerializer),
+            'focus_sessions': (FocusSession.objects.filter(user=user), FocusSessionSerializer),
+            'notifications': (
+                Notification.objects.filter(recipient=user).select_related('actor', 'community'),
+                NotificationSerializer,
+            ),
+        }
+        context = {'request': request, 'expand': ()}
+        data = {'watermark': watermark, 'reset': False}
+        for key, (queryset, serializer_class) in changed.items():
+            if since is not None:
+                queryset = queryset.filter(updated_at__gt=since)
+            data[key] = serializer_class(queryset.order_by('updated_at', 'id'), many=True, context=context).data
+        data['deleted'] = sync.deleted_since(user, since) if since is not None else {}
+        return Response(data)
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Exports are streamed by the view; only error payloads get here.
+        return json.dumps(data, cls=DjangoJSONEncoder).encode() + b'\n'
+
+class CSVRenderer(NDJSONRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+async def _aiter_sync(iterable):
+    """
+    Async iterator over a sync one, advanced in the thread sync views run in
+    (where its cursor was opened). ASGI would otherwise read a sync streaming
+    body whole into memory before sending it.
+    """
+    iterator = iter(iterable)
+    done = object()
+    try:
+        while (chunk := await sync_to_async(next)(iterator, done)) is not done:
+            yield chunk
+    finally:
+        if hasattr(iterator, 'close'):
+            await sync_to_async(iterator.close)()
+
+
+class ExportView(generics.GenericAPIView):
+    """
+    Streams the user's whole workspace: GET /api/export/?format=ndjson|csv
+    (or by Accept header), optionally limited with ?types=project,task,...
+    NDJSON is the lossless format POST /api/import/ reads back. Under ASGI
+    the rows are streamed through an async iterator.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+
+    def get(self, request):
+        types = request.query_params.get('types')
+        kinds = list(workspace.KINDS)
+        if types:
+            requested = [kind.strip() for kind in types.split(',') if kind.strip()]
+            unknown = sorted(set(requested) - set(kinds))
+            if unknown:
+                return Response({'types': [f"Unknown type(s): {', '.join(unknown)}."]},
+                                status=status.HTTP_400_BAD_REQUEST)
+            kinds = [kind for kind in kinds if kind in requested]
+
+        renderer = request.accepted_renderer
+        export = workspace.export_csv if renderer.format == 'csv' else workspace.export_ndjson
+        content = export(request.user, kinds, settings.EXPORT_CHUNK_SIZE)
+        if isinstance(request._request, ASGIRequest):
+            content = _aiter_sync(content)
+        response = StreamingHttpResponse(
+            content,
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
+        )
+        filename = f'workspace-{timezone.localdate().isoformat()}.{renderer.format}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class ImportView(generics.GenericAPIView):
+    """
+    POST /api/import/ with an NDJSON export as the body. Rows are added as
+    new objects (ids are remapped) in one transaction, read line by line
+    and written in batches; derived data is recomputed afterwards.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        try:
+            counts = workspace.import_ndjson(request.user, request.stream or (), settings.IMPORT_BATCH_SIZE)
+        except DjangoValidationError as exc:
+            return Response({'detail': exc.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'imported': counts}, status=status.HTTP_201_CREATED)
+
+
+class SearchView(generics.GenericAPIView):
+    """
+    Full-text search over the user's notes and their communities' shared
+    notes: GET /api/search/?q=<words>&page=<n>. Results are ranked, with
+    matches wrapped in <mark> in `title` and `snippet`.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    max_page_size = 100
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'q': ['This parameter is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = int(request.query_params.get('page', 1))
+            page_size = int(request.query_params.get('page_size', settings.SEARCH_PAGE_SIZE))
+        except ValueError:
+            page = page_size = 0
+        if page < 1 or not 1 <= page_size <= self.max_page_size:
+            return Response({'detail': 'Invalid page.'}, status=status.HTTP_404_NOT_FOUND)
+
+        # One extra row tells whether there is a next page without a COUNT.
+        results = search.search(request.user, query, limit=page_size + 1, offset=(page - 1) * page_size)
+        url = request.build_absolute_uri()
+        previous = None
+        if page > 1:
+            previous = replace_query_param(url, 'page', page - 1) if page > 2 else remove_query_param(url, 'page')
+        return Response({
+            'next': replace_query_param(url, 'page', page + 1) if len(results) > page_size else None,
+            'previous': previous,
+            'results': results[:page_size],
+        })
+
+
+def metrics_view(request):
+    """
+    Request metrics in the Prometheus text format. Readable by staff users
+    (session or token) or with `Authorization: Bearer <METRICS_TOKEN>`.
+    """
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    allowed = bool(settings.METRICS_TOKEN) and constant_time_compare(header, f'Bearer {settings.METRICS_TOKEN}')
+    if not allowed:
+        user = request.user
+        if not user.is_authenticated:
+            try:
+                result = CachedTokenAuthentication().authenticate(request)
+            except AuthenticationFailed:
+                result = None
+            user = result[0] if result else user
+        allowed = user.is_staff
+    if not allowed:
+        return JsonResponse({'detail': 'Staff only.'}, status=403)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+async def _stream_user(request):
+    # EventSource can't set headers, so the token may come as ?token=.
+    authentication = CachedTokenAuthentication()
+    try:
+        if 'token' in request.GET:
+            result = await sync_to_async(authentication.authenticate_credentials)(request.GET['token'])
+        else:
+            result = await sync_to_async(authentication.authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+@require_GET
+async def notification_stream(request):
+    """
+    Server-sent events: pushes `notification` and `unread_count` events to
+    the authenticated user instead of having clients poll unread_count.
+    Under WSGI (e.g. runserver) streams can't be held open, so the current
+    count is sent once and EventSource reconnects after the `retry` delay.
+    """
+    user = await _stream_user(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    retry = f'retry: {settings.NOTIFICATION_STREAM_RETRY_MS}\n\n'
+    if not isinstance(request, ASGIRequest):
+        counts = await sync_to_async(unread.counts)([user.id])
+        return HttpResponse(retry + _sse('unread_count', {'count': counts[user.id]}), content_type='text/event-stream')
+
+    async def stream():
+        # Subscribe before reading the count so no change slips in between.
+        subscription = events.get_broker().subscribe(user.id)
+        try:
+            counts = await sync_to_async(unread.counts)([user.id])
+            yield retry + _sse('unread_count', {'count': counts[user.id]})
+            while True:
+                event = await subscription.get(settings.NOTIFICATION_STREAM_HEARTBEAT)
+                if event is None:
+                    yield ': keepalive\n\n'
+                else:
+                    yield _sse(event['event'], event['data'])
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -95,15 +95,19 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.CursorPagination',
+    'PAGE_SIZE': int(os.environ.get("API_PAGE_SIZE", "50")),
 }
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.NPlusOneMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -147,6 +151,94 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at e.g.
+# django.core.cache.backends.filebased.FileBasedCache to share between workers.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "volcan"),
+    },
+    # Serialized API responses (api.services.response_cache). LocMemCache
+    # culls least recently used entries beyond MAX_ENTRIES; being per
+    # process, it only holds ETag-validated responses.
+    "responses": {
+        "BACKEND": os.environ.get("RESPONSE_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("RESPONSE_CACHE_LOCATION", "volcan-responses"),
+        "OPTIONS": {"MAX_ENTRIES": int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "5000"))},
+    },
+}
+
+# Public community leaderboard (ProjectViewSet.community)
+LEADERBOARD_PAGE_SIZE = int(os.environ.get("LEADERBOARD_PAGE_SIZE", "50"))
+LEADERBOARD_MAX_PAGES = int(os.environ.get("LEADERBOARD_MAX_PAGES", "20"))
+LEADERBOARD_CACHE_TIMEOUT = int(os.environ.get("LEADERBOARD_CACHE_TIMEOUT", "300"))
+
+# Per-user response cache for the project tree, community detail and focus
+# reports; entries are invalidated by the model signals.
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "true").lower() in ("true", "1", "yes", "on")
+RESPONSE_CACHE_ALIAS = "responses"
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get("RESPONSE_CACHE_TIMEOUT", "300"))
+
+
+# Notification fan-out (api.services.notifications)
+NOTIFICATION_BATCH_SIZE = int(os.environ.get("NOTIFICATION_BATCH_SIZE", "500"))
+# Fan-outs with at least this many recipients go to a background worker (0 disables).
+NOTIFICATION_ASYNC_THRESHOLD = int(os.environ.get("NOTIFICATION_ASYNC_THRESHOLD", "1000"))
+NOTIFICATION_WORKERS = int(os.environ.get("NOTIFICATION_WORKERS", "2"))
+
+# Push stream (/api/notifications/stream/). The broker is a dotted path to a
+# class with the api.services.events.LocalBroker interface.
+NOTIFICATION_BROKER = os.environ.get("NOTIFICATION_BROKER", "api.services.events.LocalBroker")
+NOTIFICATION_STREAM_HEARTBEAT = int(os.environ.get("NOTIFICATION_STREAM_HEARTBEAT", "25"))
+NOTIFICATION_STREAM_QUEUE_SIZE = int(os.environ.get("NOTIFICATION_STREAM_QUEUE_SIZE", "100"))
+# Reconnect delay (ms) sent to clients, and used as the poll interval when
+# the app is served over WSGI and cannot hold streams open.
+NOTIFICATION_STREAM_RETRY_MS = int(os.environ.get("NOTIFICATION_STREAM_RETRY_MS", "30000"))
+
+
+# Token -> user lookups cached per process (api.authentication)
+TOKEN_CACHE_MAXSIZE = int(os.environ.get("TOKEN_CACHE_MAXSIZE", "10000"))
+TOKEN_CACHE_TTL = int(os.environ.get("TOKEN_CACHE_TTL", "60"))
+
+
+# Delta sync (/api/sync/): deletions older than this force a full resync.
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.environ.get("SYNC_TOMBSTONE_RETENTION_DAYS", "30"))
+# The returned watermark lags the clock by this much, so rows stamped before
+# it but committed after the read are picked up by the next call (clients
+# de-duplicate the overlap by id). Keep it above the longest write transaction.
+SYNC_WATERMARK_LAG_SECONDS = int(os.environ.get("SYNC_WATERMARK_LAG_SECONDS", "60"))
+
+
+# Full-text search (/api/search/): text search configuration used for the
+# Postgres tsvector index; SQLite uses FTS5's unicode61 tokenizer.
+SEARCH_TEXT_CONFIG = os.environ.get("SEARCH_TEXT_CONFIG", "simple")
+SEARCH_PAGE_SIZE = int(os.environ.get("SEARCH_PAGE_SIZE", "20"))
+
+
+# Workspace export/import (/api/export/, /api/import/): rows fetched per
+# database round trip while streaming, and rows per bulk_create on import.
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", "2000"))
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "1000"))
+
+
+# Request metrics (api.middleware.MetricsMiddleware, served at /metrics)
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "True").lower() in ("true", "1", "yes", "on")
+# Bearer token for scrapers; staff users can always read /metrics.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+METRICS_SLOW_REQUEST_MS = int(os.environ.get("METRICS_SLOW_REQUEST_MS", "1000"))
+# How many of a slow request's slowest queries are logged.
+METRICS_SLOW_SQL_LIMIT = int(os.environ.get("METRICS_SLOW_SQL_LIMIT", "10"))
+
+
+# N+1 query detection (api.middleware.NPlusOneMiddleware): "log", "raise" or "off".
+NPLUSONE_DETECTION = os.environ.get("NPLUSONE_DETECTION", "log" if DEBUG else "off")
+# Same-shape SELECTs per request that count as an N+1 pattern.
+NPLUSONE_THRESHOLD = int(os.environ.get("NPLUSONE_THRESHOLD", "3"))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
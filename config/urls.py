@@ -18,7 +18,7 @@ from django.contrib import admin
 from django.urls import path
 from django.urls import include
 from rest_framework.authtoken.views import obtain_auth_token
-from api.views import RegisterView
+from api.views import RegisterView, metrics_view
 from django.http import HttpResponse
 
 def health_check(request):
@@ -27,6 +27,7 @@ def health_check(request):
 urlpatterns = [
     path('', health_check, name='health_check'),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/', include('api.urls')),
     path('api/login/', obtain_auth_token, name='api_token_auth'),
     path('api/register/', RegisterView.as_view(), name='register'),